@@ -7,18 +7,38 @@ __version__ = "0.10.1"
 from ddlpy.ddlpy import locations
 from ddlpy.ddlpy import (
     measurements,
+    iter_measurements,
     measurements_latest,
     measurements_available,
     measurements_amount,
 )
 from ddlpy.utils import simplify_dataframe, dataframe_to_xarray
+from ddlpy.client import Client, RetryPolicy, RateLimiter, Coalescer
+from ddlpy.cache import ChunkCache
+from ddlpy.manifest import Manifest
+from ddlpy.store import sync
+from ddlpy.sinks import to_parquet, to_zarr, ParquetSink, ZarrSink
+from ddlpy.bulk import bulk_measurements
 
 __all__ = [
     "locations",
     "measurements",
+    "iter_measurements",
     "measurements_latest",
     "measurements_available",
     "measurements_amount",
     "simplify_dataframe",
     "dataframe_to_xarray",
+    "Client",
+    "RetryPolicy",
+    "RateLimiter",
+    "Coalescer",
+    "ChunkCache",
+    "Manifest",
+    "sync",
+    "to_parquet",
+    "to_zarr",
+    "ParquetSink",
+    "ZarrSink",
+    "bulk_measurements",
 ]
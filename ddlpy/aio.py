@@ -0,0 +1,397 @@
+# -*- coding: utf-8 -*-
+
+"""
+Asynchronous versions of the ddlpy functions, to be used from asyncio applications.
+This module requires aiohttp, which can be installed with ``pip install rws-ddlpy[aio]``.
+
+    - ``await ddlpy.aio.locations()``
+    - ``await ddlpy.aio.measurements(location, start_date, end_date)``
+"""
+import os
+import json
+import asyncio
+import logging
+import contextlib
+import aiohttp
+import dateutil
+import pandas as pd
+
+from .ddlpy import (
+    ENDPOINTS,
+    MAX_WORKERS,
+    NoDataError,
+    ObservationLimitError,
+    _raise_for_status,
+    _get_request_catalog,
+    get_catalogfile_cache,
+    _load_catalogfile_mtime,
+    _write_catalogfile,
+    _lock_catalogfile,
+    _locations_from_catalog,
+    _load_locationsfile,
+    _locations_memo,
+    _write_locationsfile,
+    _get_request_available,
+    _parse_available,
+    _get_request_amount,
+    _parse_amount,
+    _get_request_slice,
+    _split_period,
+    _combine_waarnemingenlijst,
+    _check_location_series,
+    _check_convert_dates,
+    _get_months_split,
+    _get_date_series_amount,
+    _get_date_series_list,
+    _log_nsplits,
+    _concat_measurements,
+    _get_request_latest,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def _send_post_request(session, url, request, timeout=None):
+    logger.debug("Requesting at {} with request: {}".format(url, json.dumps(request)))
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    async with session.post(url, json=request, timeout=client_timeout) as resp:
+        text = await resp.text()
+
+    _raise_for_status(resp.status, resp.reason, text)
+
+    result = json.loads(text)
+    return result
+
+
+@contextlib.asynccontextmanager
+async def _get_session(session):
+    """use the provided session or create a temporary one"""
+    if session is not None:
+        yield session
+    else:
+        async with aiohttp.ClientSession() as session:
+            yield session
+
+
+async def locations(
+    catalog_filter: list = None,
+    session: aiohttp.ClientSession = None,
+    stale_while_revalidate: bool = False,
+) -> pd.DataFrame:
+    """
+    Asynchronous version of `ddlpy.locations()`, the catalog cache and the in-memory
+    cache are shared with it.
+
+    Parameters
+    ----------
+    catalog_filter : list, optional
+        list of catalogs to pass on to OphalenCatalogus CatalogusFilter,
+        if None the list form endpoints.json is retrieved. The catalog is cached per
+        catalog filter, regardless of the order of the list. The default is None.
+    session : aiohttp.ClientSession, optional
+        Session to send the requests with. The default is None, in which case a
+        temporary session is used.
+    stale_while_revalidate : bool, optional
+        Whether to use the expired cached catalog while another process retrieves the
+        catalog, instead of waiting for it. The default is False.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with a combination of available locations and measurements.
+
+    """
+    df_locations = _locations_memo.get(catalog_filter)
+    if df_locations is not None:
+        return df_locations
+
+    df_locations, catalog_mtime = _load_locationsfile(catalog_filter)
+    if df_locations is None:
+        result, catalog_mtime = await _retrieve_or_load_catalog(
+            catalog_filter, session, stale_while_revalidate
+        )
+        df_locations = _locations_from_catalog(result)
+        _write_locationsfile(df_locations, catalog_filter, catalog_mtime)
+    _locations_memo.put(catalog_filter, df_locations, catalog_mtime)
+    return df_locations
+
+
+async def _retrieve_or_load_catalog(catalog_filter, session, stale_while_revalidate):
+    """asynchronous version of ddlpy.ddlpy._retrieve_or_load_catalog()"""
+    catalogfile, use_cache = get_catalogfile_cache(catalog_filter=catalog_filter)
+    if use_cache:
+        return _load_catalogfile_mtime(catalogfile)
+
+    # do not block the event loop while waiting for another process
+    lock = await asyncio.to_thread(
+        _lock_catalogfile, catalogfile, stale_while_revalidate
+    )
+    if lock is None:
+        return _load_catalogfile_mtime(catalogfile)
+    try:
+        catalogfile, use_cache = get_catalogfile_cache(catalog_filter=catalog_filter)
+        if use_cache:
+            return _load_catalogfile_mtime(catalogfile)
+        logger.info("Retrieving Waterwebservices catalog, this can take 30 seconds")
+        endpoint = ENDPOINTS["collect_catalogue"]
+        request = _get_request_catalog(catalog_filter)
+        async with _get_session(session) as session:
+            result = await _send_post_request(session, endpoint["url"], request)
+        _write_catalogfile(catalogfile, result, catalog_filter)
+    finally:
+        lock.release()
+    return result, os.path.getmtime(catalogfile)
+
+
+async def measurements_available(
+    location: pd.Series,
+    start_date: (str, pd.Timestamp),
+    end_date: (str, pd.Timestamp),
+    session: aiohttp.ClientSession = None,
+) -> bool:
+    """
+    Asynchronous version of `ddlpy.measurements_available()`.
+
+    Parameters
+    ----------
+    location : pd.Series
+        Single row of the `ddlpy.locations()` DataFrame.
+    start_date : (str,pd.Timestamp)
+        The start date of the requested period.
+    end_date : (str,pd.Timestamp)
+        The end date of the requested period.
+    session : aiohttp.ClientSession, optional
+        Session to send the requests with. The default is None, in which case a
+        temporary session is used.
+
+    Returns
+    -------
+    bool
+        Whether there are measurements available or not.
+
+    """
+    endpoint = ENDPOINTS["check_observations_available"]
+
+    request = _get_request_available(location, start_date, end_date)
+
+    async with _get_session(session) as session:
+        result = await _send_post_request(session, endpoint["url"], request, timeout=5)
+
+    return _parse_available(result)
+
+
+async def measurements_amount(
+    location: pd.Series,
+    start_date: (str, pd.Timestamp),
+    end_date: (str, pd.Timestamp),
+    period: str = "Jaar",
+    session: aiohttp.ClientSession = None,
+) -> pd.DataFrame:
+    """
+    Asynchronous version of `ddlpy.measurements_amount()`.
+
+    Parameters
+    ----------
+    location : pd.Series
+        Single row of the `ddlpy.locations()` DataFrame.
+    start_date : (str,pd.Timestamp)
+        The start date of the requested period.
+    end_date : (str,pd.Timestamp)
+        The end date of the requested period.
+    period : str, optional
+        "Jaar", "Maand" or "Dag". The default is "Jaar".
+    session : aiohttp.ClientSession, optional
+        Session to send the requests with. The default is None, in which case a
+        temporary session is used.
+
+    Returns
+    -------
+    df_amount : pd.DataFrame
+        A DataFrame with the number of mesurements (AantalMetingen) per period (Groeperingsperiode).
+
+    """
+    endpoint = ENDPOINTS["collect_number_of_observations"]
+
+    request = _get_request_amount(location, start_date, end_date, period=period)
+
+    async with _get_session(session) as session:
+        result = await _send_post_request(session, endpoint["url"], request)
+
+    return _parse_amount(result, period=period)
+
+
+async def _measurements_slice_split(session, semaphore, location, start_date, end_date):
+    """asynchronous version of ddlpy.ddlpy._measurements_slice_split()"""
+    endpoint = ENDPOINTS["collect_observations"]
+
+    request = _get_request_slice(location, start_date, end_date)
+
+    async with semaphore:
+        try:
+            result = await _send_post_request(session, endpoint["url"], request)
+            split = False
+        except NoDataError:
+            return None, 0
+        except ObservationLimitError:
+            split = True
+
+    if not split:
+        df = _combine_waarnemingenlijst(result, location)
+        return df, 0
+
+    start_date, middle_date, end_date = _split_period(start_date, end_date)
+    logger.debug(
+        f"too many observations from {start_date} to {end_date}, "
+        "splitting the period in two"
+    )
+    results = await asyncio.gather(
+        _measurements_slice_split(
+            session, semaphore, location, start_date, middle_date
+        ),
+        _measurements_slice_split(session, semaphore, location, middle_date, end_date),
+    )
+    nsplits = 1 + sum(nsplits_i for _, nsplits_i in results)
+    measurements = [x for x, _ in results if x is not None]
+    if len(measurements) == 0:
+        return None, nsplits
+    return pd.concat(measurements), nsplits
+
+
+async def _get_date_series_auto(session, location, start_date, end_date):
+    """asynchronous version of ddlpy.ddlpy._get_date_series_auto()"""
+    start_date, end_date = _check_convert_dates(start_date, end_date, return_str=False)
+
+    try:
+        df_amount = await measurements_amount(
+            location, start_date, end_date, period="Maand", session=session
+        )
+    except NoDataError:
+        return []
+
+    # the amounts per day are retrieved first, since the callback cannot await them
+    amounts_day = {}
+    for start_i, end_i in _get_months_split(start_date, end_date, df_amount):
+        amounts_day[start_i, end_i] = await measurements_amount(
+            location, start_i, end_i, period="Dag", session=session
+        )
+
+    return _get_date_series_amount(
+        start_date, end_date, df_amount, lambda *period: amounts_day[period]
+    )
+
+
+async def measurements(
+    location: pd.Series,
+    start_date: (str, pd.Timestamp),
+    end_date: (str, pd.Timestamp),
+    freq: (int, str) = dateutil.rrule.MONTHLY,
+    clean_df: bool = True,
+    categorical: bool = False,
+    semaphore: asyncio.Semaphore = None,
+    session: aiohttp.ClientSession = None,
+) -> pd.DataFrame:
+    """
+    Asynchronous version of `ddlpy.measurements()`. All periods are requested
+    concurrently, the number of requests in flight is limited by the semaphore.
+
+    Parameters
+    ----------
+    location : pd.Series
+        Single row of the `ddlpy.locations()` DataFrame.
+    start_date : str, pd.Timestamp
+        Start of the retrieval period.
+    end_date : str, pd.Timestamp
+        End of the retrieval period.
+    freq : int, dateutil.rrule.MONTHLY, dateutil.rrule.YEARLY, etc., optional
+        The frequency in which to divide the requested period, including "auto", see
+        `ddlpy.measurements()`. The default is dateutil.rrule.MONTHLY.
+    clean_df : bool, optional
+        Whether to sort the dataframe and remove duplicate rows. The default is True.
+    categorical : bool, optional
+        Whether to store the string columns as pd.Categorical to save memory, see
+        `ddlpy.measurements()`. The default is False.
+    semaphore : asyncio.Semaphore, optional
+        Semaphore that limits the number of requests in flight. Pass the same semaphore
+        to multiple calls to limit the total number of requests. The default is None,
+        in which case a semaphore with `ddlpy.ddlpy.MAX_WORKERS` slots is used. Note that
+        aiohttp also limits the number of connections per session, this can be changed
+        with ``aiohttp.TCPConnector(limit=...)``.
+    session : aiohttp.ClientSession, optional
+        Session to send the requests with. The default is None, in which case a
+        temporary session is used.
+
+    Returns
+    -------
+    measurements : pd.DataFrame
+        DataFrame with measurements.
+    """
+    _check_location_series(location)
+
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(MAX_WORKERS)
+
+    async with _get_session(session) as session:
+        if freq == "auto":
+            date_series_list = await _get_date_series_auto(
+                session, location, start_date, end_date
+            )
+        else:
+            date_series_list = _get_date_series_list(start_date, end_date, freq=freq)
+
+        tasks = [
+            asyncio.ensure_future(
+                _measurements_slice_split(
+                    session, semaphore, location, start_date_i, end_date_i
+                )
+            )
+            for start_date_i, end_date_i in date_series_list
+        ]
+        try:
+            # gather returns the results in the order of the tasks, so chronological
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # do not leave pending requests if one of the requests failed
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    _log_nsplits(sum(nsplits_i for _, nsplits_i in results))
+
+    # skip periods without data
+    measurements = [x for x, _ in results if x is not None]
+
+    return _concat_measurements(
+        measurements, clean_df=clean_df, categorical=categorical
+    )
+
+
+async def measurements_latest(
+    location: pd.Series, session: aiohttp.ClientSession = None
+) -> pd.DataFrame:
+    """
+    Asynchronous version of `ddlpy.measurements_latest()`.
+
+    Parameters
+    ----------
+    location : pd.Series
+        Single row of the `ddlpy.locations()` DataFrame.
+    session : aiohttp.ClientSession, optional
+        Session to send the requests with. The default is None, in which case a
+        temporary session is used.
+
+    Returns
+    -------
+    df : pd.DataFrame
+        DataFrame with measurements.
+
+    """
+    endpoint = ENDPOINTS["collect_latest_observations"]
+
+    request = _get_request_latest(location)
+
+    async with _get_session(session) as session:
+        result = await _send_post_request(session, endpoint["url"], request, timeout=5)
+
+    df = _combine_waarnemingenlijst(result, location)
+    return df
@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+
+"""Parallel retrieval of the measurements of many locations with ddlpy.bulk_measurements()."""
+import time
+import logging
+import collections
+import dateutil
+import tqdm
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .ddlpy import (
+    _check_max_workers,
+    _get_date_series,
+    _get_request_slice,
+    _measurements_slice_cached,
+    _clean_chunk,
+)
+from .client import Client
+from .cache import ChunkCache
+from .manifest import Manifest
+
+logger = logging.getLogger(__name__)
+
+REPORT_COLUMNS = [
+    "start_date",
+    "end_date",
+    "status",
+    "nmeasurements",
+    "nbytes",
+    "nsplits",
+    "duration",
+    "error",
+    "resumed",
+]
+
+
+class _Task:
+    """A period of a location to retrieve, with its row in the status report."""
+
+    def __init__(self, label, location, start_date, end_date):
+        self.label = label
+        self.location = location
+        self.start_date = start_date
+        self.end_date = end_date
+        self.request = _get_request_slice(location, start_date, end_date)
+        # finished in a previous run according to the manifest
+        self.resumed = False
+        self.report = {
+            "start_date": start_date,
+            "end_date": end_date,
+            "status": "pending",
+            "nmeasurements": 0,
+            "nbytes": 0,
+            "nsplits": 0,
+            "duration": None,
+            "error": None,
+        }
+
+    def run(self, client, cache):
+        tstart = time.perf_counter()
+        try:
+            return _measurements_slice_cached(
+                self.location,
+                start_date=self.start_date,
+                end_date=self.end_date,
+                client=client,
+                cache=cache,
+            )
+        finally:
+            self.report["duration"] = time.perf_counter() - tstart
+
+    def set_error(self, error):
+        self.report["status"] = "failed"
+        self.report["error"] = f"{type(error).__name__}: {error}"
+        logger.error(
+            f"retrieving {self.label} from {self.start_date} to {self.end_date} "
+            f"failed with {self.report['error']}"
+        )
+
+
+class _LocationState:
+    """
+    The tasks of a location, the results are passed to the sink in chronological order
+    since they can finish in any order.
+    """
+
+    def __init__(self, label, location, manifest=None):
+        self.label = label
+        self.location = location
+        self.manifest = manifest
+        self.tasks = []
+        self.results = {}
+        self.next = 0
+        self.previous = None
+        self.resumed_end_date = None
+        self.failed = False
+
+    def add_tasks(self, start_date, end_date, date_series_list, error):
+        """
+        Add a task for every period of the location and return the tasks that should be
+        retrieved, the tasks that were finished in a previous run are taken from the
+        manifest.
+        """
+        if error is not None:
+            # e.g. freq="auto" could not retrieve the amount of measurements
+            task = _Task(self.label, self.location, start_date, end_date)
+            task.set_error(error)
+            self.tasks.append(task)
+            self.failed = True
+            return []
+
+        for start_date_i, end_date_i in date_series_list:
+            task = _Task(self.label, self.location, start_date_i, end_date_i)
+            if self.manifest is not None and self.manifest.is_finished(task.request):
+                record = self.manifest.get(task.request)
+                task.resumed = True
+                task.report["status"] = record["status"]
+                task.report["nmeasurements"] = record["nmeasurements"]
+                task.report["nbytes"] = record["nbytes"]
+            elif self.manifest is not None:
+                self.manifest.add(task.request)
+            self.tasks.append(task)
+        return [
+            (self, itask, task)
+            for itask, task in enumerate(self.tasks)
+            if not task.resumed
+        ]
+
+    def add_result(self, itask, result, error, sink):
+        self.results[itask] = (result, error)
+        while self.next < len(self.tasks):
+            task = self.tasks[self.next]
+            if task.resumed:
+                # the chunk was passed to the sink in a previous run
+                self.previous = None
+                self.resumed_end_date = task.end_date
+            elif self.next in self.results:
+                result, error = self.results.pop(self.next)
+                self._process(task, result, error, sink)
+                self._record(task)
+            else:
+                break
+            self.next += 1
+
+    def _record(self, task):
+        """record the status in the manifest, skipped tasks remain pending"""
+        if self.manifest is None or task.report["status"] == "skipped":
+            return
+        self.manifest.update(
+            task.request,
+            status=task.report["status"],
+            nmeasurements=task.report["nmeasurements"],
+            nbytes=task.report["nbytes"],
+            error=task.report["error"],
+        )
+
+    def _process(self, task, result, error, sink):
+        if self.failed:
+            # the sink should receive the chunks without gaps
+            task.report["status"] = "skipped"
+            return
+        if error is not None:
+            task.set_error(error)
+            self.failed = True
+            return
+
+        measurements, nsplits = result
+        task.report["nsplits"] = nsplits
+        if measurements is not None:
+            measurements, self.previous = _clean_chunk(measurements, self.previous)
+            if self.resumed_end_date is not None:
+                # the end of the previous period was passed to the sink in a previous run
+                measurements = measurements.loc[
+                    measurements.index > self.resumed_end_date
+                ]
+        self.resumed_end_date = None
+        if measurements is None or measurements.empty:
+            task.report["status"] = "nodata"
+            return
+
+        try:
+            sink(self.location, measurements)
+        except Exception as e:
+            task.set_error(e)
+            self.failed = True
+            return
+        task.report["status"] = "done"
+        task.report["nmeasurements"] = len(measurements)
+        task.report["nbytes"] = int(measurements.memory_usage(deep=True).sum())
+
+
+def _get_report(states, index_name):
+    labels = [task.label for state in states for task in state.tasks]
+    rows = [
+        dict(task.report, resumed=task.resumed)
+        for state in states
+        for task in state.tasks
+    ]
+    report = pd.DataFrame(rows, columns=REPORT_COLUMNS)
+    report.index = pd.Index(labels, name=index_name)
+    return report
+
+
+def _cancel_state(running, state, sink, progress):
+    """cancel the running tasks of a failed state that have not started yet"""
+    for future, (state_i, itask, _) in list(running.items()):
+        if state_i is state and future.cancel():
+            running.pop(future)
+            state.add_result(itask, None, None, sink)
+            progress.update()
+
+
+def bulk_measurements(
+    locations: pd.DataFrame,
+    start_date: (str, pd.Timestamp),
+    end_date: (str, pd.Timestamp),
+    sink,
+    freq: (int, str) = dateutil.rrule.MONTHLY,
+    max_workers: int = 4,
+    cache: ChunkCache = None,
+    manifest: Manifest = None,
+    client: Client = None,
+) -> pd.DataFrame:
+    """
+    Retrieves the measurements for many locations and writes them to a sink. Every
+    period (as defined by `freq`) of every location is a task, the tasks of all
+    locations share one pool of `max_workers` threads, so the number of concurrent
+    requests to the Waterwebservices never exceeds `max_workers`. The periods of the
+    locations are also determined in this pool, so the first periods are retrieved
+    while the next locations are planned.
+
+    The chunks are cleaned like `ddlpy.iter_measurements()` and passed to the sink in
+    chronological order per location. Failed tasks do not stop the other tasks, they
+    are logged and reported with their error in the returned status report. The
+    remaining periods of a location with a failed task are skipped without retrieving
+    them, so the sink never receives a timeseries with gaps. Transient errors are retried by the client, see
+    `ddlpy.RetryPolicy`.
+
+    Parameters
+    ----------
+    locations : pd.DataFrame
+        Rows of the `ddlpy.locations()` DataFrame.
+    start_date : str, pd.Timestamp
+        Start of the retrieval period.
+    end_date : str, pd.Timestamp
+        End of the retrieval period.
+    sink : callable
+        Called as ``sink(location, measurements)`` for every chunk with data, from the
+        calling thread. For instance `ddlpy.ParquetSink` or `ddlpy.ZarrSink`.
+    freq : int, dateutil.rrule.MONTHLY, dateutil.rrule.YEARLY, etc., optional
+        The frequency in which to divide the requested period, see
+        `ddlpy.measurements()`. The default is dateutil.rrule.MONTHLY.
+    max_workers : int, optional
+        The number of tasks to retrieve in parallel, at least 1 and at most
+        `ddlpy.ddlpy.MAX_WORKERS`. The default is 4.
+    cache : ddlpy.ChunkCache, optional
+        On-disk cache of the retrieved periods, see `ddlpy.measurements()`.
+        The default is None.
+    manifest : ddlpy.Manifest, optional
+        Persistent manifest in which the status of every period is recorded. Periods
+        that were finished in a previous run with the same manifest are not retrieved
+        and not passed to the sink again, so an interrupted run can be resumed. The
+        default is None.
+    client : ddlpy.Client, optional
+        Client to send the requests with. The default is None, in which case a shared
+        default client is used.
+
+    Returns
+    -------
+    pd.DataFrame
+        Status report with a row per task, indexed like `locations`. The status is
+        "done", "nodata", "failed" or "skipped". The "resumed" column indicates whether
+        the status was taken from the manifest.
+
+    """
+    if isinstance(locations, pd.Series):
+        locations = locations.to_frame().T
+    max_workers = _check_max_workers(max_workers)
+
+    states = [
+        _LocationState(label, location, manifest=manifest)
+        for label, location in locations.iterrows()
+    ]
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        running = {}
+        pending = collections.deque()
+        iplan = 0
+        nplanning = 0
+        # the number of tasks is known once the locations are planned
+        with tqdm.tqdm(total=0) as progress:
+            while True:
+                # only submit a limited number of tasks ahead, so the finished chunks
+                # that wait for an earlier chunk of their location stay limited
+                while len(running) < 2 * max_workers:
+                    if (
+                        iplan < len(states)
+                        and nplanning < max_workers
+                        and len(pending) < max_workers
+                    ):
+                        # plan the periods of the next location in a worker, since
+                        # freq="auto" sends requests, while the planned ones are retrieved
+                        state = states[iplan]
+                        iplan += 1
+                        future = executor.submit(
+                            _get_date_series,
+                            state.location,
+                            start_date,
+                            end_date,
+                            freq=freq,
+                            client=client,
+                        )
+                        running[future] = (state, None, None)
+                        nplanning += 1
+                        continue
+                    if len(pending) == 0:
+                        break
+                    state, itask, task = pending.popleft()
+                    if state.failed:
+                        # the result would be skipped, so do not retrieve it
+                        state.add_result(itask, None, None, sink)
+                        progress.update()
+                        continue
+                    future = executor.submit(task.run, client, cache)
+                    running[future] = (state, itask, task)
+                if len(running) == 0:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    state, itask, _ = running.pop(future)
+                    error = future.exception()
+                    result = None if error is not None else future.result()
+                    if itask is None:
+                        nplanning -= 1
+                        tasks = state.add_tasks(start_date, end_date, result, error)
+                        pending.extend(tasks)
+                        progress.total += len(tasks)
+                        progress.refresh()
+                        continue
+                    state.add_result(itask, result, error, sink)
+                    progress.update()
+                    if state.failed:
+                        _cancel_state(running, state, sink, progress)
+    finally:
+        # do not start pending tasks if the sink or the keyboard interrupted us
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    report = _get_report(states, index_name=locations.index.name)
+    counts = report["status"].value_counts().to_dict()
+    logger.info(f"bulk_measurements finished with {counts}")
+    return report
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+
+"""On-disk cache of the periods retrieved by ddlpy.measurements()."""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import collections
+import numpy as np
+import pandas as pd
+
+from .utils import _get_cachedir
+from .locking import _atomic_write
+
+logger = logging.getLogger(__name__)
+
+# the fraction of max_size the cache is reduced to when it is full
+EVICT_FRACTION = 0.9
+
+
+def _get_request_key(request):
+    """return a hash of the request"""
+    # the request is sorted, so the key does not depend on the order of the dict
+    request_str = json.dumps(request, sort_keys=True)
+    return hashlib.sha256(request_str.encode()).hexdigest()
+
+
+def _get_nan_ranges(values):
+    """
+    return the [start, stop) ranges of the float NaN values in an object array, parquet
+    stores them as null like None
+    """
+    mask = pd.isna(values) & ~np.equal(values, None)
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], mask.astype(int), [0]])))
+    return edges.reshape(-1, 2).tolist()
+
+
+def _get_schema(df):
+    """return the dtypes and the NaN values of the object columns of a chunk"""
+    nan_ranges = {}
+    for colname in df.columns:
+        if df[colname].dtype == object:
+            ranges = _get_nan_ranges(df[colname].to_numpy())
+            if ranges:
+                nan_ranges[colname] = ranges
+    dtypes = {colname: str(dtype) for colname, dtype in df.dtypes.items()}
+    return {"dtypes": dtypes, "nan": nan_ranges}
+
+
+def _restore_schema(df, schema):
+    """restore the dtypes and NaN values of a chunk that were lost in parquet"""
+    for colname, ranges in schema["nan"].items():
+        values = df[colname].to_numpy(dtype=object, copy=True)
+        for start, stop in ranges:
+            values[start:stop] = np.nan
+        df[colname] = pd.Series(values, index=df.index, dtype=object)
+    for colname, dtype in schema["dtypes"].items():
+        if str(df[colname].dtype) != dtype:
+            df[colname] = df[colname].astype(dtype)
+    return df
+
+
+class ChunkCache:
+    """
+    On-disk cache of the periods (chunks) retrieved by `ddlpy.measurements()`. Every
+    chunk is stored as a parquet file, which requires the optional pyarrow dependency.
+    The chunks are identified by their OphalenWaarnemingen request, so by the location,
+    the AquoMetadata and the period. Periods without data are also cached. The dtypes
+    and missing values of the columns are stored with the chunk, so a cached chunk
+    equals the retrieved one.
+
+    Chunks that were retrieved after the end of their period are never expired, since
+    historical data rarely changes. Use `clear()` to retrieve them again anyway. Chunks
+    that were retrieved before the end of their period, so that overlap with the moment
+    of retrieval, expire after `ttl` seconds, since new measurements are added to them.
+
+    When the total size of the cache exceeds `max_size`, the least recently used chunks
+    are removed until it is below 90% of `max_size`. The size is estimated from the chunks written by this instance and
+    the cache directory is only scanned again when the estimate exceeds `max_size`, so
+    chunks written by other processes are counted from the next scan onwards.
+
+    Parameters
+    ----------
+    cachedir : str, optional
+        Directory to store the chunks in. The default is None, in which case a
+        ``measurements`` directory in the ddlpy cache directory is used.
+    max_size : int, optional
+        The maximum total size of the chunks in bytes. The default is 2 GB.
+    ttl : float, optional
+        The time to live in seconds of chunks that overlap with the moment they were
+        retrieved. The default is 600.
+
+    """
+
+    def __init__(self, cachedir: str = None, max_size: int = 2 * 1024**3, ttl=600):
+        if cachedir is None:
+            # like %USERPROFILE%/AppData/Local/ddlpy/Cache/measurements
+            cachedir = os.path.join(_get_cachedir(), "measurements")
+        os.makedirs(cachedir, exist_ok=True)
+        self.cachedir = cachedir
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        # estimate of the total size, None until the cache directory is scanned
+        self._size = None
+
+    def _get_path(self, request):
+        return os.path.join(self.cachedir, f"{_get_request_key(request)}.parquet")
+
+    def _is_expired(self, request, stat):
+        end_date = pd.Timestamp(request["Periode"]["Einddatumtijd"])
+        retrieved = pd.Timestamp(stat.st_mtime, unit="s", tz="UTC")
+        if end_date <= retrieved:
+            # retrieved after the end of the period, so it is complete
+            return False
+        return time.time() - stat.st_mtime > self.ttl
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def get(self, request: dict) -> pd.DataFrame:
+        """
+        Return the measurements for the OphalenWaarnemingen request, or None if they
+        are not in the cache or expired. Returns an empty DataFrame if there was no data.
+        """
+        path = self._get_path(request)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+
+        if self._is_expired(request, stat):
+            logger.debug(f"cached chunk {path} is expired")
+            self._remove(path)
+            self._count("misses")
+            return None
+
+        try:
+            df = pd.read_parquet(path)
+            df = _restore_schema(df, df.attrs.pop("schema"))
+        except (OSError, ValueError, KeyError) as e:
+            # e.g. removed by another process in the meantime
+            logger.warning(f"reading cached chunk {path} failed: {e}")
+            self._remove(path)
+            self._count("misses")
+            return None
+
+        # update the access time for the LRU eviction, keep the time of retrieval
+        try:
+            os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+        except FileNotFoundError:
+            pass
+        self._count("hits")
+
+        if "Tijdstip" in df.columns:
+            # the index is not stored, rebuild it like _combine_waarnemingenlijst
+            df.index = pd.to_datetime(df["Tijdstip"], format="ISO8601").rename("time")
+        return df
+
+    def put(self, request: dict, df: pd.DataFrame):
+        """
+        Store the measurements for the OphalenWaarnemingen request, use None if there
+        was no data. The least recently used chunks are removed if the cache is full.
+        A failure to write the chunk is logged and otherwise ignored.
+        """
+        if df is None:
+            df = pd.DataFrame()
+        path = self._get_path(request)
+
+        df = df.reset_index(drop=True)
+        # parquet does not keep all dtypes and NaN values of object columns
+        df.attrs = {"schema": _get_schema(df)}
+        try:
+            _atomic_write(path, lambda path_tmp: df.to_parquet(path_tmp, index=False))
+        except (OSError, ValueError) as e:
+            # e.g. the disk is full, the measurements are returned anyway
+            logger.warning(f"writing cached chunk {path} failed: {e}")
+            self._count("write_errors")
+            return
+
+        try:
+            nbytes = os.path.getsize(path)
+        except FileNotFoundError:
+            # removed by another thread or process
+            nbytes = 0
+        with self._lock:
+            if self._size is not None:
+                # replacing a chunk overestimates the size, the next scan corrects it
+                self._size += nbytes
+            full = self._size is None or self._size > self.max_size
+        if full:
+            self.evict()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # removed by another thread or process
+            pass
+
+    def _scan(self):
+        with os.scandir(self.cachedir) as entries:
+            return [
+                (entry.path, entry.stat())
+                for entry in entries
+                if entry.name.endswith(".parquet")
+            ]
+
+    @property
+    def size(self) -> int:
+        """The total size of the cached chunks in bytes."""
+        return sum(stat.st_size for _, stat in self._scan())
+
+    def evict(self):
+        """
+        Remove the least recently used chunks until the cache is below 90% of max_size,
+        if it does not fit in max_size.
+        """
+        with self._lock:
+            chunks = self._scan()
+            size = sum(stat.st_size for _, stat in chunks)
+            if size > self.max_size:
+                # leave room for the next chunks, so not every put scans the cache
+                max_size = EVICT_FRACTION * self.max_size
+                for path, stat in sorted(chunks, key=lambda x: x[1].st_atime):
+                    self._remove(path)
+                    self.stats["evictions"] += 1
+                    size -= stat.st_size
+                    if size <= max_size:
+                        break
+            self._size = size
+
+    def clear(self):
+        """Remove all cached chunks."""
+        with self._lock:
+            for path, _ in self._scan():
+                self._remove(path)
+            self._size = 0
@@ -8,10 +8,14 @@ Console script for ddlpy.
 """
 import os
 import sys
+import csv
 import logging
 import click
 import pandas as pd
 import ddlpy
+from ddlpy.locking import _atomic_write
+
+MANIFEST_FILENAME = "ddlpy_manifest.sqlite"
 
 
 @click.group()
@@ -91,6 +95,99 @@ def locations(
     selected.to_json(output + ".json", orient="records")
 
 
+def _get_csv_filename(location):
+    keys = [
+        "Code",
+        "ProcesType",
+        "Compartiment.Code",
+        "Eenheid.Code",
+        "Grootheid.Code",
+        "Groepering.Code",
+        "Hoedanigheid.Code",
+        "Parameter.Code",
+        "Typering.Code",
+    ]
+    return "_".join(str(location[key]) for key in keys) + ".csv"
+
+
+def _read_csv_state(filename):
+    """return the columns and the last timestamp of a csv file written by _CsvSink"""
+    with open(filename, "rb") as f:
+        header = f.readline().decode().rstrip("\r\n")
+        # only read the end of the file to find the last line
+        f.seek(0, os.SEEK_END)
+        f.seek(max(f.tell() - 65536, 0))
+        # the first line might be incomplete, and so might be its first character
+        tail = f.read().decode(errors="ignore")
+    lines = [line for line in tail.splitlines() if line.strip()]
+    columns = next(csv.reader([header]))
+    last_line = lines[-1] if lines else header
+    if last_line == header:
+        return columns, None
+    last_date = pd.Timestamp(next(csv.reader([last_line]))[0])
+    return columns, last_date
+
+
+def _add_csv_columns(filename, columns):
+    """
+    Rewrite a csv file written by _CsvSink with the header `columns`, the columns that
+    were added at the end are left empty in the existing rows.
+    """
+
+    def write(path_tmp):
+        with open(filename, newline="") as f_in:
+            with open(path_tmp, "w", newline="") as f_out:
+                reader = csv.reader(f_in)
+                writer = csv.writer(f_out, lineterminator=os.linesep)
+                next(reader)
+                writer.writerow(columns)
+                for row in reader:
+                    writer.writerow(row + [""] * (len(columns) - len(row)))
+
+    _atomic_write(filename, write)
+
+
+class _CsvSink:
+    """
+    Write the chunks of every location to a csv file, the file of a previous run is
+    appended to if resume=True. Measurements that are not newer than the last
+    measurement in the file are skipped, since a period that was not finished in the
+    previous run is retrieved again. Columns that are missing in a chunk are left
+    empty, columns that are new in a chunk are added to the file and left empty in
+    the rows that were written before, like the columns of `pd.concat()`.
+    """
+
+    def __init__(self, resume=False):
+        self.resume = resume
+        # filename: (columns, last timestamp)
+        self._state = {}
+
+    def __call__(self, location, measurements):
+        filename = _get_csv_filename(location)
+        if filename not in self._state and self.resume and os.path.exists(filename):
+            self._state[filename] = _read_csv_state(filename)
+
+        measurements_columns = [measurements.index.name] + list(measurements.columns)
+        if filename not in self._state:
+            measurements.to_csv(filename, mode="w")
+            self._state[filename] = (measurements_columns, measurements.index[-1])
+            return
+
+        columns, last_date = self._state[filename]
+        if last_date is not None:
+            measurements = measurements.loc[measurements.index > last_date]
+            if measurements.empty:
+                return
+        new_columns = [x for x in measurements_columns if x not in columns]
+        if new_columns:
+            # rewriting the file is expensive, but new columns are rare
+            columns = columns + new_columns
+            _add_csv_columns(filename, columns)
+        measurements = measurements.reindex(columns=columns[1:])
+        measurements.to_csv(filename, mode="a", header=False)
+        self._state[filename] = (columns, measurements.index[-1])
+
+
 # Another command to get the measurements from locations
 @cli.command()
 @click.argument(
@@ -104,7 +201,20 @@ def locations(
     default="locations.json",
     help="file in json or parquet format containing locations and codes",
 )
-def measurements(locations, start_date, end_date):
+@click.option(
+    "--max-workers",
+    default=1,
+    help="number of periods to retrieve in parallel",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    help=(
+        f"record the retrieved periods in {MANIFEST_FILENAME} and skip the periods "
+        "that were retrieved in a previous run with --resume"
+    ),
+)
+def measurements(locations, start_date, end_date, max_workers, resume):
     """
     Obtain measurements from file with locations and codes.
     The arguments start_date and end_date should be formatted
@@ -116,36 +226,41 @@ def measurements(locations, start_date, end_date):
         )
     locations_df = pd.read_json(locations, orient="records")
 
-    for irow, selected in locations_df.iterrows():  # goes through rows in table
-        measurements = ddlpy.measurements(
-            selected, start_date=start_date, end_date=end_date
+    # the manifest is stored next to the csv files it describes
+    manifest = ddlpy.Manifest(MANIFEST_FILENAME) if resume else None
+    try:
+        report = ddlpy.bulk_measurements(
+            locations_df,
+            start_date=start_date,
+            end_date=end_date,
+            sink=_CsvSink(resume=resume),
+            max_workers=max_workers,
+            manifest=manifest,
         )
+    finally:
+        if manifest is not None:
+            manifest.close()
 
-        if len(measurements) > 0:
+    for irow, selected in locations_df.iterrows():  # goes through rows in table
+        report_row = report.loc[[irow]]
+        if (report_row["status"] == "done").any():
             print(
                 "Data for station %s were retrieved from Waterwebservices"
                 % selected["Code"]
             )
-            station = selected["Code"]
-            pt = selected["ProcesType"]
-            cc = selected["Compartiment.Code"]
-            ec = selected["Eenheid.Code"]
-            gc = selected["Grootheid.Code"]
-            grc = selected["Groepering.Code"]
-            hc = selected["Hoedanigheid.Code"]
-            pc = selected["Parameter.Code"]
-            tc = selected["Typering.Code"]
-
-            measurements.to_csv(
-                "%s_%s_%s_%s_%s_%s_%s_%s_%s.csv"
-                % (station, pt, cc, ec, gc, grc, hc, pc, tc)
-            )
         else:
             print(
                 "No data available for station %s in the requested period"
                 % selected["Code"]
             )
 
+    nfailed = (report["status"] == "failed").sum()
+    if nfailed > 0:
+        raise click.ClickException(
+            f"retrieving {nfailed} periods failed, rerun with --resume to retry only "
+            "the failed periods"
+        )
+
 
 if __name__ == "__main__":
     sys.exit(cli())  # pragma: no cover
@@ -0,0 +1,559 @@
+# -*- coding: utf-8 -*-
+
+"""HTTP client with pooled keep-alive sessions for the Waterwebservices."""
+import os
+import time
+import random
+import threading
+import logging
+import collections
+import contextlib
+import weakref
+import struct
+import gzip
+import requests
+from requests.adapters import HTTPAdapter
+from json import dumps as _json_dumps
+
+from .locking import FileLock
+
+try:
+    # urllib3 decodes brotli responses if one of these is installed
+    import brotli  # noqa: F401
+
+    HAS_BROTLI = True
+except ImportError:
+    try:
+        import brotlicffi  # noqa: F401
+
+        HAS_BROTLI = True
+    except ImportError:
+        HAS_BROTLI = False
+
+logger = logging.getLogger(__name__)
+
+
+def _get_accept_encoding():
+    """return the content encodings that can be decoded"""
+    encodings = ["gzip", "deflate"]
+    if HAS_BROTLI:
+        encodings.append("br")
+    return ", ".join(encodings)
+
+
+class RetryPolicy:
+    """
+    Policy for retrying requests that failed because of a transient error, like a
+    timeout, a reset connection or a 503 Service Unavailable response. The delay
+    between the attempts increases exponentially.
+
+    Parameters
+    ----------
+    max_attempts : int, optional
+        The maximum number of attempts per request, including the first one. Use 1 to
+        disable retrying. The default is 4.
+    backoff_base : float, optional
+        The delay in seconds before the first retry, it is doubled for every next retry.
+        The default is 1.
+    backoff_cap : float, optional
+        The maximum delay in seconds between two attempts. The default is 30.
+    jitter : bool, optional
+        Whether to draw the delay randomly between zero and the exponential delay, to
+        avoid that many clients retry at the same time. The default is True.
+    retry_status : tuple, optional
+        The response status codes that are retried. The Waterwebservices also respond
+        with 500 Internal Server Error to some invalid requests, so it is not retried
+        by default. The default is (429, 502, 503, 504).
+
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        backoff_base: float = 1,
+        backoff_cap: float = 30,
+        jitter: bool = True,
+        retry_status: tuple = (429, 502, 503, 504),
+    ):
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.jitter = jitter
+        self.retry_status = tuple(retry_status)
+
+    def backoff(self, attempt, retry_after=None):
+        """Return the delay in seconds after the failed attempt (starting at 1)."""
+        delay = min(self.backoff_cap, self.backoff_base * 2 ** (attempt - 1))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        if retry_after is not None:
+            # the server knows best, but do not wait longer than the cap
+            delay = min(self.backoff_cap, max(delay, retry_after))
+        return delay
+
+
+class RateLimiter:
+    """
+    Token bucket that limits the number of requests per second and the number of
+    requests in flight. The limits are shared by all threads that use the limiter. If a
+    `path` is given, the state is stored in lock files in that directory, so the limits
+    are shared by all processes that use the same directory, for instance all
+    harvesters on a node. All processes should use the same limits.
+
+    Parameters
+    ----------
+    rate : float, optional
+        The maximum average number of requests per second. The default is None, which
+        does not limit the rate.
+    burst : int, optional
+        The number of requests that can be sent at once after an idle period, the size
+        of the bucket. The default is 1.
+    max_in_flight : int, optional
+        The maximum number of requests that are sent concurrently. The body of a
+        streamed response is downloaded after the request is finished. The default is
+        None, which does not limit the concurrency.
+    path : str, optional
+        Directory for the lock files that share the limits with other processes, it is
+        created if it does not exist. The default is None, in which case the limits are
+        only shared within the process.
+
+    Attributes
+    ----------
+    stats : collections.Counter
+        The number of "throttled" requests and the total "wait" time in seconds.
+
+    """
+
+    def __init__(
+        self,
+        rate: float = None,
+        burst: int = 1,
+        max_in_flight: int = None,
+        path: str = None,
+    ):
+        if rate is not None and rate <= 0:
+            raise ValueError(f"rate should be larger than zero, not {rate}")
+        if burst < 1:
+            raise ValueError(f"burst should be at least 1, not {burst}")
+        if max_in_flight is not None and max_in_flight < 1:
+            raise ValueError(f"max_in_flight should be at least 1, not {max_in_flight}")
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.path = path
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        # theoretical arrival time of the next request in the bucket
+        self._tat = 0.0
+        self._semaphore = None
+        self._pid = None
+
+    def _reserve(self) -> float:
+        """reserve a token, return the number of seconds to wait for it"""
+        interval = 1 / self.rate
+        with self._lock:
+            if self.path is None:
+                now = time.monotonic()
+                wait, self._tat = _reserve_token(self._tat, now, interval, self.burst)
+                return wait
+            # the wall clock is shared by the processes
+            with FileLock(os.path.join(self.path, "rate.lock")) as lock:
+                os.lseek(lock.fd, 0, os.SEEK_SET)
+                data = os.read(lock.fd, 8)
+                tat = struct.unpack("d", data)[0] if len(data) == 8 else 0.0
+                wait, tat = _reserve_token(tat, time.time(), interval, self.burst)
+                os.lseek(lock.fd, 0, os.SEEK_SET)
+                os.write(lock.fd, struct.pack("d", tat))
+            return wait
+
+    def _get_semaphore(self):
+        pid = os.getpid()
+        with self._lock:
+            if self._pid != pid:
+                # a forked process does not share the threads of its parent
+                self._semaphore = threading.BoundedSemaphore(self.max_in_flight)
+                self._pid = pid
+            return self._semaphore
+
+    def _acquire_slot(self):
+        """acquire one of the `max_in_flight` slots, return the file lock if any"""
+        if self.path is None:
+            self._get_semaphore().acquire()
+            return None
+        while True:
+            for islot in range(self.max_in_flight):
+                lock = FileLock(os.path.join(self.path, f"slot{islot}.lock"))
+                if lock.acquire(blocking=False):
+                    return lock
+            time.sleep(0.01)
+
+    def _release_slot(self, lock):
+        if lock is None:
+            self._get_semaphore().release()
+        else:
+            lock.release()
+
+    @contextlib.contextmanager
+    def limit(self):
+        """
+        Context manager that waits until a request can be sent, the request is in
+        flight until the context is exited.
+        """
+        tstart = time.monotonic()
+        slot = None
+        if self.max_in_flight is not None:
+            slot = self._acquire_slot()
+        try:
+            if self.rate is not None:
+                wait = self._reserve()
+                if wait > 0:
+                    time.sleep(wait)
+            waited = time.monotonic() - tstart
+            if waited > 0.001:
+                with self._lock:
+                    self.stats["throttled"] += 1
+                    self.stats["wait"] += waited
+            yield
+        finally:
+            if self.max_in_flight is not None:
+                self._release_slot(slot)
+
+
+def _reserve_token(tat, now, interval, burst):
+    """
+    Generic cell rate algorithm, the equivalent of a token bucket that only stores
+    when the bucket is full again. Return the wait time and the new state.
+    """
+    tat = max(tat, now)
+    wait = tat - now - (burst - 1) * interval
+    return max(wait, 0.0), tat + interval
+
+
+class _Flight:
+    """a call that is in progress, other threads wait for its result"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class Coalescer:
+    """
+    Shares the result of identical calls, so concurrent requests for the same
+    measurements (e.g. from multiple users of a service) result in one request to the
+    Waterwebservices and one parsed DataFrame. Calls that arrive while an identical call
+    is in flight wait for its result or error. Results of calls that just finished are
+    reused for `ttl` seconds.
+
+    Parameters
+    ----------
+    ttl : float, optional
+        The number of seconds the result of a finished call is reused. Use 0 to only
+        share the results of calls in flight. The default is 5.
+    maxsize : int, optional
+        The maximum number of finished results to keep, the oldest are removed first.
+        The default is 32.
+
+    Attributes
+    ----------
+    stats : collections.Counter
+        The number of "calls" that were done, "coalesced" calls that waited for a call
+        in flight and "memo" calls that reused a finished result.
+
+    """
+
+    def __init__(self, ttl: float = 5, maxsize: int = 32):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        self._flights = {}
+        # key: (expiry time, result), oldest first
+        self._memo = collections.OrderedDict()
+
+    def _get_memo(self, key):
+        now = time.monotonic()
+        for key_i in [k for k, (expires, _) in self._memo.items() if expires <= now]:
+            del self._memo[key_i]
+        if key not in self._memo:
+            return None
+        return self._memo[key]
+
+    def call(self, key: str, func):
+        """Return the result of ``func()``, shared with identical calls with the same key."""
+        with self._lock:
+            memo = self._get_memo(key)
+            if memo is not None:
+                self.stats["memo"] += 1
+                return memo[1]
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.stats["calls"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if flight.error is None and self.ttl > 0:
+                    self._memo[key] = (time.monotonic() + self.ttl, flight.result)
+                    while len(self._memo) > self.maxsize:
+                        self._memo.popitem(last=False)
+            flight.event.set()
+        return flight.result
+
+    def clear(self):
+        """Remove the finished results."""
+        with self._lock:
+            self._memo.clear()
+
+
+def _get_retry_after(resp):
+    """return the Retry-After header in seconds, if it is present and numeric"""
+    if resp is None:
+        return None
+    try:
+        return float(resp.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+class Client:
+    """
+    Client that reuses a pooled ``requests.Session`` for all requests to the
+    Waterwebservices, so subsequent requests (e.g. the chunks of `ddlpy.measurements()`)
+    do not have to set up a new TCP/TLS connection each time. ``requests.Session`` is
+    not documented to be thread-safe, so every thread gets its own session, which is
+    recreated after a fork. One client can therefore be used by multiple threads and
+    processes.
+
+    The parallel retrieval of `ddlpy.measurements(max_workers=...)` and
+    `ddlpy.bulk_measurements()` uses new worker threads for every call, so their
+    connections are only reused within one call. Subsequent calls from the same thread
+    without workers share the session of that thread.
+
+    Parameters
+    ----------
+    pool_connections : int, optional
+        The number of connection pools (one per host) to cache. The default is 10.
+    pool_maxsize : int, optional
+        The maximum number of connections to keep open per pool of the session of a
+        thread. A session sends one request at a time, so it has no real effect, except
+        for responses that are still streamed while the next request is sent. The
+        default is 10.
+    keep_alive : bool, optional
+        Whether to keep the connections open after a request. The default is True.
+    headers : dict, optional
+        Additional headers that are sent with every request. The default is None.
+    retry : RetryPolicy, optional
+        Policy for retrying requests that failed because of a transient error. The
+        default is None, in which case the default `ddlpy.RetryPolicy()` is used.
+    rate_limiter : RateLimiter, optional
+        Limits the number of requests per second and in flight, every attempt is
+        counted. The same limiter can be shared by multiple clients. The default is
+        None, which does not limit the requests.
+    coalescer : Coalescer, optional
+        Shares the measurements of identical requests that are in flight or that just
+        finished between the threads that use this client. The default is None, in which
+        case every call sends its own requests.
+    compress_requests : bool, optional
+        Whether to compress the JSON body of the requests with gzip, only use this if
+        the server accepts it. The responses are always requested with gzip, deflate or
+        brotli (if available) compression. The default is False.
+
+    Attributes
+    ----------
+    stats : collections.Counter
+        The number of "requests" (attempts) and "retries" done with this client, and
+        the number of response bytes that were transferred ("bytes_compressed") and
+        that were decoded from them ("bytes_decompressed").
+
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        keep_alive: bool = True,
+        headers: dict = None,
+        retry: RetryPolicy = None,
+        rate_limiter: RateLimiter = None,
+        coalescer: Coalescer = None,
+        compress_requests: bool = False,
+    ):
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keep_alive = keep_alive
+        self.headers = dict(headers or {})
+        if retry is None:
+            retry = RetryPolicy()
+        self.retry = retry
+        self.rate_limiter = rate_limiter
+        self.coalescer = coalescer
+        self.compress_requests = compress_requests
+        self.stats = collections.Counter()
+        self._lock = threading.Lock()
+        # the session and process id of every thread
+        self._local = threading.local()
+        # the process id of the sessions of all threads, so close() can close them
+        self._sessions = weakref.WeakKeyDictionary()
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _limit(self):
+        if self.rate_limiter is None:
+            return contextlib.nullcontext()
+        return self.rate_limiter.limit()
+
+    def _new_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize
+        )
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["Accept-Encoding"] = _get_accept_encoding()
+        session.headers.update(self.headers)
+        if not self.keep_alive:
+            session.headers["Connection"] = "close"
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        """The session for the current thread and process."""
+        pid = os.getpid()
+        local = self._local
+        if getattr(local, "pid", None) != pid:
+            # first use in this thread, or sockets inherited from the parent process
+            logger.debug(
+                f"Creating new session for thread {threading.get_ident()} of process "
+                f"{pid}"
+            )
+            local.session = self._new_session()
+            local.pid = pid
+            with self._lock:
+                self._sessions[local.session] = pid
+        return local.session
+
+    def post(self, url, json=None, timeout=None, stream=False) -> requests.Response:
+        """
+        Send a POST request, transient errors are retried according to the retry policy.
+        The response of the last attempt is returned, or the exception is raised. With
+        `stream=True` the body is not downloaded yet, the caller should close the
+        response.
+        """
+        kwargs = {"json": json}
+        if self.compress_requests and json is not None:
+            kwargs = {
+                "data": gzip.compress(_json_dumps(json).encode()),
+                "headers": {
+                    "Content-Type": "application/json",
+                    "Content-Encoding": "gzip",
+                },
+            }
+        attempt = 1
+        while True:
+            resp, error = None, None
+            self._count("requests")
+            try:
+                with self._limit():
+                    resp = self.session.post(
+                        url, timeout=timeout, stream=stream, **kwargs
+                    )
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout,
+                requests.exceptions.ChunkedEncodingError,
+            ) as e:
+                error = e
+
+            if error is None and resp.status_code not in self.retry.retry_status:
+                return resp
+            if attempt >= self.retry.max_attempts:
+                if error is not None:
+                    raise error
+                return resp
+
+            reason = (
+                repr(error)
+                if error is not None
+                else f"{resp.status_code} {resp.reason}"
+            )
+            delay = self.retry.backoff(attempt, retry_after=_get_retry_after(resp))
+            logger.warning(
+                f"Attempt {attempt} of {self.retry.max_attempts} failed with {reason}, "
+                f"retrying in {delay:.1f} seconds"
+            )
+            self._count("retries")
+            if resp is not None:
+                # release the connection of a streamed response
+                resp.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def record_transfer(self, resp: requests.Response, nbytes: int):
+        """
+        Record the number of bytes of the response, after its body was read. The number
+        of `nbytes` that were decoded from the body is compared to the number of
+        compressed bytes that were transferred.
+        """
+        try:
+            # the number of bytes read from the connection, before decoding
+            ncompressed = resp.raw.tell()
+        except AttributeError:
+            ncompressed = nbytes
+        encoding = resp.headers.get("Content-Encoding", "identity")
+        logger.debug(
+            f"Received {ncompressed} bytes ({encoding}), decoded to {nbytes} bytes "
+            f"from {resp.url}"
+        )
+        self._count("bytes_compressed", ncompressed)
+        self._count("bytes_decompressed", nbytes)
+
+    def close(self):
+        """Close the sessions of all threads and their connections."""
+        pid = os.getpid()
+        with self._lock:
+            sessions = [x for x, x_pid in self._sessions.items() if x_pid == pid]
+            self._sessions = weakref.WeakKeyDictionary()
+            # the threads create a new session on their next request
+            self._local = threading.local()
+        for session in sessions:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_default_client() -> Client:
+    """Return the client that is used if no client is passed to ddlpy functions."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = Client()
+    return _default_client
@@ -3,19 +3,58 @@
 """Main module."""
 import os
 import json
+import glob
+import pickle
+import hashlib
+import time
+import threading
 import pathlib
 import logging
-import requests
 import pandas as pd
 import pytz
 import tqdm
 import dateutil
 import numpy as np
-import platformdirs
-
-from .utils import date_series
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+from .utils import date_series, date_series_packed, _get_cachedir
+from .client import Client, get_default_client
+from .cache import ChunkCache, _get_request_key
+from .locking import FileLock, _atomic_write
+
+try:
+    # faster parsing of the responses, if available
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+try:
+    # streaming parser for measurements(stream=True)
+    import ijson
+except ImportError:
+    ijson = None
 
 BASE_URL = "https://waterwebservices.rijkswaterstaat.nl/"
+# maximum number of concurrent requests per ddlpy.measurements() call, to avoid
+# overloading the Waterwebservices
+MAX_WORKERS = 8
+# the Waterwebservices return an error if more than 160000 observations are requested,
+# freq="auto" in ddlpy.measurements() stays below this limit with some margin
+MAX_OBSERVATIONS = 150000
+# version of the cached locations DataFrame, increase it if _locations_from_catalog()
+# changes so old caches are not used
+LOCATIONS_CACHE_VERSION = 1
+# the number of hours the catalog is cached, which corresponds to the update frequency
+# of the Waterwebservices catalog, for the default and for other catalog filters
+CATALOG_CACHE_HOURS = 4
+CATALOG_FILTER_CACHE_HOURS = 4
+# the maximum number of catalogs with other catalog filters that are cached
+CATALOG_FILTER_CACHE_MAXSIZE = 8
+# the Groeperingsperiode of OphalenAantalWaarnemingen is in Dutch winter time
+TZ_GROEPERINGSPERIODE = pytz.FixedOffset(60)
+# maximum number of locations per request when passing a DataFrame of locations
+BATCH_SIZE = 100
 ENDPOINTS_PATH = pathlib.Path(__file__).with_name("endpoints.json")
 logger = logging.getLogger(__name__)
 
@@ -27,98 +66,247 @@ class NoDataError(ValueError):
     pass
 
 
-def _send_post_request(url, request, timeout=None):
-    logger.debug("Requesting at {} with request: {}".format(url, json.dumps(request)))
-    resp = requests.post(url, json=request, timeout=timeout)
+class ObservationLimitError(IOError):
+    pass
+
 
-    if not resp.ok:
+def _raise_for_status(status_code, reason, text):
+    if status_code == 400 and "Het maximaal aantal waarnemingen" in text:
+        # "Het maximaal aantal waarnemingen (160000) is overschreden" is raised here, but
+        # catched in ddlpy.ddlpy.measurements() so the period can be split.
+        raise ObservationLimitError(f"{status_code} {reason}: {text}")
+
+    if status_code >= 400:
         # in case of for instance
         # resp.status_code: 400, resp.reason: Bad Request, resp.text: {"Succesvol":false,"Foutmelding":"Het maximaal aantal waarnemingen (160000) is overschreden. Beperk uw request.","WaarnemingenLijst":[]}
         # resp.status_code: 500, resp.reason: Internal Server Error
-        raise IOError(f"{resp.status_code} {resp.reason}: {resp.text}")
+        raise IOError(f"{status_code} {reason}: {text}")
 
-    if resp.status_code == 204:
+    if status_code == 204:
         # "204 No Content" is raised here, but catched in ddlpy.ddlpy.measurements() so the process can continue.
-        raise NoDataError(f"{resp.status_code} {resp.reason}: {resp.text}")
+        raise NoDataError(f"{status_code} {reason}: {text}")
 
-    result = resp.json()
-    return result
 
+def _send_post_request(url, request, timeout=None, client=None):
+    if client is None:
+        client = get_default_client()
+    logger.debug("Requesting at {} with request: {}".format(url, json.dumps(request)))
+    resp = client.post(url, json=request, timeout=timeout)
+    client.record_transfer(resp, len(resp.content))
+
+    _raise_for_status(resp.status_code, resp.reason, resp.text)
+
+    result = _json_loads(resp.content)
+    return result
 
-def catalog(catalog_filter=None):
-    endpoint = ENDPOINTS["collect_catalogue"]
 
+def _send_post_request_stream(url, request, location, timeout=None, client=None):
+    """
+    Like _send_post_request, but the WaarnemingenLijst is parsed incrementally from
+    the response with ijson and converted to a DataFrame like _combine_waarnemingenlijst.
+    """
+    if client is None:
+        client = get_default_client()
+    logger.debug("Requesting at {} with request: {}".format(url, json.dumps(request)))
+    resp = client.post(url, json=request, timeout=timeout, stream=True)
+    try:
+        if resp.status_code != 200:
+            _raise_for_status(resp.status_code, resp.reason, resp.text)
+        # decompress the raw stream if the response is gzipped
+        resp.raw.decode_content = True
+        stream = _CountingReader(resp.raw)
+        dfs = list(_iter_waarnemingen_stream(stream))
+        client.record_transfer(resp, stream.nbytes)
+    finally:
+        resp.close()
+    return _combine_dataframes(dfs, location)
+
+
+class _CountingReader:
+    """file-like wrapper that counts the number of bytes that are read"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.nbytes = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.nbytes += len(data)
+        return data
+
+
+def _get_request_catalog(catalog_filter=None):
     if catalog_filter is None:
         # use the default request from endpoints.json
-        request = endpoint["request"]
+        request = ENDPOINTS["collect_catalogue"]["request"]
     else:
         assert isinstance(catalog_filter, list)
         request = {"CatalogusFilter": {x: True for x in catalog_filter}}
+    return request
 
-    result = _send_post_request(endpoint["url"], request, timeout=None)
+
+def catalog(catalog_filter=None, client: Client = None):
+    endpoint = ENDPOINTS["collect_catalogue"]
+
+    request = _get_request_catalog(catalog_filter)
+
+    result = _send_post_request(endpoint["url"], request, timeout=None, client=client)
 
     return result
 
 
-def get_catalogfile_cache(catalog_filter):
-    # create cache dir like %USERPROFILE%/AppData/Local/ddlpy/Cache
-    cachedir = os.path.join(platformdirs.user_cache_dir(), "ddlpy", "Cache")
-    os.makedirs(cachedir, exist_ok=True)
-    catalogfile = os.path.join(cachedir, "locations_default_catalog_filter.json")
+def _get_catalog_filter_name(catalog_filter):
+    """return the part of the cache filenames that identifies the catalog_filter"""
+    if catalog_filter is None:
+        return "default_catalog_filter"
+    # the order and duplicates do not matter for the CatalogusFilter
+    normalized = json.dumps(sorted(set(catalog_filter)))
+    return "catalog_filter_" + hashlib.sha256(normalized.encode()).hexdigest()[:16]
+
 
-    # only allow to load catalog from cache if the default catalog_filter was used,
-    # if the cachefile is present and if it is less than 4 hours old
+def _get_cachefile(extension, catalog_filter):
+    name = _get_catalog_filter_name(catalog_filter)
+    cachefile = os.path.join(_get_cachedir(), f"locations_{name}.{extension}")
+
+    # only allow to load from cache if the cachefile is present and if it is not
+    # older than the maximum number of hours for this catalog_filter
+    if catalog_filter is None:
+        max_hours = CATALOG_CACHE_HOURS
+    else:
+        max_hours = CATALOG_FILTER_CACHE_HOURS
     use_cache = False
-    if catalog_filter is None and os.path.exists(catalogfile):
-        cache_mtime = os.path.getmtime(catalogfile)
+    if os.path.exists(cachefile):
+        cache_mtime = os.path.getmtime(cachefile)
         cache_mtime_dt = pd.Timestamp.fromtimestamp(cache_mtime)
         tdiff_hours = (pd.Timestamp.now() - cache_mtime_dt).total_seconds() / 3600
-        if tdiff_hours < 4:
+        if tdiff_hours < max_hours:
             use_cache = True
-    return catalogfile, use_cache
+    return cachefile, use_cache
 
 
-def retrieve_or_load_catalog(catalog_filter: list = None):
-    catalogfile, use_cache = get_catalogfile_cache(catalog_filter=catalog_filter)
+def get_catalogfile_cache(catalog_filter):
+    return _get_cachefile("json", catalog_filter)
 
-    # load or retrieve the catalog
-    if use_cache:
-        logger.info("Loading Waterwebservices catalog from cache")
-        with open(catalogfile, "r") as f:
-            result = json.load(f)
-    else:
-        logger.info("Retrieving Waterwebservices catalog, this can take 30 seconds")
-        result = catalog(catalog_filter=catalog_filter)
-        if catalog_filter is None:
-            # only write the catalogfile if the default catalog_filter was used
-            with open(catalogfile, "w") as f:
-                json.dump(result, f)
+
+def get_locationsfile_cache(catalog_filter):
+    return _get_cachefile("pickle", catalog_filter)
+
+
+def _get_mtimes(paths):
+    """return the modification time of the paths, skipping the removed files"""
+    mtimes = {}
+    for path in paths:
+        try:
+            mtimes[path] = os.path.getmtime(path)
+        except FileNotFoundError:
+            # removed by another process since globbing
+            pass
+    return mtimes
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _evict_catalogfiles():
+    """remove the oldest cached catalogs with other catalog filters"""
+    pattern = os.path.join(_get_cachedir(), "locations_catalog_filter_*.json")
+    mtimes = _get_mtimes(glob.glob(pattern))
+    catalogfiles = sorted(mtimes, key=mtimes.get)
+    nevict = len(catalogfiles) - CATALOG_FILTER_CACHE_MAXSIZE
+    for catalogfile in catalogfiles[: max(nevict, 0)]:
+        # skip the catalogs that another process is retrieving
+        lock = FileLock(f"{catalogfile}.lock")
+        if not lock.acquire(blocking=False):
+            continue
+        logger.debug(f"Removing cached catalog {catalogfile}")
+        try:
+            _remove_file(catalogfile)
+            _remove_file(os.path.splitext(catalogfile)[0] + ".pickle")
+        finally:
+            lock.release()
+        _remove_file(lock.path)
+
+
+def _load_catalogfile(catalogfile):
+    logger.info("Loading Waterwebservices catalog from cache")
+    with open(catalogfile, "r") as f:
+        result = json.load(f)
     return result
 
 
-def locations(catalog_filter: list = None) -> pd.DataFrame:
-    """
-    Get station information from DDL (metadata from Catalogue). It conains all metadata
-    regarding stations. The catalog is locally cached for maximum 4 hours, corresponding
-    to the update frequency of the Waterwebservices catalog. If you want to avoid using
-    the cache, pass a valid `catalog_filter` or delete the caching file manually.
+def _load_catalogfile_mtime(catalogfile):
+    """return the cached catalog and its modification time"""
+    catalog_mtime = os.path.getmtime(catalogfile)
+    return _load_catalogfile(catalogfile), catalog_mtime
 
-    Parameters
-    ----------
-    catalog_filter : list, optional
-        list of catalogs to pass on to OphalenCatalogus CatalogusFilter,
-        if None the list form endpoints.json is retrieved. The cache cannot be used when
-        passing anything other than None. The default is None.
 
-    Returns
-    -------
-    pd.DataFrame
-        DataFrame with a combination of available locations and measurements.
+def _write_catalogfile(catalogfile, result, catalog_filter):
+    def write(path):
+        with open(path, "w") as f:
+            json.dump(result, f)
+
+    _atomic_write(catalogfile, write)
+    if catalog_filter is not None:
+        _evict_catalogfiles()
 
+
+def _lock_catalogfile(catalogfile, stale_while_revalidate):
+    """
+    Acquire the lock for refreshing the cached catalog, so only one process retrieves
+    the catalog and the others wait for it. Returns None without waiting if another
+    process is refreshing it and the stale catalog may be used.
     """
+    lock = FileLock(f"{catalogfile}.lock")
+    if stale_while_revalidate and os.path.exists(catalogfile):
+        if lock.acquire(blocking=False):
+            return lock
+        logger.info(
+            "Another process is retrieving the Waterwebservices catalog, "
+            "using the outdated catalog from cache"
+        )
+        return None
+    lock.acquire()
+    return lock
+
+
+def _retrieve_or_load_catalog(catalog_filter, client, stale_while_revalidate):
+    """like retrieve_or_load_catalog, but also return the modification time"""
+    catalogfile, use_cache = get_catalogfile_cache(catalog_filter=catalog_filter)
+    if use_cache:
+        return _load_catalogfile_mtime(catalogfile)
+
+    lock = _lock_catalogfile(catalogfile, stale_while_revalidate)
+    if lock is None:
+        return _load_catalogfile_mtime(catalogfile)
+    try:
+        # another process might have retrieved the catalog while we were waiting
+        catalogfile, use_cache = get_catalogfile_cache(catalog_filter=catalog_filter)
+        if use_cache:
+            return _load_catalogfile_mtime(catalogfile)
+        logger.info("Retrieving Waterwebservices catalog, this can take 30 seconds")
+        result = catalog(catalog_filter=catalog_filter, client=client)
+        _write_catalogfile(catalogfile, result, catalog_filter)
+    finally:
+        lock.release()
+    return result, os.path.getmtime(catalogfile)
 
-    result = retrieve_or_load_catalog(catalog_filter=catalog_filter)
 
+def retrieve_or_load_catalog(
+    catalog_filter: list = None,
+    client: Client = None,
+    stale_while_revalidate: bool = False,
+):
+    result, _ = _retrieve_or_load_catalog(
+        catalog_filter, client=client, stale_while_revalidate=stale_while_revalidate
+    )
+    return result
+
+
+def _locations_from_catalog(result):
     df_locations = pd.DataFrame(result["LocatieLijst"])
 
     df_metadata = pd.json_normalize(result["AquoMetadataLijst"])
@@ -137,6 +325,165 @@ def locations(catalog_filter: list = None) -> pd.DataFrame:
     return merged.set_index("Code")
 
 
+def _load_locationsfile(catalog_filter):
+    """
+    Return the processed locations DataFrame from the cache and the modification time
+    of the catalog it was derived from, or None, None if it is not present, too old or
+    written by another version of ddlpy or pandas.
+    """
+    locationsfile, use_cache = get_locationsfile_cache(catalog_filter=catalog_filter)
+    if not use_cache:
+        return None, None
+    try:
+        catalog_mtime = os.path.getmtime(locationsfile)
+        with open(locationsfile, "rb") as f:
+            cached = pickle.load(f)
+    except Exception as e:
+        logger.debug(f"Could not load locations from cache: {e!r}")
+        return None, None
+    if (
+        not isinstance(cached, dict)
+        or cached.get("version") != LOCATIONS_CACHE_VERSION
+        or cached.get("pandas") != pd.__version__
+    ):
+        logger.debug("Ignoring locations cache of another version")
+        return None, None
+    logger.info("Loading locations from cache")
+    return cached["locations"], catalog_mtime
+
+
+CacheInfo = collections.namedtuple("CacheInfo", ["hits", "misses", "currsize"])
+
+
+class _LocationsMemo:
+    """
+    In-memory cache of the locations DataFrame per catalog_filter, the DataFrames
+    expire at the same time as the cached catalog they were derived from.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # catalog filter name: (locations, catalog modification time)
+        self._memo = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, catalog_filter):
+        """return a copy of the memoized locations, or None"""
+        if catalog_filter is None:
+            max_hours = CATALOG_CACHE_HOURS
+        else:
+            max_hours = CATALOG_FILTER_CACHE_HOURS
+        name = _get_catalog_filter_name(catalog_filter)
+        with self._lock:
+            df_locations, catalog_mtime = self._memo.get(name, (None, None))
+            if df_locations is not None and (
+                time.time() - catalog_mtime >= max_hours * 3600
+            ):
+                del self._memo[name]
+                df_locations = None
+            if df_locations is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        # the caller may modify the DataFrame
+        return df_locations.copy()
+
+    def put(self, catalog_filter, df_locations, catalog_mtime):
+        name = _get_catalog_filter_name(catalog_filter)
+        with self._lock:
+            self._memo[name] = (df_locations.copy(), catalog_mtime)
+
+    def cache_clear(self):
+        """Remove the locations from the in-memory cache, the cache files are kept."""
+        with self._lock:
+            self._memo.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def cache_info(self) -> CacheInfo:
+        """Return the number of hits and misses and the number of cached DataFrames."""
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, len(self._memo))
+
+
+_locations_memo = _LocationsMemo()
+
+
+def _write_locationsfile(df_locations, catalog_filter, catalog_mtime):
+    locationsfile, _ = get_locationsfile_cache(catalog_filter=catalog_filter)
+    cached = {
+        "version": LOCATIONS_CACHE_VERSION,
+        "pandas": pd.__version__,
+        "locations": df_locations,
+    }
+
+    def write(path):
+        with open(path, "wb") as f:
+            pickle.dump(cached, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # the locations are as old as the catalog they were derived from, so the
+        # cached locations expire at the same time as the cached catalog
+        os.utime(path, (catalog_mtime, catalog_mtime))
+
+    _atomic_write(locationsfile, write)
+
+
+def locations(
+    catalog_filter: list = None,
+    client: Client = None,
+    stale_while_revalidate: bool = False,
+) -> pd.DataFrame:
+    """
+    Get station information from DDL (metadata from Catalogue). It conains all metadata
+    regarding stations. The catalog and the resulting DataFrame are locally cached for
+    maximum 4 hours, corresponding to the update frequency of the Waterwebservices
+    catalog. The DataFrames are also kept in memory until the catalog expires, use
+    `ddlpy.locations.cache_clear()` to remove them and `ddlpy.locations.cache_info()`
+    for the number of hits and misses. The catalogs of other catalog filters are also
+    cached, the least recently
+    retrieved are removed if more than `CATALOG_FILTER_CACHE_MAXSIZE` are cached. If you
+    want to avoid using the cache, delete the caching files manually. The cache can be
+    shared by multiple processes, only one of them retrieves an expired catalog.
+
+    Parameters
+    ----------
+    catalog_filter : list, optional
+        list of catalogs to pass on to OphalenCatalogus CatalogusFilter,
+        if None the list form endpoints.json is retrieved. The catalog is cached per
+        catalog filter, regardless of the order of the list. The default is None.
+    client : ddlpy.Client, optional
+        Client to send the requests with. The default is None, in which case a shared
+        default client is used.
+    stale_while_revalidate : bool, optional
+        Whether to use the expired cached catalog while another process retrieves the
+        catalog, instead of waiting for it. The default is False.
+
+    Returns
+    -------
+    pd.DataFrame
+        DataFrame with a combination of available locations and measurements.
+
+    """
+    df_locations = _locations_memo.get(catalog_filter)
+    if df_locations is not None:
+        return df_locations
+
+    df_locations, catalog_mtime = _load_locationsfile(catalog_filter)
+    if df_locations is None:
+        result, catalog_mtime = _retrieve_or_load_catalog(
+            catalog_filter, client=client, stale_while_revalidate=stale_while_revalidate
+        )
+        df_locations = _locations_from_catalog(result)
+        _write_locationsfile(df_locations, catalog_filter, catalog_mtime)
+    _locations_memo.put(catalog_filter, df_locations, catalog_mtime)
+    return df_locations
+
+
+# like functools.lru_cache
+locations.cache_clear = _locations_memo.cache_clear
+locations.cache_info = _locations_memo.cache_info
+
+
 def _check_convert_dates(start_date, end_date, return_str=True):
     start_date = pd.Timestamp(start_date)
     end_date = pd.Timestamp(end_date)
@@ -181,29 +528,7 @@ def _get_request_dicts(location):
     return request_dicts
 
 
-def measurements_available(
-    location: pd.Series, start_date: (str, pd.Timestamp), end_date: (str, pd.Timestamp)
-) -> bool:
-    """
-    Checks if there are measurements available for a location in the requested period.
-
-    Parameters
-    ----------
-    location : pd.Series
-        Single row of the `ddlpy.locations()` DataFrame.
-    start_date : (str,pd.Timestamp)
-        The start date of the requested period.
-    end_date : (str,pd.Timestamp)
-        The end date of the requested period.
-
-    Returns
-    -------
-    bool
-        Whether there are measurements available or not.
-
-    """
-    endpoint = ENDPOINTS["check_observations_available"]
-
+def _get_request_available(location, start_date, end_date):
     start_date_str, end_date_str = _check_convert_dates(
         start_date, end_date, return_str=True
     )
@@ -215,10 +540,10 @@ def measurements_available(
         "LocatieLijst": [request_dicts["Locatie"]],
         "Periode": {"Begindatumtijd": start_date_str, "Einddatumtijd": end_date_str},
     }
+    return request
 
-    result = _send_post_request(endpoint["url"], request, timeout=5)
 
-    # continue if request was successful
+def _parse_available(result):
     logger.debug("Got response: {}".format(result))
     if result["WaarnemingenAanwezig"] == "true":
         return True
@@ -226,39 +551,115 @@ def measurements_available(
         return False
 
 
-def measurements_amount(
-    location: pd.Series,
+def _get_location_key(location):
+    """return a hashable key of the AquoMetadata and the location code of a row"""
+    request_dicts = _get_request_dicts(location)
+    aquometadata_key = json.dumps(request_dicts["AquoMetadata"], sort_keys=True)
+    return aquometadata_key, request_dicts["Locatie"]["Code"]
+
+
+def _iter_location_batches(locations, batch_size):
+    """
+    Yield the rows of the locations DataFrame in batches of at most batch_size rows,
+    where all rows in a batch have the same AquoMetadata. Yields the AquoMetadata key
+    and a dict with the location codes and rows of the batch.
+    """
+    batches = {}
+    for _, location in locations.iterrows():
+        aquometadata_key, code = _get_location_key(location)
+        batch = batches.setdefault(aquometadata_key, {})
+        # duplicated locations would result in duplicated requests
+        batch.setdefault(code, location)
+
+    for aquometadata_key, batch in batches.items():
+        items = list(batch.items())
+        for start in range(0, len(items), batch_size):
+            stop = start + batch_size
+            yield aquometadata_key, dict(items[start:stop])
+
+
+def _get_request_batch(request, codes):
+    """replace the location in a request for a single location by multiple locations"""
+    return dict(request, LocatieLijst=[{"Code": code} for code in codes])
+
+
+def _measurements_available_batched(
+    locations, start_date, end_date, batch_size=BATCH_SIZE, client=None
+):
+    """
+    Returns a boolean Series with whether there are measurements available for each
+    row of the locations DataFrame. CheckWaarnemingenAanwezig returns a single value
+    for all requested locations, so the availability is derived from the number of
+    measurements per location instead, which is returned in one request per batch.
+    """
+    df_amount = _measurements_amount_batched(
+        locations,
+        start_date,
+        end_date,
+        period="Jaar",
+        batch_size=batch_size,
+        client=client,
+    )
+    available = df_amount.sum(axis=1) > 0
+    available.name = None
+    return available
+
+
+def measurements_available(
+    location: (pd.Series, pd.DataFrame),
     start_date: (str, pd.Timestamp),
     end_date: (str, pd.Timestamp),
-    period: str = "Jaar",
-) -> pd.DataFrame:
+    batch_size: int = BATCH_SIZE,
+    client: Client = None,
+) -> (bool, pd.Series):
     """
-    Retrieves the amount of measurements available for a location for the requested period.
+    Checks if there are measurements available for a location in the requested period.
 
     Parameters
     ----------
-    location : pd.Series
-        Single row of the `ddlpy.locations()` DataFrame.
+    location : pd.Series, pd.DataFrame
+        Single row of the `ddlpy.locations()` DataFrame. Can also be multiple rows, in
+        which case the locations with the same AquoMetadata are checked in batched
+        requests to retrieve the number of measurements per location.
     start_date : (str,pd.Timestamp)
         The start date of the requested period.
     end_date : (str,pd.Timestamp)
         The end date of the requested period.
-    period : str, optional
-        "Jaar", "Maand" or "Dag". The default is "Jaar".
+    batch_size : int, optional
+        The maximum number of locations per request, only used if location is a
+        DataFrame. The default is `ddlpy.ddlpy.BATCH_SIZE`.
+    client : ddlpy.Client, optional
+        Client to send the requests with. The default is None, in which case a shared
+        default client is used.
 
     Returns
     -------
-    df_amount : pd.DataFrame
-        A DataFrame with the number of mesurements (AantalMetingen) per period (Groeperingsperiode).
+    bool, pd.Series
+        Whether there are measurements available or not. A boolean Series with the
+        index of the locations DataFrame if multiple locations were passed.
 
     """
+    if isinstance(location, pd.DataFrame):
+        return _measurements_available_batched(
+            location, start_date, end_date, batch_size=batch_size, client=client
+        )
+
+    endpoint = ENDPOINTS["check_observations_available"]
+
+    request = _get_request_available(location, start_date, end_date)
+
+    result = _send_post_request(endpoint["url"], request, timeout=5, client=client)
+
+    # continue if request was successful
+    return _parse_available(result)
+
+
+def _get_request_amount(location, start_date, end_date, period):
     # TODO: there are probably more Groeperingsperiodes accepted by ddl, but not supported by ddlpy yet
     accepted_period = ["Jaar", "Maand", "Dag"]
     if period not in accepted_period:
         raise ValueError(f"period should be one of {accepted_period}, not '{period}'")
 
-    endpoint = ENDPOINTS["collect_number_of_observations"]
-
     start_date_str, end_date_str = _check_convert_dates(
         start_date, end_date, return_str=True
     )
@@ -271,10 +672,10 @@ def measurements_amount(
         "Groeperingsperiode": period,
         "Periode": {"Begindatumtijd": start_date_str, "Einddatumtijd": end_date_str},
     }
+    return request
 
-    result = _send_post_request(endpoint["url"], request, timeout=None)
 
-    # continue if request was successful
+def _parse_amount(result, period):
     df_list = []
     for one in result["AantalWaarnemingenPerPeriodeLijst"]:
         df = pd.json_normalize(one["AantalMetingenPerPeriodeLijst"])
@@ -310,41 +711,336 @@ def measurements_amount(
     return df_amount
 
 
-def _combine_waarnemingenlijst(result, location):
-    assert "WaarnemingenLijst" in result
+def _measurements_amount_batched(
+    locations, start_date, end_date, period, batch_size=BATCH_SIZE, client=None
+):
+    """
+    Returns a DataFrame with the number of measurements for each row of the locations
+    DataFrame (rows) and each period (columns).
+    """
+    endpoint = ENDPOINTS["collect_number_of_observations"]
+
+    amounts = {}
+    for aquometadata_key, locations_batch in _iter_location_batches(
+        locations, batch_size
+    ):
+        location = next(iter(locations_batch.values()))
+        request = _get_request_amount(location, start_date, end_date, period=period)
+        request = _get_request_batch(request, locations_batch)
+        try:
+            result = _send_post_request(
+                endpoint["url"], request, timeout=None, client=client
+            )
+        except NoDataError:
+            continue
+
+        # split the response in the amounts per location, a location can have
+        # multiple blocks, for instance if the WaardeBepalingsmethode changes
+        for one in result["AantalWaarnemingenPerPeriodeLijst"]:
+            code = one["Locatie"]["Code"]
+            result_location = {"AantalWaarnemingenPerPeriodeLijst": [one]}
+            df_amount = _parse_amount(result_location, period=period)
+            amounts.setdefault((aquometadata_key, code), []).append(
+                df_amount["AantalMetingen"]
+            )
+
+    # sum duplicated periods like _parse_amount
+    amounts = {
+        key: pd.concat(amount_list).groupby(level=0).sum()
+        for key, amount_list in amounts.items()
+    }
+    keys = [_get_location_key(location) for _, location in locations.iterrows()]
+    df_amount = pd.DataFrame(
+        [amounts.get(key, pd.Series(dtype=np.int64)) for key in keys],
+        index=locations.index,
+    )
+    # locations without measurements in a period have none
+    df_amount = df_amount.fillna(0).astype(np.int64).sort_index(axis=1)
+    df_amount.columns.name = "Groeperingsperiode"
+    return df_amount
+
+
+def measurements_amount(
+    location: (pd.Series, pd.DataFrame),
+    start_date: (str, pd.Timestamp),
+    end_date: (str, pd.Timestamp),
+    period: str = "Jaar",
+    batch_size: int = BATCH_SIZE,
+    client: Client = None,
+) -> pd.DataFrame:
+    """
+    Retrieves the amount of measurements available for a location for the requested period.
+
+    Parameters
+    ----------
+    location : pd.Series, pd.DataFrame
+        Single row of the `ddlpy.locations()` DataFrame. Can also be multiple rows, in
+        which case the locations with the same AquoMetadata are combined in batched
+        requests.
+    start_date : (str,pd.Timestamp)
+        The start date of the requested period.
+    end_date : (str,pd.Timestamp)
+        The end date of the requested period.
+    period : str, optional
+        "Jaar", "Maand" or "Dag". The default is "Jaar".
+    batch_size : int, optional
+        The maximum number of locations per request, only used if location is a
+        DataFrame. The default is `ddlpy.ddlpy.BATCH_SIZE`.
+    client : ddlpy.Client, optional
+        Client to send the requests with. The default is None, in which case a shared
+        default client is used.
+
+    Returns
+    -------
+    df_amount : pd.DataFrame
+        A DataFrame with the number of mesurements (AantalMetingen) per period (Groeperingsperiode).
+        If multiple locations were passed, a DataFrame with the index of the locations
+        DataFrame and a column with the number of measurements per period.
+
+    """
+    if isinstance(location, pd.DataFrame):
+        return _measurements_amount_batched(
+            location,
+            start_date,
+            end_date,
+            period=period,
+            batch_size=batch_size,
+            client=client,
+        )
+
+    endpoint = ENDPOINTS["collect_number_of_observations"]
+
+    request = _get_request_amount(location, start_date, end_date, period=period)
+
+    result = _send_post_request(endpoint["url"], request, timeout=None, client=client)
+
+    # continue if request was successful
+    return _parse_amount(result, period=period)
+
+
+def _columns_from_records(records):
+    """
+    Convert a list of dicts to a dict of lists, keys that are missing in some of the
+    dicts get nan values like in pd.json_normalize. Also returns whether all dicts
+    have the same keys.
+    """
+    try:
+        keys = records[0].keys()
+        regular = all(map(keys.__eq__, map(dict.keys, records)))
+    except (AttributeError, TypeError):
+        # some of the records are not a dict
+        regular = False
+    if regular:
+        # all records have the same keys, this is what the Waterwebservices return
+        columns = {key: [record[key] for record in records] for key in keys}
+        return columns, True
+
+    keys = dict.fromkeys(
+        key for record in records if isinstance(record, dict) for key in record
+    )
+    columns = {
+        key: [
+            record.get(key, np.nan) if isinstance(record, dict) else np.nan
+            for record in records
+        ]
+        for key in keys
+    }
+    return columns, False
+
+
+def _flatten_dict(value, prefix):
+    """flatten a nested dict depth-first, like pd.json_normalize"""
+    flat = {}
+    for key, val in value.items():
+        if isinstance(val, dict):
+            flat.update(_flatten_dict(val, prefix=f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = val
+    return flat
+
+
+def _key_patterns(metingen):
+    """
+    Return the plain and the nested keys of each meting without duplicates, in order
+    of first occurrence, to reproduce the column order of pd.json_normalize.
+    """
+    patterns = {}
+    for meting in metingen:
+        flat = ["WaarnemingMetadata." + key for key in meting["WaarnemingMetadata"]]
+        nested = []
+        for key, val in meting.items():
+            if key == "WaarnemingMetadata":
+                continue
+            elif isinstance(val, dict):
+                nested += [f"{key}.{sub_key}" for sub_key in val]
+            else:
+                flat.append(key)
+        patterns[(tuple(flat), tuple(nested))] = None
+    return patterns
+
+
+def _metingen_columns(metingen):
+    """
+    Convert the MetingenLijst to plain columns and nested columns (Meetwaarde), since
+    pd.json_normalize places the plain values first and the flattened dicts last. Also
+    returns the key patterns of the metingen.
+    """
+    columns, regular = _columns_from_records(metingen)
+
+    flat = {}
+    nested = {}
+
+    # metadata is a list of 1 value, flatten it
+    metadata, regular_i = _columns_from_records(columns.pop("WaarnemingMetadata"))
+    regular &= regular_i
+    for key, column in metadata.items():
+        flat["WaarnemingMetadata." + key] = column
+
+    # add remaining data, Meetwaarde is a dict
+    for key, column in columns.items():
+        if any(isinstance(value, dict) for value in column):
+            sub_columns, regular_i = _columns_from_records(column)
+            regular &= regular_i
+            for sub_key, sub_column in sub_columns.items():
+                nested[f"{key}.{sub_key}"] = sub_column
+        else:
+            flat[key] = column
+
+    # all metingen have the same keys if regular
+    patterns = _key_patterns(metingen[:1] if regular else metingen)
+    return flat, nested, patterns
 
-    # flatten the datastructure
-    rows = []
-    for waarneming in result["WaarnemingenLijst"]:
-        for row in waarneming["MetingenLijst"]:
-            # metadata is a list of 1 value, flatten it
-            new_row = {}
-            for key, value in row["WaarnemingMetadata"].items():
-                new_key = "WaarnemingMetadata." + key
-                new_row[new_key] = value
-
-            # add remaining data
-            for key, val in row.items():
-                if key == "WaarnemingMetadata":
-                    continue
-                new_row[key] = val
-
-            # add metadata
-            for key, val in waarneming["AquoMetadata"].items():
-                if isinstance(val, dict) and "Code" in val and "Omschrijving" in val:
-                    # some values have a code/omschrijving pair, flatten them
-                    new_key = key + ".Code"
-                    new_val = val["Code"]
-                    new_row[new_key] = new_val
-
-                    new_key = key + ".Omschrijving"
-                    new_val = val["Omschrijving"]
-                    new_row[new_key] = new_val
+
+def _waarneming_dataframe(flat, nested, patterns, nrows, aquometadata):
+    """
+    Combine the columns of the MetingenLijst with the AquoMetadata, which is the same
+    for all metingen and is added as constant columns.
+    """
+    constants = {}
+    nested_constants = {}
+    for key, val in aquometadata.items():
+        if isinstance(val, dict) and "Code" in val and "Omschrijving" in val:
+            # some values have a code/omschrijving pair, flatten them
+            constants[key + ".Code"] = val["Code"]
+            constants[key + ".Omschrijving"] = val["Omschrijving"]
+        elif isinstance(val, dict):
+            nested_constants.update(_flatten_dict(val, prefix=key + "."))
+        else:
+            constants[key] = val
+
+    # scalars are broadcasted by pandas, other values are repeated for every row
+    flat = dict(flat)
+    nested = dict(nested)
+    for columns, values in [(flat, constants), (nested, nested_constants)]:
+        for key, val in values.items():
+            columns[key] = val if pd.api.types.is_scalar(val) else [val] * nrows
+
+    df = pd.DataFrame({**flat, **nested}, index=pd.RangeIndex(nrows))
+    if len(patterns) > 1:
+        # not all metingen have the same keys, order the columns by first occurrence
+        order = {}
+        for flat_keys, nested_keys in patterns:
+            order.update(dict.fromkeys(flat_keys + tuple(constants) + nested_keys))
+            order.update(dict.fromkeys(nested_constants))
+        df = df[[key for key in order if key in df.columns]]
+    return df
+
+
+def _combine_waarneming(waarneming):
+    """
+    Convert a single waarneming to a DataFrame. The MetingenLijst is converted to
+    columns and the AquoMetadata, which is the same for all metingen, is added as
+    constant columns.
+    """
+    metingen = waarneming["MetingenLijst"]
+    flat, nested, patterns = _metingen_columns(metingen)
+    return _waarneming_dataframe(
+        flat, nested, patterns, len(metingen), waarneming["AquoMetadata"]
+    )
+
+
+class _MetingenBuffer:
+    """Columns of a MetingenLijst that is converted in batches of metingen."""
+
+    def __init__(self):
+        self.flat = {}
+        self.nested = {}
+        self.patterns = {}
+        self.nrows = 0
+
+    def extend(self, metingen):
+        flat, nested, patterns = _metingen_columns(metingen)
+        nrows = self.nrows + len(metingen)
+        for columns, columns_new in [(self.flat, flat), (self.nested, nested)]:
+            for key, column in columns_new.items():
+                columns.setdefault(key, [np.nan] * self.nrows).extend(column)
+            # keys that are missing in this batch get nan values
+            for column in columns.values():
+                column.extend([np.nan] * (nrows - len(column)))
+        self.patterns.update(patterns)
+        self.nrows = nrows
+
+    def to_dataframe(self, aquometadata):
+        return _waarneming_dataframe(
+            self.flat, self.nested, self.patterns, self.nrows, aquometadata
+        )
+
+
+def _iter_waarnemingen_stream(stream, batch_size=10000):
+    """
+    Parse the WaarnemingenLijst of an OphalenWaarnemingen response incrementally from
+    a file-like object with ijson and yield a DataFrame per waarneming. The metingen
+    are converted to columns per batch, so the parsed response is never in memory.
+    """
+    prefix_waarneming = "WaarnemingenLijst.item"
+    prefix_meting = "WaarnemingenLijst.item.MetingenLijst.item"
+    prefix_aquometadata = "WaarnemingenLijst.item.AquoMetadata"
+
+    builder, builder_prefix = None, None
+    buffer, batch, aquometadata = None, [], {}
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if builder is not None:
+            # building a meting or the AquoMetadata
+            builder.event(event, value)
+            if prefix == builder_prefix and event == "end_map":
+                if builder_prefix == prefix_meting:
+                    batch.append(builder.value)
+                    if len(batch) >= batch_size:
+                        buffer.extend(batch)
+                        batch = []
                 else:
-                    new_row[key] = val
-            rows.append(new_row)
-    # normalize and return
-    df = pd.json_normalize(rows)
+                    aquometadata = builder.value
+                builder = None
+        elif event == "start_map" and prefix in [prefix_meting, prefix_aquometadata]:
+            builder = ijson.ObjectBuilder()
+            builder.event(event, value)
+            builder_prefix = prefix
+        elif prefix == prefix_waarneming and event == "start_map":
+            buffer = _MetingenBuffer()
+            batch = []
+            aquometadata = {}
+        elif prefix == prefix_waarneming and event == "end_map":
+            if len(batch) > 0:
+                buffer.extend(batch)
+            # skip waarnemingen without metingen
+            if buffer.nrows > 0:
+                yield buffer.to_dataframe(aquometadata)
+
+
+def _combine_dataframes(dfs, location):
+    """
+    Combine the DataFrames of the waarnemingen, add the location columns and set the
+    time index.
+    """
+    if len(dfs) == 0:
+        df = pd.DataFrame()
+    elif len(dfs) == 1:
+        df = dfs[0]
+    else:
+        df = pd.concat(dfs, ignore_index=True)
+        if any(not df_i.columns.equals(df.columns) for df_i in dfs):
+            # infer the dtypes of columns with missing values like pd.json_normalize
+            df = df.infer_objects()
 
     # add other info
     df["Code"] = location.get("Code", location.name)
@@ -375,10 +1071,19 @@ def _combine_waarnemingenlijst(result, location):
     return df
 
 
-def _measurements_slice(location, start_date, end_date):
-    """get measurements for location, for the period start_date, end_date, use measurements instead"""
-    endpoint = ENDPOINTS["collect_observations"]
+def _combine_waarnemingenlijst(result, location):
+    assert "WaarnemingenLijst" in result
+
+    # convert every waarneming to columns, skip waarnemingen without metingen
+    dfs = [
+        _combine_waarneming(waarneming)
+        for waarneming in result["WaarnemingenLijst"]
+        if len(waarneming["MetingenLijst"]) > 0
+    ]
+    return _combine_dataframes(dfs, location)
+
 
+def _get_request_slice(location, start_date, end_date):
     start_date_str, end_date_str = _check_convert_dates(
         start_date, end_date, return_str=True
     )
@@ -390,11 +1095,188 @@ def _measurements_slice(location, start_date, end_date):
         "Locatie": request_dicts["Locatie"],
         "Periode": {"Begindatumtijd": start_date_str, "Einddatumtijd": end_date_str},
     }
+    return request
 
-    result = _send_post_request(endpoint["url"], request, timeout=None)
 
-    df = _combine_waarnemingenlijst(result, location)
-    return df
+def _measurements_slice(location, start_date, end_date, client=None, stream=False):
+    """get measurements for location, for the period start_date, end_date, use measurements instead"""
+    endpoint = ENDPOINTS["collect_observations"]
+
+    request = _get_request_slice(location, start_date, end_date)
+
+    def retrieve():
+        if stream:
+            return _send_post_request_stream(
+                endpoint["url"], request, location, timeout=None, client=client
+            )
+        result = _send_post_request(
+            endpoint["url"], request, timeout=None, client=client
+        )
+        return _combine_waarnemingenlijst(result, location)
+
+    if client is None:
+        client = get_default_client()
+    if client.coalescer is None:
+        return retrieve()
+
+    # identical requests in flight share the response and the parsed DataFrame, every
+    # caller gets its own copy since the DataFrame is modified afterwards
+    key = _get_request_key({"url": endpoint["url"], "request": request})
+    df = client.coalescer.call(key, retrieve)
+    return df.copy()
+
+
+def _split_period(start_date, end_date):
+    """return the middle of the period, rounded to seconds"""
+    start_date, end_date = _check_convert_dates(start_date, end_date, return_str=False)
+    middle_date = (start_date + (end_date - start_date) / 2).floor("s")
+    if middle_date <= start_date:
+        raise ValueError(f"period from {start_date} to {end_date} cannot be split")
+    return start_date, middle_date, end_date
+
+
+def _measurements_slice_split(
+    location, start_date, end_date, client=None, stream=False
+):
+    """
+    Get measurements like _measurements_slice, but return None if there is no data.
+    If the period contains more observations than allowed by the Waterwebservices, it
+    is split in two halves recursively. Returns the measurements and the number of splits.
+    """
+    try:
+        measurement = _measurements_slice(
+            location,
+            start_date=start_date,
+            end_date=end_date,
+            client=client,
+            stream=stream,
+        )
+        return measurement, 0
+    except NoDataError:
+        return None, 0
+    except ObservationLimitError:
+        start_date, middle_date, end_date = _split_period(start_date, end_date)
+        logger.debug(
+            f"too many observations from {start_date} to {end_date}, "
+            "splitting the period in two"
+        )
+
+    nsplits = 1
+    measurements = []
+    for start_date_i, end_date_i in [
+        (start_date, middle_date),
+        (middle_date, end_date),
+    ]:
+        measurement, nsplits_i = _measurements_slice_split(
+            location,
+            start_date=start_date_i,
+            end_date=end_date_i,
+            client=client,
+            stream=stream,
+        )
+        nsplits += nsplits_i
+        if measurement is not None:
+            measurements.append(measurement)
+
+    if len(measurements) == 0:
+        return None, nsplits
+    return pd.concat(measurements), nsplits
+
+
+def _measurements_slice_cached(
+    location, start_date, end_date, client=None, cache=None, stream=False
+):
+    """
+    Get measurements like _measurements_slice_split, but load them from the cache if
+    they were retrieved before and store them in the cache otherwise.
+    """
+    if cache is None:
+        return _measurements_slice_split(
+            location,
+            start_date=start_date,
+            end_date=end_date,
+            client=client,
+            stream=stream,
+        )
+
+    request = _get_request_slice(location, start_date, end_date)
+    measurement = cache.get(request)
+    if measurement is not None:
+        # an empty DataFrame is cached if there was no data in this period
+        if len(measurement) == 0:
+            measurement = None
+        return measurement, 0
+
+    measurement, nsplits = _measurements_slice_split(
+        location,
+        start_date=start_date,
+        end_date=end_date,
+        client=client,
+        stream=stream,
+    )
+    cache.put(request, measurement)
+    return measurement, nsplits
+
+
+def _check_max_workers(max_workers):
+    """return max_workers limited to MAX_WORKERS, raise if it is smaller than 1"""
+    if max_workers < 1:
+        raise ValueError(f"max_workers should be at least 1, got {max_workers}")
+    if max_workers > MAX_WORKERS:
+        logger.warning(
+            f"max_workers={max_workers} is larger than the allowed maximum, "
+            f"using max_workers={MAX_WORKERS} instead"
+        )
+        max_workers = MAX_WORKERS
+    return max_workers
+
+
+def _iter_measurements_slices(
+    location, date_series_list, max_workers=None, client=None, cache=None, stream=False
+):
+    """
+    Yield the measurements (or None if there is no data) and the number of splits for
+    each period in date_series_list in chronological order. With max_workers>1 the
+    periods are retrieved in parallel with a thread pool.
+    """
+    if max_workers is not None:
+        max_workers = _check_max_workers(max_workers)
+    if max_workers is None or max_workers == 1:
+        for start_date_i, end_date_i in date_series_list:
+            yield _measurements_slice_cached(
+                location,
+                start_date=start_date_i,
+                end_date=end_date_i,
+                client=client,
+                cache=cache,
+                stream=stream,
+            )
+        return
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        # only submit a limited number of periods ahead, so the retrieved measurements
+        # do not pile up in memory if they are consumed slower than they are retrieved
+        futures = collections.deque()
+        for start_date_i, end_date_i in date_series_list:
+            future = executor.submit(
+                _measurements_slice_cached,
+                location,
+                start_date=start_date_i,
+                end_date=end_date_i,
+                client=client,
+                cache=cache,
+                stream=stream,
+            )
+            futures.append(future)
+            # yield in order of submission, so the result is chronological
+            if len(futures) > 2 * max_workers:
+                yield futures.popleft().result()
+        while futures:
+            yield futures.popleft().result()
+    finally:
+        # do not start pending requests if one of the requests failed
+        executor.shutdown(wait=True, cancel_futures=True)
 
 
 def _clean_dataframe(measurements):
@@ -412,12 +1294,204 @@ def _clean_dataframe(measurements):
     return measurements
 
 
+def _check_location_series(location):
+    if isinstance(location, pd.DataFrame):
+        raise TypeError(
+            "The provided location is a pandas.DataFrame, but should be a pandas.Series, "
+            "supply only one location/row instead, for instance by doing 'location.iloc[0]'"
+        )
+
+
+def _get_date_series_list(start_date, end_date, freq):
+    start_date, end_date = _check_convert_dates(start_date, end_date, return_str=False)
+
+    if freq is None:
+        date_series_list = [(start_date, end_date)]
+    else:
+        date_series_list = date_series(start_date, end_date, freq=freq)
+    return date_series_list
+
+
+def _get_amount_periods(start_date, end_date, df_amount, period):
+    """
+    return a list of (start, end, amount) for each Maand or Dag between start_date and
+    end_date, with the amounts from the measurements_amount() DataFrame
+    """
+    freq_label = {"Maand": ("MS", "%Y-%m"), "Dag": ("D", "%Y-%m-%d")}
+    freq, label_format = freq_label[period]
+    start_group = start_date.tz_convert(TZ_GROEPERINGSPERIODE)
+    end_group = end_date.tz_convert(TZ_GROEPERINGSPERIODE)
+    edges_inner = pd.date_range(start_group, end_group, freq=freq, normalize=True)
+    edges = [start_group]
+    edges += [x for x in edges_inner if start_group < x < end_group]
+    edges += [end_group]
+
+    amount_dict = df_amount["AantalMetingen"].to_dict()
+    periods = []
+    for start_i, end_i in zip(edges[:-1], edges[1:]):
+        amount = amount_dict.get(start_i.strftime(label_format), 0)
+        periods.append(
+            (start_i.tz_convert(start_date.tz), end_i.tz_convert(start_date.tz), amount)
+        )
+    return periods
+
+
+def _get_months_split(start_date, end_date, df_amount):
+    """
+    return a list of (start, end) for each Maand between start_date and end_date with
+    more than MAX_OBSERVATIONS measurements, which are split in days
+    """
+    return [
+        (start_i, end_i)
+        for start_i, end_i, amount in _get_amount_periods(
+            start_date, end_date, df_amount, period="Maand"
+        )
+        if amount > MAX_OBSERVATIONS
+    ]
+
+
+def _get_date_series_amount(start_date, end_date, df_amount, get_amount_day):
+    """
+    return a list of start and end dates with as few periods as possible, while the
+    amount of measurements per period stays below MAX_OBSERVATIONS. The amounts per
+    Maand are in df_amount, get_amount_day(start, end) returns the amounts per Dag of
+    the months from _get_months_split().
+    """
+    months_split = _get_months_split(start_date, end_date, df_amount)
+    periods = []
+    for start_i, end_i, amount in _get_amount_periods(
+        start_date, end_date, df_amount, period="Maand"
+    ):
+        if (start_i, end_i) in months_split:
+            df_amount_day = get_amount_day(start_i, end_i)
+            periods += _get_amount_periods(start_i, end_i, df_amount_day, period="Dag")
+        else:
+            periods.append((start_i, end_i, amount))
+    return date_series_packed(periods, limit=MAX_OBSERVATIONS)
+
+
+def _get_date_series_auto(location, start_date, end_date, client=None):
+    """
+    return a list of start and end dates with as few periods as possible, while the
+    amount of measurements per period stays below MAX_OBSERVATIONS
+    """
+    start_date, end_date = _check_convert_dates(start_date, end_date, return_str=False)
+
+    try:
+        df_amount = measurements_amount(
+            location, start_date, end_date, period="Maand", client=client
+        )
+    except NoDataError:
+        return []
+
+    def get_amount_day(start_i, end_i):
+        return measurements_amount(
+            location, start_i, end_i, period="Dag", client=client
+        )
+
+    date_series_list = _get_date_series_amount(
+        start_date, end_date, df_amount, get_amount_day
+    )
+    logger.debug(
+        f"freq='auto' divided the requested period in {len(date_series_list)} periods"
+    )
+    return date_series_list
+
+
+def _get_date_series(location, start_date, end_date, freq, client=None):
+    if freq == "auto":
+        return _get_date_series_auto(location, start_date, end_date, client=client)
+    return _get_date_series_list(start_date, end_date, freq=freq)
+
+
+def _check_stream(stream):
+    if stream and ijson is None:
+        logger.warning("stream=True requires ijson, the responses are parsed at once")
+        return False
+    return stream
+
+
+def _log_nsplits(nsplits):
+    if nsplits > 0:
+        logger.info(
+            f"{nsplits} periods were split in two because they contained too many "
+            "observations, consider using a smaller freq"
+        )
+
+
+def _drop_duplicates_previous(measurements, previous):
+    """
+    Drop the rows of the cleaned measurements that are also in the previous cleaned
+    chunk, which occurs at the boundary of the periods.
+    """
+    overlap = previous.loc[previous.index >= measurements.index.min()]
+    if overlap.empty:
+        return measurements
+    combined = pd.concat([overlap, measurements]).reset_index()
+    nrows_overlap = len(overlap)
+    bool_duplicated = combined.duplicated().to_numpy()[nrows_overlap:]
+    return measurements.loc[~bool_duplicated]
+
+
+def _clean_chunk(measurements, previous=None):
+    """
+    Clean the measurements of a period like _clean_dataframe and drop the rows that
+    were already in the previous chunk. Returns the cleaned measurements and the rows
+    to pass as previous for the next chunk.
+    """
+    measurements = _clean_dataframe(measurements)
+    if previous is not None:
+        measurements = _drop_duplicates_previous(measurements, previous)
+    if measurements.empty:
+        return measurements, previous
+    # only the last timestep can be duplicated in the next chunk
+    previous = measurements.loc[measurements.index == measurements.index.max()]
+    return measurements, previous
+
+
+def _categorize_dataframe(measurements):
+    """
+    Convert the string columns to pd.Categorical, this saves a lot of memory since
+    most of the columns contain the same value for every measurement.
+    """
+    for colname in measurements.columns:
+        if colname == "Tijdstip":
+            # unique for every measurement
+            continue
+        if pd.api.types.is_string_dtype(measurements[colname]):
+            measurements[colname] = measurements[colname].astype("category")
+    return measurements
+
+
+def _concat_measurements(measurements, clean_df=True, categorical=False):
+    if len(measurements) == 0:
+        # return empty dataframe in case of no data
+        logger.debug("no data found for this station and time extent")
+        return pd.DataFrame()
+
+    measurements = pd.concat(measurements)
+
+    if clean_df:
+        measurements = _clean_dataframe(measurements)
+
+    if categorical:
+        # after concatenating, so all periods share the same categories
+        measurements = _categorize_dataframe(measurements)
+
+    return measurements
+
+
 def measurements(
     location: pd.Series,
     start_date: (str, pd.Timestamp),
     end_date: (str, pd.Timestamp),
-    freq: int = dateutil.rrule.MONTHLY,
+    freq: (int, str) = dateutil.rrule.MONTHLY,
     clean_df: bool = True,
+    max_workers: int = None,
+    categorical: bool = False,
+    cache: ChunkCache = None,
+    stream: bool = False,
+    client: Client = None,
 ):
     """
     Returns measurements for the given location and requested period.
@@ -438,8 +1512,38 @@ def measurements(
         In that case the query will fail with an error or timeout or just return an empty result (as if there was no data).
         In that case, the user should fallback to monthly chunks.
         This is significantly slower but it is also much more robust. The default is dateutil.rrule.MONTHLY.
+        Periods that contain too many measurements are automatically split in two
+        halves until the requests succeed.
+        With freq="auto" the amount of measurements per month is retrieved first with
+        `ddlpy.measurements_amount()` and consecutive months are combined in as few periods
+        as possible, while staying below `ddlpy.ddlpy.MAX_OBSERVATIONS` per period.
+        This saves a lot of requests for sparse timeseries.
     clean_df : bool, optional
         Whether to sort the dataframe and remove duplicate rows. The default is True.
+    max_workers : int, optional
+        The number of periods (as defined by `freq`) to retrieve in parallel. The
+        maximum is `ddlpy.ddlpy.MAX_WORKERS` to avoid overloading the Waterwebservices,
+        a ValueError is raised if it is smaller than 1. The default is None, in which
+        case the periods are retrieved one by one.
+    categorical : bool, optional
+        Whether to store the string columns as pd.Categorical. Almost all columns
+        contain the same value for every measurement, so this reduces the memory usage
+        of the DataFrame to a fraction, e.g. 2.8 MB instead of 23 MB for a year of
+        10-minute data.
+        The output can still be used in `ddlpy.simplify_dataframe()` and
+        `ddlpy.dataframe_to_xarray()`. The default is False.
+    cache : ddlpy.ChunkCache, optional
+        On-disk cache of the retrieved periods, so repeated calls for the same
+        location and periods do not retrieve them again. Only works with the same
+        freq. The default is None, in which case no cache is used.
+    stream : bool, optional
+        Whether to parse the responses incrementally while they are downloaded,
+        instead of parsing the complete response at once. This reduces the peak memory
+        usage for large periods, but is somewhat slower. Requires the optional `ijson`
+        dependency. The default is False.
+    client : ddlpy.Client, optional
+        Client to send the requests with. The default is None, in which case a shared
+        default client is used.
 
     Returns
     -------
@@ -447,51 +1551,194 @@ def measurements(
         DataFrame with measurements.
     """
 
-    if isinstance(location, pd.DataFrame):
-        raise TypeError(
-            "The provided location is a pandas.DataFrame, but should be a pandas.Series, "
-            "supply only one location/row instead, for instance by doing 'location.iloc[0]'"
-        )
+    _check_location_series(location)
+    stream = _check_stream(stream)
 
-    start_date, end_date = _check_convert_dates(start_date, end_date, return_str=False)
+    date_series_list = _get_date_series(
+        location, start_date, end_date, freq=freq, client=client
+    )
 
     measurements = []
+    nsplits = 0
+    measurements_iterator = _iter_measurements_slices(
+        location,
+        date_series_list,
+        max_workers=max_workers,
+        client=client,
+        cache=cache,
+        stream=stream,
+    )
+    for measurement, nsplits_i in tqdm.tqdm(
+        measurements_iterator, total=len(date_series_list)
+    ):
+        nsplits += nsplits_i
+        # skip periods without data
+        if measurement is not None:
+            measurements.append(measurement)
 
-    if freq is None:
-        date_series_iterator = tqdm.tqdm([(start_date, end_date)])
-    else:
-        date_series_iterator = tqdm.tqdm(date_series(start_date, end_date, freq=freq))
+    _log_nsplits(nsplits)
+
+    return _concat_measurements(
+        measurements, clean_df=clean_df, categorical=categorical
+    )
+
+
+def iter_measurements(
+    location: pd.Series,
+    start_date: (str, pd.Timestamp),
+    end_date: (str, pd.Timestamp),
+    freq: (int, str) = dateutil.rrule.MONTHLY,
+    clean_df: bool = True,
+    max_workers: int = None,
+    cache: ChunkCache = None,
+    stream: bool = False,
+    client: Client = None,
+):
+    """
+    Yields the measurements for the given location and requested period per period
+    (as defined by `freq`) as soon as they are retrieved, instead of returning one
+    concatenated DataFrame like `ddlpy.measurements()`. Only a few periods are in memory
+    at once, so long timeseries can for instance be written to disk or to a database
+    chunk by chunk.
+
+    Parameters
+    ----------
+    location : pd.Series
+        Single row of the `ddlpy.locations()` DataFrame.
+    start_date : str, pd.Timestamp
+        Start of the retrieval period.
+    end_date : str, pd.Timestamp
+        End of the retrieval period.
+    freq : int, dateutil.rrule.MONTHLY, dateutil.rrule.YEARLY, etc., optional
+        The frequency in which to divide the requested period, see
+        `ddlpy.measurements()`. The default is dateutil.rrule.MONTHLY.
+    clean_df : bool, optional
+        Whether to sort each chunk and remove duplicate rows. Rows that were already
+        yielded in the previous chunk, which occurs at the boundary of the periods, are
+        also removed. The default is True.
+    max_workers : int, optional
+        The number of periods to retrieve in parallel, see `ddlpy.measurements()`.
+        The default is None.
+    cache : ddlpy.ChunkCache, optional
+        On-disk cache of the retrieved periods, see `ddlpy.measurements()`.
+        The default is None.
+    stream : bool, optional
+        Whether to parse the responses incrementally, see `ddlpy.measurements()`.
+        The default is False.
+    client : ddlpy.Client, optional
+        Client to send the requests with. The default is None, in which case a shared
+        default client is used.
+
+    Yields
+    ------
+    measurements : pd.DataFrame
+        DataFrame with the measurements of a period, in chronological order. Periods
+        without data are skipped.
+    """
+
+    _check_location_series(location)
+    stream = _check_stream(stream)
+
+    date_series_list = _get_date_series(
+        location, start_date, end_date, freq=freq, client=client
+    )
+
+    nsplits = 0
+    previous = None
+    measurements_iterator = _iter_measurements_slices(
+        location,
+        date_series_list,
+        max_workers=max_workers,
+        client=client,
+        cache=cache,
+        stream=stream,
+    )
+    for measurement, nsplits_i in tqdm.tqdm(
+        measurements_iterator, total=len(date_series_list)
+    ):
+        nsplits += nsplits_i
+        # skip periods without data
+        if measurement is None:
+            continue
+
+        if clean_df:
+            measurement, previous = _clean_chunk(measurement, previous)
+            if measurement.empty:
+                continue
+
+        yield measurement
+
+    _log_nsplits(nsplits)
+
+
+def _get_request_latest(location):
+    request_dicts = _get_request_dicts(location)
+
+    request = {
+        "AquoPlusWaarnemingMetadataLijst": [
+            {"AquoMetadata": request_dicts["AquoMetadata"]}
+        ],
+        "LocatieLijst": [request_dicts["Locatie"]],
+    }
+    return request
+
+
+def _measurements_latest_batched(locations, batch_size=BATCH_SIZE, client=None):
+    """
+    Returns the latest measurements for all locations in the DataFrame, with as few
+    requests as possible.
+    """
+    endpoint = ENDPOINTS["collect_latest_observations"]
 
-    for start_date_i, end_date_i in date_series_iterator:
+    dfs = []
+    for _, locations_batch in _iter_location_batches(locations, batch_size):
+        location = next(iter(locations_batch.values()))
+        request = _get_request_batch(_get_request_latest(location), locations_batch)
         try:
-            measurement = _measurements_slice(
-                location, start_date=start_date_i, end_date=end_date_i
+            result = _send_post_request(
+                endpoint["url"], request, timeout=30, client=client
             )
-            measurements.append(measurement)
         except NoDataError:
             continue
 
-    if len(measurements) == 0:
-        # return empty dataframe in case of no data
-        logger.debug("no data found for this station and time extent")
+        # split the response in the waarnemingen per location
+        for waarneming in result["WaarnemingenLijst"]:
+            location = locations_batch.get(waarneming["Locatie"]["Code"])
+            if location is None:
+                logger.debug(
+                    f"skipping unrequested location {waarneming['Locatie']['Code']}"
+                )
+                continue
+            result_location = {"WaarnemingenLijst": [waarneming]}
+            dfs.append(_combine_waarnemingenlijst(result_location, location))
+
+    if len(dfs) == 0:
+        logger.debug("no latest measurements found for these locations")
         return pd.DataFrame()
-
-    measurements = pd.concat(measurements)
-
-    if clean_df:
-        measurements = _clean_dataframe(measurements)
-
-    return measurements
+    return pd.concat(dfs)
 
 
-def measurements_latest(location: pd.Series) -> pd.DataFrame:
+def measurements_latest(
+    location: (pd.Series, pd.DataFrame),
+    batch_size: int = BATCH_SIZE,
+    client: Client = None,
+) -> pd.DataFrame:
     """
-    Returns the latest available measurement for the given location.
+    Returns the latest available measurement for the given location or locations.
 
     Parameters
     ----------
-    location : pd.Series
-        Single row of the `ddlpy.locations()` DataFrame.
+    location : pd.Series, pd.DataFrame
+        Single row of the `ddlpy.locations()` DataFrame. Can also be multiple rows, in
+        which case the locations with the same AquoMetadata are combined in batched
+        requests. The result then contains the latest measurements of all locations,
+        the "Code" column contains the location.
+    batch_size : int, optional
+        The maximum number of locations per request, only used if location is a
+        DataFrame. The default is `ddlpy.ddlpy.BATCH_SIZE`.
+    client : ddlpy.Client, optional
+        Client to send the requests with. The default is None, in which case a shared
+        default client is used.
 
     Returns
     -------
@@ -499,18 +1746,16 @@ def measurements_latest(location: pd.Series) -> pd.DataFrame:
         DataFrame with measurements.
 
     """
-    endpoint = ENDPOINTS["collect_latest_observations"]
+    if isinstance(location, pd.DataFrame):
+        return _measurements_latest_batched(
+            location, batch_size=batch_size, client=client
+        )
 
-    request_dicts = _get_request_dicts(location)
+    endpoint = ENDPOINTS["collect_latest_observations"]
 
-    request = {
-        "AquoPlusWaarnemingMetadataLijst": [
-            {"AquoMetadata": request_dicts["AquoMetadata"]}
-        ],
-        "LocatieLijst": [request_dicts["Locatie"]],
-    }
+    request = _get_request_latest(location)
 
-    result = _send_post_request(endpoint["url"], request, timeout=5)
+    result = _send_post_request(endpoint["url"], request, timeout=5, client=client)
 
     # continue if request was successful
     df = _combine_waarnemingenlijst(result, location)
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+
+"""File locks and atomic writes for the threads and processes on a machine."""
+import os
+import time
+import uuid
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+
+def _try_lock(fd) -> bool:
+    """lock the file without blocking, return whether it succeeded"""
+    try:
+        if os.name == "nt":
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        else:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(fd):
+    if os.name == "nt":
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def _atomic_write(path, write_func):
+    """
+    Call write_func with a temporary path and replace path by the written file, so
+    other threads and processes never read a partially written file. The temporary
+    file is removed if writing fails.
+    """
+    path_tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        write_func(path_tmp)
+        os.replace(path_tmp, path)
+    finally:
+        if os.path.exists(path_tmp):
+            os.remove(path_tmp)
+
+
+class FileLock:
+    """
+    Exclusive lock on a file, the file is created if it does not exist. Every
+    acquisition opens the file again, so two instances for the same path also exclude
+    each other within a process. The lock is released by the operating system when
+    the process ends, so a crashed process does not leave a stale lock behind.
+
+    Parameters
+    ----------
+    path : str
+        Path to the lock file.
+    timeout : float, optional
+        The maximum number of seconds to wait for the lock, after which a TimeoutError
+        is raised. The default is None, which waits indefinitely.
+    poll_interval : float, optional
+        The number of seconds between two attempts to acquire the lock. The default is
+        0.01.
+
+    """
+
+    def __init__(self, path: str, timeout: float = None, poll_interval: float = 0.01):
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self.fd = None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Acquire the lock, return False if it is held by someone else and not blocking."""
+        if self.fd is not None:
+            raise RuntimeError(f"lock {self.path} is already acquired")
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        tstart = time.monotonic()
+        while not _try_lock(fd):
+            if not blocking:
+                os.close(fd)
+                return False
+            if self.timeout is not None and time.monotonic() - tstart > self.timeout:
+                os.close(fd)
+                raise TimeoutError(f"could not acquire lock {self.path}")
+            time.sleep(self.poll_interval)
+        self.fd = fd
+        return True
+
+    def release(self):
+        """Release the lock."""
+        if self.fd is None:
+            return
+        try:
+            _unlock(self.fd)
+        finally:
+            os.close(self.fd)
+            self.fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+"""Persistent manifest of the periods retrieved by ddlpy.bulk_measurements()."""
+import os
+import sqlite3
+import logging
+import pandas as pd
+
+from .cache import _get_request_key
+from .utils import _get_cachedir
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ["pending", "done", "nodata", "failed"]
+
+
+class Manifest:
+    """
+    Persistent manifest of the periods (work units) of `ddlpy.bulk_measurements()`,
+    stored in a SQLite database. Every period of every location is recorded with its
+    status ("pending", "done", "nodata" or "failed"), the number of measurements and
+    their size in memory. The periods are identified by their OphalenWaarnemingen
+    request, so by the location, the AquoMetadata and the period.
+
+    A bulk retrieval that is interrupted can be resumed by running it again with the
+    same manifest. Periods that are done or that contain no data are skipped, unless
+    they were retrieved before the end of the period, since new measurements can be
+    added to them. Pending and failed periods are retrieved again. Use a separate
+    manifest for every sink, since the manifest does not know where the measurements
+    were written to.
+
+    Parameters
+    ----------
+    path : str, optional
+        Path to the SQLite database, it is created if it does not exist. The default is
+        None, in which case ``manifest.sqlite`` in the ddlpy cache directory is used.
+
+    """
+
+    def __init__(self, path: str = None):
+        if path is None:
+            # like %USERPROFILE%/AppData/Local/ddlpy/Cache/manifest.sqlite
+            path = os.path.join(_get_cachedir(), "manifest.sqlite")
+        self.path = path
+        # wait for other processes that write to the same manifest
+        self._connection = sqlite3.connect(path, timeout=60)
+        with self._connection:
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS tasks (
+                    key TEXT PRIMARY KEY,
+                    code TEXT,
+                    start_date TEXT,
+                    end_date TEXT,
+                    status TEXT,
+                    nmeasurements INTEGER,
+                    nbytes INTEGER,
+                    error TEXT,
+                    updated TEXT
+                )
+                """)
+
+    def get(self, request: dict) -> dict:
+        """
+        Return the record of the OphalenWaarnemingen request as a dict, or None if it
+        is not in the manifest.
+        """
+        cursor = self._connection.execute(
+            "SELECT * FROM tasks WHERE key = ?", (_get_request_key(request),)
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        columns = [description[0] for description in cursor.description]
+        return dict(zip(columns, row))
+
+    def is_finished(self, request: dict) -> bool:
+        """
+        Return whether the period of the request is done or contains no data, and was
+        retrieved after the end of the period, so it does not have to be retrieved again.
+        """
+        record = self.get(request)
+        if record is None or record["status"] not in ["done", "nodata"]:
+            return False
+        end_date = pd.Timestamp(request["Periode"]["Einddatumtijd"])
+        return end_date <= pd.Timestamp(record["updated"])
+
+    def add(self, request: dict):
+        """Add the request as pending, if it is not in the manifest yet."""
+        period = request["Periode"]
+        with self._connection:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO tasks VALUES (?, ?, ?, ?, ?, 0, 0, NULL, ?)",
+                (
+                    _get_request_key(request),
+                    request["Locatie"]["Code"],
+                    period["Begindatumtijd"],
+                    period["Einddatumtijd"],
+                    "pending",
+                    pd.Timestamp.now(tz="UTC").isoformat(),
+                ),
+            )
+
+    def update(
+        self,
+        request: dict,
+        status: str,
+        nmeasurements: int = 0,
+        nbytes: int = 0,
+        error: str = None,
+    ):
+        """Record the status of the request."""
+        if status not in STATUSES:
+            raise ValueError(f"status should be one of {STATUSES}, not '{status}'")
+        self.add(request)
+        with self._connection:
+            self._connection.execute(
+                """
+                UPDATE tasks
+                SET status = ?, nmeasurements = ?, nbytes = ?, error = ?, updated = ?
+                WHERE key = ?
+                """,
+                (
+                    status,
+                    int(nmeasurements),
+                    int(nbytes),
+                    error,
+                    pd.Timestamp.now(tz="UTC").isoformat(),
+                    _get_request_key(request),
+                ),
+            )
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Return all records as a DataFrame."""
+        return pd.read_sql_query(
+            "SELECT * FROM tasks ORDER BY code, start_date", self._connection
+        )
+
+    def clear(self):
+        """Remove all records."""
+        with self._connection:
+            self._connection.execute("DELETE FROM tasks")
+
+    def close(self):
+        """Close the database connection."""
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
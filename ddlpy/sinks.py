@@ -0,0 +1,517 @@
+# -*- coding: utf-8 -*-
+
+"""Writers that store the measurements chunk by chunk, without holding them in memory."""
+import os
+import hashlib
+import logging
+import urllib.parse
+import dateutil
+import numpy as np
+import pandas as pd
+
+from .ddlpy import iter_measurements, _get_location_key
+from .client import Client
+from .cache import ChunkCache
+from .locking import _atomic_write
+from .utils import simplify_dataframe, dataframe_to_xarray
+
+logger = logging.getLogger(__name__)
+
+
+def _iter_location_rows(locations):
+    """yield the rows of a DataFrame of locations, or the location Series itself"""
+    if isinstance(locations, pd.DataFrame):
+        for _, location in locations.iterrows():
+            yield location
+    else:
+        yield locations
+
+
+def _get_location_hash(location):
+    """return a short hash of the AquoMetadata and code of the location"""
+    aquometadata_key, code = _get_location_key(location)
+    return hashlib.sha256(f"{code}/{aquometadata_key}".encode()).hexdigest()[:12]
+
+
+def _get_partition_dir(root, location, year):
+    """return the hive partition directory station=*/grootheid=*/year=*"""
+    code = location.get("Code", location.name)
+    grootheid = location.get("Grootheid.Code", "")
+    # the values are URL-quoted, like pyarrow does with segment_encoding="uri"
+    return os.path.join(
+        root,
+        f"station={urllib.parse.quote(str(code), safe='')}",
+        f"grootheid={urllib.parse.quote(str(grootheid), safe='')}",
+        f"year={year}",
+    )
+
+
+def _get_always_preserve(measurements, always_preserve=()):
+    """
+    Return the columns that are preserved even if they are constant, these are the
+    WaarnemingMetadata and Meetwaarde columns, so all chunks have the same columns.
+    """
+    return [
+        colname
+        for colname in measurements.columns
+        if colname.startswith(("WaarnemingMetadata.", "Meetwaarde."))
+        or colname in always_preserve
+    ]
+
+
+def _simplify_chunk(measurements):
+    """Move the constant metadata columns to the attrs like `ddlpy.simplify_dataframe()`."""
+    always_preserve = _get_always_preserve(measurements)
+    df = simplify_dataframe(measurements, always_preserve=always_preserve)
+    # the attrs are stored as json in the file metadata
+    df.attrs = {
+        key: value.item() if isinstance(value, np.generic) else value
+        for key, value in df.attrs.items()
+    }
+    return df
+
+
+def _write_parquet(df, path):
+    """write the DataFrame to a parquet file, replacing the previous version"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _atomic_write(path, df.to_parquet)
+
+
+def _read_parquet_file(path):
+    """read a file written by _write_parquet_chunk() with the constant columns"""
+    df = pd.read_parquet(path)
+    for key, value in df.attrs.items():
+        df[key] = value
+    df.attrs = {}
+    return df
+
+
+def _write_parquet_chunk(measurements, root, location):
+    """
+    Write the measurements of a chunk to a file per month (in UTC) in the hive
+    partitions per year, returns the written paths. The measurements of an existing
+    file within the period of the chunk are replaced, the others are kept.
+    """
+    location_hash = _get_location_hash(location)
+    index_utc = measurements.index.tz_convert("UTC")
+    paths = []
+    months = measurements.groupby([index_utc.year, index_utc.month], sort=True)
+    for (year, month), df_month in months:
+        filename = f"{location_hash}-{year}{month:02d}.parquet"
+        path = os.path.join(_get_partition_dir(root, location, year), filename)
+        if os.path.exists(path):
+            df_stored = _read_parquet_file(path)
+            outside = (df_stored.index < df_month.index[0]) | (
+                df_stored.index > df_month.index[-1]
+            )
+            columns = list(df_month.columns) + [
+                x for x in df_stored.columns if x not in df_month.columns
+            ]
+            df_month = pd.concat([df_stored.loc[outside], df_month]).sort_index()
+            df_month = df_month.reindex(columns=columns)
+        _write_parquet(_simplify_chunk(df_month), path)
+        paths.append(path)
+    return paths
+
+
+class ParquetSink:
+    """
+    Sink for `ddlpy.bulk_measurements()` that writes the measurements to a hive
+    partitioned parquet dataset like `ddlpy.to_parquet()`, which requires the optional
+    pyarrow dependency.
+
+    Parameters
+    ----------
+    root : str
+        Root directory of the dataset, it is created if it does not exist.
+
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.paths = []
+
+    def __call__(self, location: pd.Series, measurements: pd.DataFrame):
+        """Write the measurements of a chunk for the location."""
+        for path in _write_parquet_chunk(measurements, self.root, location):
+            # a file is written again if a chunk ends at the start of the next month
+            if path not in self.paths:
+                self.paths.append(path)
+
+
+def to_parquet(
+    locations: (pd.Series, pd.DataFrame),
+    start_date: (str, pd.Timestamp),
+    end_date: (str, pd.Timestamp),
+    root: str,
+    freq: (int, str) = dateutil.rrule.MONTHLY,
+    max_workers: int = None,
+    cache: ChunkCache = None,
+    client: Client = None,
+) -> list:
+    """
+    Writes the measurements for the given locations and requested period to a hive
+    partitioned parquet dataset, which requires the optional pyarrow dependency. The
+    measurements are retrieved with `ddlpy.iter_measurements()` and every period
+    (chunk) is written to disk immediately, so the measurements are never all in
+    memory at once.
+
+    The dataset is partitioned like
+    ``root/station=<Code>/grootheid=<Grootheid.Code>/year=<year>`` with URL-quoted
+    values and the year in UTC. It can be read with for instance
+    ``pd.read_parquet(root)`` or ``pyarrow.dataset.dataset(root, partitioning="hive")``.
+    Constant metadata columns are stored in the file metadata like
+    `ddlpy.simplify_dataframe()`, they are restored as attrs by ``pd.read_parquet()``
+    of a single file.
+
+    Every file contains the measurements of a location in one month (in UTC) and is
+    written atomically. If the file of a month already exists, its measurements within
+    the retrieved period are replaced and the others are kept. Retrieving a period that
+    overlaps with a previous retrieval therefore never duplicates the measurements.
+
+    Parameters
+    ----------
+    locations : pd.Series, pd.DataFrame
+        Single row or multiple rows of the `ddlpy.locations()` DataFrame.
+    start_date : str, pd.Timestamp
+        Start of the retrieval period.
+    end_date : str, pd.Timestamp
+        End of the retrieval period.
+    root : str
+        Root directory of the dataset, it is created if it does not exist.
+    freq : int, dateutil.rrule.MONTHLY, dateutil.rrule.YEARLY, etc., optional
+        The frequency in which to divide the requested period, see
+        `ddlpy.measurements()`. The default is dateutil.rrule.MONTHLY.
+    max_workers : int, optional
+        The number of periods to retrieve in parallel, see `ddlpy.measurements()`.
+        The default is None.
+    cache : ddlpy.ChunkCache, optional
+        On-disk cache of the retrieved periods, see `ddlpy.measurements()`.
+        The default is None.
+    client : ddlpy.Client, optional
+        Client to send the requests with. The default is None, in which case a shared
+        default client is used.
+
+    Returns
+    -------
+    list
+        The paths of the written files.
+
+    """
+    sink = ParquetSink(root)
+    for location in _iter_location_rows(locations):
+        measurements_iterator = iter_measurements(
+            location,
+            start_date=start_date,
+            end_date=end_date,
+            freq=freq,
+            max_workers=max_workers,
+            cache=cache,
+            client=client,
+        )
+        for measurements in measurements_iterator:
+            sink(location, measurements)
+    logger.info(f"{len(sink.paths)} files written to {root}")
+    return sink.paths
+
+
+def _get_zarr_encoding(ds, time_chunksize):
+    encoding = {varn: {"chunks": (time_chunksize,)} for varn in ds.data_vars}
+    # fixed units instead of units derived from the first chunk, so the timesteps of
+    # the appended chunks are also encoded exactly
+    encoding["time"] = {
+        "units": "seconds since 1970-01-01 00:00:00",
+        "dtype": "int64",
+        "chunks": (time_chunksize,),
+    }
+    return encoding
+
+
+def _get_zarr_always_preserve(measurements, always_preserve):
+    """
+    Return the columns that are stored as variables, the codes are always preserved
+    since they can change between chunks, e.g. when an instrument is replaced.
+    """
+    codes = [
+        colname
+        for colname in measurements.columns
+        if colname.endswith((".Code", ".Omschrijving"))
+    ]
+    return _get_always_preserve(measurements, always_preserve=always_preserve + codes)
+
+
+def _attrs_equal(value_store, value):
+    """compare a stored attribute with a new one, the attributes are stored as json"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and isinstance(value_store, float):
+        return value == value_store or (np.isnan(value) and np.isnan(value_store))
+    return value == value_store
+
+
+def _get_fill_value(dtype):
+    """return the dtype and value to fill the timesteps of a variable without data"""
+    if dtype.kind in "fc":
+        return dtype, np.nan
+    if dtype.kind in "mM":
+        return dtype, np.datetime64("NaT")
+    if dtype.kind in "OUST":
+        return dtype, ""
+    # integers and booleans cannot be missing
+    return np.dtype(np.float64), np.nan
+
+
+class _ZarrStore:
+    """A Zarr store that measurements are appended to along the time dimension."""
+
+    def __init__(self, store, always_preserve=None, time_chunksize=52560):
+        import xarray as xr
+
+        self.store = store
+        self.always_preserve = list(always_preserve or [])
+        self.time_chunksize = time_chunksize
+        self.data_vars = None
+        self.dtypes = None
+        self.attrs = None
+        self.ntimes = 0
+        self.last_date = None
+        if os.path.exists(store):
+            with xr.open_zarr(store, consolidated=False) as ds_store:
+                self.data_vars = list(ds_store.data_vars)
+                self.dtypes = {varn: ds_store[varn].dtype for varn in self.data_vars}
+                self.attrs = dict(ds_store.attrs)
+                self.ntimes = ds_store.sizes["time"]
+                if self.data_vars:
+                    varn = self.data_vars[0]
+                    chunks = ds_store[varn].encoding.get("chunks")
+                    if chunks:
+                        # the chunks of the store instead of the requested ones
+                        self.time_chunksize = chunks[0]
+                if ds_store.sizes["time"] > 0:
+                    # dataframe_to_xarray() stores the times in UTC
+                    last_date = pd.Timestamp(ds_store["time"].values[-1])
+                    self.last_date = last_date.tz_localize("UTC")
+
+    def append(self, measurements):
+        """append the measurements that are newer than the stored ones"""
+        import zarr
+
+        if self.last_date is not None:
+            # skip the measurements that are already stored
+            measurements = measurements.loc[measurements.index > self.last_date]
+            if measurements.empty:
+                return 0
+
+        always_preserve = self.always_preserve
+        if self.data_vars is not None:
+            # columns that are not in the store yet are stored as variables
+            always_preserve = always_preserve + self.data_vars
+            always_preserve += [x for x in measurements.columns if x not in self.attrs]
+        always_preserve = _get_zarr_always_preserve(
+            measurements, always_preserve=always_preserve
+        )
+        ds = dataframe_to_xarray(measurements, always_preserve=always_preserve)
+        for varn in ds.data_vars:
+            if ds[varn].dtype == object:
+                # missing strings would be appended as "nan" instead of the fill value
+                ds[varn] = ds[varn].fillna("")
+
+        if self.data_vars is None:
+            encoding = _get_zarr_encoding(ds, self.time_chunksize)
+            ds.to_zarr(self.store, mode="w", consolidated=False, encoding=encoding)
+            self.data_vars = list(ds.data_vars)
+            self.dtypes = {varn: ds[varn].dtype for varn in ds.data_vars}
+            self.attrs = dict(ds.attrs)
+            self.ntimes = 0
+        else:
+            new_vars = [varn for varn in ds.data_vars if varn not in self.data_vars]
+            attrs_vars = [varn for varn in new_vars if varn in self.attrs]
+            if attrs_vars:
+                raise ValueError(
+                    f"columns {attrs_vars} are not constant in the period from "
+                    f"{measurements.index[0]}, but are stored as attributes in "
+                    f"'{self.store}', add them to always_preserve"
+                )
+            if new_vars:
+                self._add_variables(ds[new_vars])
+            # variables without data in this chunk, e.g. optional metadata
+            missing_vars = [varn for varn in self.data_vars if varn not in ds.data_vars]
+            for varn in missing_vars:
+                dtype, fill_value = _get_fill_value(self.dtypes[varn])
+                ds[varn] = ("time", np.full(ds.sizes["time"], fill_value, dtype=dtype))
+            # the attributes of the store apply to all timesteps, so appending a chunk
+            # with other constant values would silently overwrite them
+            changed_attrs = [
+                key
+                for key, value in ds.attrs.items()
+                if key in self.attrs and not _attrs_equal(self.attrs[key], value)
+            ]
+            if changed_attrs:
+                raise ValueError(
+                    f"columns {changed_attrs} in the period from "
+                    f"{measurements.index[0]} differ from the attributes in "
+                    f"'{self.store}', add them to always_preserve"
+                )
+            ds.to_zarr(self.store, append_dim="time", consolidated=False)
+            # appending does not update the attributes, merge the new codes
+            group = zarr.open_group(self.store, mode="a")
+            for varn in ds.data_vars:
+                if ds[varn].attrs:
+                    group[varn].attrs.update(ds[varn].attrs)
+
+        self.last_date = measurements.index[-1]
+        self.ntimes += len(measurements)
+        return len(measurements)
+
+    def _add_variables(self, ds_new):
+        """add variables to the store, the stored timesteps are filled without data"""
+        import xarray as xr
+
+        ds_fill = xr.Dataset()
+        encoding = {}
+        for varn in ds_new.data_vars:
+            dtype, fill_value = _get_fill_value(ds_new[varn].dtype)
+            values = np.full(self.ntimes, fill_value, dtype=dtype)
+            ds_fill[varn] = xr.Variable("time", values, attrs=ds_new[varn].attrs)
+            encoding[varn] = {"chunks": (self.time_chunksize,)}
+            self.data_vars.append(varn)
+            self.dtypes[varn] = dtype
+        ds_fill.to_zarr(self.store, mode="a", consolidated=False, encoding=encoding)
+
+
+class ZarrSink:
+    """
+    Sink for `ddlpy.bulk_measurements()` that appends the measurements of every
+    location to a separate Zarr store like `ddlpy.to_zarr()`, which requires the
+    optional xarray and zarr dependencies. The stores are named after the location code
+    and a hash of the AquoMetadata, since a code can occur for multiple Grootheden.
+
+    Parameters
+    ----------
+    directory : str
+        Directory to create the stores in, it is created if it does not exist.
+    always_preserve : list, optional
+        Columns that are stored as variables even if they are constant, see
+        `ddlpy.to_zarr()`. The default is None.
+    time_chunksize : int, optional
+        The number of timesteps per Zarr chunk, see `ddlpy.to_zarr()`. The default is
+        52560.
+
+    """
+
+    def __init__(
+        self, directory: str, always_preserve: list = None, time_chunksize: int = 52560
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.always_preserve = always_preserve
+        self.time_chunksize = time_chunksize
+        self._stores = {}
+
+    def get_store(self, location: pd.Series) -> str:
+        """Return the path of the store for the location."""
+        code = urllib.parse.quote(str(location.get("Code", location.name)), safe="")
+        return os.path.join(
+            self.directory, f"{code}-{_get_location_hash(location)}.zarr"
+        )
+
+    def __call__(self, location: pd.Series, measurements: pd.DataFrame):
+        """Append the measurements of a chunk for the location."""
+        store = self.get_store(location)
+        if store not in self._stores:
+            self._stores[store] = _ZarrStore(
+                store,
+                always_preserve=self.always_preserve,
+                time_chunksize=self.time_chunksize,
+            )
+        self._stores[store].append(measurements)
+
+
+def to_zarr(
+    location: pd.Series,
+    start_date: (str, pd.Timestamp),
+    end_date: (str, pd.Timestamp),
+    store: str,
+    always_preserve: list = None,
+    time_chunksize: int = 52560,
+    freq: (int, str) = dateutil.rrule.MONTHLY,
+    max_workers: int = None,
+    cache: ChunkCache = None,
+    client: Client = None,
+) -> int:
+    """
+    Appends the measurements for the given location and requested period to a Zarr
+    store along the time dimension, which requires the optional xarray and zarr
+    dependencies. The measurements are retrieved with `ddlpy.iter_measurements()` and
+    every period (chunk) is converted with `ddlpy.dataframe_to_xarray()` and appended
+    immediately, so the measurements are never all in memory at once.
+
+    The store is created if it does not exist. Measurements that are not newer than
+    the last stored measurement are skipped, so an interrupted retrieval can be resumed
+    by calling this function again. The ".Code" columns are always stored as variables,
+    since they can change between chunks, and their Code/Omschrijving attributes are
+    merged with the codes of every appended chunk. A ValueError is raised if another
+    column that is stored as attribute differs in an appended chunk. Columns that are
+    new in an appended chunk are added as variables, and variables that are missing in
+    a chunk are filled, with NaN or an empty string for the timesteps without data.
+
+    The store can be converted to a netcdf file with
+    ``xr.open_zarr(store, consolidated=False).to_netcdf(file_nc)``, since xarray does
+    not support appending to netcdf files.
+
+    Parameters
+    ----------
+    location : pd.Series
+        Single row of the `ddlpy.locations()` DataFrame.
+    start_date : str, pd.Timestamp
+        Start of the retrieval period.
+    end_date : str, pd.Timestamp
+        End of the retrieval period.
+    store : str
+        Path to the Zarr store.
+    always_preserve : list, optional
+        Columns that are stored as variables even if they are constant, see
+        `ddlpy.dataframe_to_xarray()`. The WaarnemingMetadata, Meetwaarde and ".Code"
+        columns are always preserved, since all chunks should have the same variables.
+        The default is None.
+    time_chunksize : int, optional
+        The number of timesteps per Zarr chunk, large chunks along time are efficient
+        for reading periods of a timeseries. The default is 52560, which is a year of
+        10-minute measurements.
+    freq : int, dateutil.rrule.MONTHLY, dateutil.rrule.YEARLY, etc., optional
+        The frequency in which to divide the requested period, see
+        `ddlpy.measurements()`. The default is dateutil.rrule.MONTHLY.
+    max_workers : int, optional
+        The number of periods to retrieve in parallel, see `ddlpy.measurements()`.
+        The default is None.
+    cache : ddlpy.ChunkCache, optional
+        On-disk cache of the retrieved periods, see `ddlpy.measurements()`.
+        The default is None.
+    client : ddlpy.Client, optional
+        Client to send the requests with. The default is None, in which case a shared
+        default client is used.
+
+    Returns
+    -------
+    int
+        The number of appended measurements.
+
+    """
+    zarr_store = _ZarrStore(
+        store, always_preserve=always_preserve, time_chunksize=time_chunksize
+    )
+    nappended = 0
+    measurements_iterator = iter_measurements(
+        location,
+        start_date=start_date,
+        end_date=end_date,
+        freq=freq,
+        max_workers=max_workers,
+        cache=cache,
+        client=client,
+    )
+    for measurements in measurements_iterator:
+        nappended += zarr_store.append(measurements)
+
+    logger.info(f"{nappended} measurements appended to {store}")
+    return nappended
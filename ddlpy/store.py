@@ -0,0 +1,270 @@
+# -*- coding: utf-8 -*-
+
+"""Local stores of measurements that are updated incrementally with ddlpy.sync()."""
+import os
+import glob
+import logging
+import dateutil
+import pandas as pd
+
+from .ddlpy import (
+    NoDataError,
+    measurements,
+    measurements_latest,
+    _check_location_series,
+)
+from .client import Client
+from .locking import _atomic_write
+from .sinks import (
+    _ZarrStore,
+    _get_location_hash,
+    _get_partition_dir,
+    _read_parquet_file,
+    _write_parquet_chunk,
+)
+from .utils import dataframe_to_xarray
+
+logger = logging.getLogger(__name__)
+
+STORE_FORMATS = [".parquet", ".zarr", ".nc"]
+
+
+def _get_store_format(store):
+    store_format = os.path.splitext(store)[1]
+    if store_format not in STORE_FORMATS:
+        raise ValueError(
+            f"unsupported store '{store}', the extension should be one of {STORE_FORMATS}"
+        )
+    return store_format
+
+
+def _xarray_to_dataframe(ds):
+    """
+    Convert a dataset from `ddlpy.dataframe_to_xarray()` back to a measurements
+    DataFrame, the constant columns are restored from the attributes.
+    """
+    df = ds.to_dataframe()
+    df.index = df.index.tz_localize("UTC")
+    for key, value in ds.attrs.items():
+        df[key] = value
+    for varn in ds.data_vars:
+        if varn.endswith(".Code"):
+            colname_oms = varn.replace(".Code", ".Omschrijving")
+            # empty codes are not stored in the attributes
+            df[colname_oms] = df[varn].map(lambda x: ds[varn].attrs.get(x, ""))
+
+    # Waarde_Alfanumeriek is moved to the attributes if it is a duplicate of
+    # Waarde_Numeriek, so the attribute only contains the first value
+    str_num = "Meetwaarde.Waarde_Numeriek"
+    str_alf = "Meetwaarde.Waarde_Alfanumeriek"
+    if str_num in ds.data_vars and str_alf not in ds.data_vars:
+        df[str_alf] = df[str_num].astype(str)
+    return df
+
+
+def _get_parquet_paths(store, location=None):
+    """
+    return the monthly files of a parquet store in chronological order, only the files
+    of the location if it is supplied
+    """
+    if location is None:
+        pattern = os.path.join(store, "**", "*.parquet")
+    else:
+        filename = f"{_get_location_hash(location)}-*.parquet"
+        pattern = os.path.join(_get_partition_dir(store, location, "*"), filename)
+    paths = glob.glob(pattern, recursive=True)
+    # the filenames end with the year and month
+    return sorted(paths, key=os.path.basename)
+
+
+def _read_store(store):
+    """return the measurements in the store, or None if it does not exist"""
+    store_format = _get_store_format(store)
+    if not os.path.exists(store):
+        return None
+
+    if store_format == ".parquet":
+        df_list = [_read_parquet_file(path) for path in _get_parquet_paths(store)]
+        if len(df_list) == 0:
+            return None
+        return pd.concat(df_list)
+
+    import xarray as xr
+
+    if store_format == ".zarr":
+        with xr.open_zarr(store, consolidated=False) as ds:
+            ds.load()
+    else:
+        with xr.open_dataset(store) as ds:
+            ds.load()
+    return _xarray_to_dataframe(ds)
+
+
+def _get_last_date(store, location):
+    """return the time of the last stored measurement, or None if there are none"""
+    store_format = _get_store_format(store)
+    if not os.path.exists(store):
+        return None
+
+    if store_format == ".parquet":
+        # only the file of the last month is read
+        paths = _get_parquet_paths(store, location)
+        if len(paths) == 0:
+            return None
+        return _read_parquet_file(paths[-1]).index.max()
+
+    if store_format == ".zarr":
+        return _ZarrStore(store).last_date
+
+    import xarray as xr
+
+    # only the times are read
+    with xr.open_dataset(store) as ds:
+        if ds.sizes["time"] == 0:
+            return None
+        # dataframe_to_xarray() stores the times in UTC
+        return pd.Timestamp(ds["time"].values.max()).tz_localize("UTC")
+
+
+def _drop_duplicates(df):
+    """drop duplicate rows like _clean_dataframe, but also considering the time"""
+    bool_duplicated = df.reset_index().duplicated().to_numpy()
+    return df.loc[~bool_duplicated].sort_index()
+
+
+def _update_store(store, location, new, start_date):
+    """write the measurements from start_date to the store"""
+    store_format = _get_store_format(store)
+    if store_format == ".parquet":
+        # only the files of the retrieved months are rewritten
+        _write_parquet_chunk(new, store, location)
+        return
+    if store_format == ".zarr":
+        _ZarrStore(store).append(new)
+        return
+
+    # netcdf files cannot be appended to with xarray, so the file is rewritten
+    stored = _read_store(store)
+    if stored is not None:
+        # replace the stored measurements in the overlap by the retrieved ones
+        stored.index = stored.index.tz_convert(new.index.tz)
+        stored = stored.loc[stored.index < start_date]
+        new = _drop_duplicates(pd.concat([stored, new]))
+    _atomic_write(store, dataframe_to_xarray(new).to_netcdf)
+
+
+def sync(
+    location: pd.Series,
+    store: str,
+    start_date: (str, pd.Timestamp) = None,
+    end_date: (str, pd.Timestamp) = None,
+    overlap: pd.Timedelta = pd.Timedelta(days=1),
+    freq: (int, str) = dateutil.rrule.MONTHLY,
+    max_workers: int = None,
+    client: Client = None,
+) -> pd.DataFrame:
+    """
+    Updates a local store with the measurements for the given location that are newer
+    than the last measurement in the store. The store is created if it does not exist.
+
+    The last `overlap` before the last stored measurement is retrieved again, since
+    recent measurements are sometimes corrected afterwards. The stored measurements in
+    this period are replaced and duplicates are dropped. `ddlpy.measurements_latest()`
+    is used to check whether there are new measurements, if not nothing is retrieved.
+
+    The cost of a sync depends on the format of the store:
+
+    - ".parquet": a hive partitioned dataset with a file per month like
+      `ddlpy.to_parquet()`, only the files of the retrieved months are rewritten.
+    - ".zarr": a Zarr store like `ddlpy.to_zarr()`, the new measurements are appended.
+      Stored measurements cannot be replaced, so the overlap is ignored and
+      corrections of stored measurements are not applied.
+    - ".nc": a netCDF file with the dataset from `ddlpy.dataframe_to_xarray()`. A
+      netCDF file cannot be appended to with xarray, so the whole file is read and
+      rewritten, which becomes slow for long timeseries.
+
+    Parameters
+    ----------
+    location : pd.Series
+        Single row of the `ddlpy.locations()` DataFrame.
+    store : str
+        Path to the store, with the extension ".parquet", ".zarr" or ".nc". A
+        ".parquet" store can contain the measurements of multiple locations.
+    start_date : str, pd.Timestamp, optional
+        Start of the retrieval period if the store does not exist yet, ignored otherwise.
+        The default is None.
+    end_date : str, pd.Timestamp, optional
+        End of the retrieval period. The default is None, in which case the current
+        time is used.
+    overlap : pd.Timedelta, optional
+        The period before the last stored measurement that is retrieved again.
+        The default is one day.
+    freq : int, dateutil.rrule.MONTHLY, dateutil.rrule.YEARLY, etc., optional
+        The frequency in which to divide the requested period, see
+        `ddlpy.measurements()`. The default is dateutil.rrule.MONTHLY.
+    max_workers : int, optional
+        The number of periods to retrieve in parallel, see `ddlpy.measurements()`.
+        The default is None.
+    client : ddlpy.Client, optional
+        Client to send the requests with. The default is None, in which case a shared
+        default client is used.
+
+    Returns
+    -------
+    pd.DataFrame
+        The measurements that were added to the store, empty if there are no new
+        measurements.
+
+    """
+    _check_location_series(location)
+    store_format = _get_store_format(store)
+
+    last_date = _get_last_date(store, location)
+    if last_date is None:
+        if start_date is None:
+            raise ValueError(
+                f"store '{store}' does not exist yet, supply start_date to create it"
+            )
+    else:
+        # cheap check whether there is anything new
+        try:
+            latest = measurements_latest(location, client=client)
+        except NoDataError:
+            latest = pd.DataFrame()
+        if latest.empty or latest.index.max() <= last_date:
+            logger.info(f"no measurements after {last_date}, store is up to date")
+            return pd.DataFrame()
+        if store_format == ".zarr":
+            # the stored measurements cannot be replaced, so only append
+            start_date = last_date
+        else:
+            start_date = last_date - overlap
+
+    if end_date is None:
+        end_date = pd.Timestamp.now(tz="UTC")
+    # the start_date from the store is timezone aware, like the stored measurements
+    start_date, end_date = pd.Timestamp(start_date), pd.Timestamp(end_date)
+    if start_date.tz is None:
+        start_date = start_date.tz_localize("UTC")
+    if end_date.tz is None:
+        end_date = end_date.tz_localize("UTC")
+    start_date = start_date.tz_convert(end_date.tz)
+
+    new = measurements(
+        location,
+        start_date=start_date,
+        end_date=end_date,
+        freq=freq,
+        max_workers=max_workers,
+        client=client,
+    )
+    if new.empty:
+        logger.info(f"no measurements after {last_date}, store is up to date")
+        return new
+
+    _update_store(store, location, new, start_date)
+
+    if last_date is not None:
+        new = new.loc[new.index > last_date]
+    logger.info(f"{len(new)} new measurements added to {store}")
+    return new
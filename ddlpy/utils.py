@@ -1,7 +1,16 @@
+import os
 import dateutil.rrule
 import itertools
 import pandas as pd
 import numpy as np
+import platformdirs
+
+
+def _get_cachedir():
+    # create cache dir like %USERPROFILE%/AppData/Local/ddlpy/Cache
+    cachedir = os.path.join(platformdirs.user_cache_dir(), "ddlpy", "Cache")
+    os.makedirs(cachedir, exist_ok=True)
+    return cachedir
 
 
 def date_series(start, end, freq=dateutil.rrule.MONTHLY):
@@ -30,6 +39,28 @@ def date_series(start, end, freq=dateutil.rrule.MONTHLY):
     return result
 
 
+def date_series_packed(periods, limit):
+    """
+    return a list of start and end dates by merging consecutive periods as long as the
+    sum of their amounts does not exceed the limit. The periods are a list of
+    (start, end, amount) tuples, a single period with an amount larger than the limit
+    is returned as is.
+    """
+    result = []
+    chunk_start, chunk_end, chunk_amount = None, None, 0
+    for start, end, amount in periods:
+        if chunk_start is not None and chunk_amount + amount > limit:
+            result.append((chunk_start, chunk_end))
+            chunk_start, chunk_amount = None, 0
+        if chunk_start is None:
+            chunk_start = start
+        chunk_end = end
+        chunk_amount += amount
+    if chunk_start is not None:
+        result.append((chunk_start, chunk_end))
+    return result
+
+
 def simplify_dataframe(df: pd.DataFrame, always_preserve=[]):
     """
     Drop columns with constant values from the dataframe and collect them
@@ -71,10 +102,13 @@ def simplify_dataframe(df: pd.DataFrame, always_preserve=[]):
 
 def code_description_attrs_from_dataframe(df: pd.DataFrame):
     # create var_attrs_dict
-    colname_code_list = df.columns[df.columns.str.contains(".Code")]
-    colname_oms_list = df.columns[df.columns.str.contains(".Omschrijving")]
+    colname_code_list = df.columns[df.columns.str.endswith(".Code")]
     var_attrs_dict = {}
-    for colname_code, colname_oms in zip(colname_code_list, colname_oms_list):
+    for colname_code in colname_code_list:
+        # pair by name, since e.g. Parameter_Wat_Omschrijving has no Code column
+        colname_oms = colname_code.replace(".Code", ".Omschrijving")
+        if colname_oms not in df.columns:
+            continue
         meas_twocol = df[[colname_code, colname_oms]].drop_duplicates()
         attr_dict = meas_twocol.set_index(colname_code)[colname_oms].to_dict()
         # drop empty attribute names/keys since these are not supported when writing to netcdf file
@@ -109,6 +143,13 @@ def dataframe_to_xarray(df: pd.DataFrame, always_preserve=[]):
     if df_simple.index.tz is not None:
         df_simple.index = df_simple.index.tz_convert(None)
 
+    # convert categorical columns, e.g. from ddlpy.measurements(categorical=True), back
+    # to the dtype of their values since these are not supported by netcdf
+    for colname in df_simple.columns:
+        if isinstance(df_simple[colname].dtype, pd.CategoricalDtype):
+            categories_dtype = df_simple[colname].cat.categories.dtype
+            df_simple[colname] = df_simple[colname].astype(categories_dtype)
+
     # convert to xarray dataset and add ds_attrs
     ds = df_simple.to_xarray()
     ds = ds.assign_attrs(df_simple.attrs)
@@ -0,0 +1,74 @@
+"""
+This script compares the per-request latency of a new connection per request (plain
+requests.post) with the pooled keep-alive sessions of ddlpy.Client. It runs against a
+local stand-in server, so no Waterwebservices requests are done. The server adds a small
+delay per new connection to mimic the TCP/TLS handshake to the remote server.
+
+"""
+
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+import ddlpy
+from ddlpy.ddlpy import _send_post_request
+
+# delay per new connection in seconds, a TLS handshake to the DDL takes ~50 ms
+HANDSHAKE_DELAY = 0.02
+NREQUESTS = 100
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        time.sleep(HANDSHAKE_DELAY)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({"Succesvol": True, "WaarnemingenLijst": []}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def timeit(func):
+    tstart = time.perf_counter()
+    for _ in range(NREQUESTS):
+        func()
+    return (time.perf_counter() - tstart) / NREQUESTS * 1000
+
+
+if __name__ == "__main__":
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    url = f"http://{host}:{port}/ONLINEWAARNEMINGENSERVICES/OphalenWaarnemingen"
+    request = ddlpy.ddlpy.ENDPOINTS["collect_observations"]["request"]
+
+    # a new connection for every request, as ddlpy did before ddlpy.Client
+    def post_plain():
+        resp = requests.post(url, json=request, headers={"Connection": "close"})
+        resp.json()
+
+    client = ddlpy.Client()
+
+    def post_client():
+        _send_post_request(url, request, client=client)
+
+    ms_plain = timeit(post_plain)
+    ms_client = timeit(post_client)
+    print(f"requests.post: {ms_plain:.2f} ms per request")
+    print(f"ddlpy.Client:  {ms_client:.2f} ms per request")
+    print(f"speedup:       {ms_plain / ms_client:.1f}x")
+
+    client.close()
+    server.shutdown()
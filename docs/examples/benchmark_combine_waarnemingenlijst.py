@@ -0,0 +1,126 @@
+"""
+This script compares the number of parsed rows per second of the row based conversion
+of the OphalenWaarnemingen response to a DataFrame (one dict per measurement and
+pd.json_normalize, as ddlpy did before) with the columnar conversion of
+ddlpy.ddlpy._combine_waarnemingenlijst. It uses a generated response with the maximum
+number of observations per request, so no Waterwebservices requests are done.
+
+"""
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from ddlpy.ddlpy import _combine_waarnemingenlijst
+
+NROWS = 150000
+
+AQUOMETADATA = {
+    "ProcesType": "meting",
+    "Parameter_Wat_Omschrijving": "Waterhoogte Oppervlaktewater t.o.v. Normaal Amsterdams Peil in cm",
+    "BemonsteringsApparaat": {"Code": "NVT", "Omschrijving": "Niet van toepassing"},
+    "BemonsteringsMethode": {"Code": "NVT", "Omschrijving": "Niet van toepassing"},
+    "BemonsteringsSoort": {"Code": "01", "Omschrijving": "Rechtstreekse meting"},
+    "BioTaxon": {"Code": "NVT", "Omschrijving": "Niet van toepassing"},
+    "BioTaxon_Compartiment": {"Code": "NVT", "Omschrijving": "Niet van toepassing"},
+    "Compartiment": {"Code": "OW", "Omschrijving": "Oppervlaktewater"},
+    "Eenheid": {"Code": "cm", "Omschrijving": "centimeter"},
+    "Grootheid": {"Code": "WATHTE", "Omschrijving": "Waterhoogte"},
+    "Hoedanigheid": {"Code": "NAP", "Omschrijving": "t.o.v. Normaal Amsterdams Peil"},
+    "MeetApparaat": {"Code": "109", "Omschrijving": "Vlotter"},
+    "Parameter": {"Code": "NVT", "Omschrijving": "Niet van toepassing"},
+    "Typering": {"Code": "NVT", "Omschrijving": "Niet van toepassing"},
+    "WaardeBepalingsMethode": {"Code": "other:F001", "Omschrijving": "Rekenkundig"},
+}
+
+LOCATION = pd.Series(
+    {
+        "Coordinatenstelsel": "25831",
+        "Naam": "Hoek van Holland",
+        "Lon": 4.1,
+        "Lat": 52.0,
+    },
+    name="hoekvanholland",
+)
+
+
+def combine_waarnemingenlijst_json_normalize(result, location):
+    """the row based conversion up to ddlpy 0.10.0, also in tests/legacy.py"""
+    rows = []
+    for waarneming in result["WaarnemingenLijst"]:
+        for row in waarneming["MetingenLijst"]:
+            new_row = {}
+            for key, value in row["WaarnemingMetadata"].items():
+                new_row["WaarnemingMetadata." + key] = value
+            for key, val in row.items():
+                if key == "WaarnemingMetadata":
+                    continue
+                new_row[key] = val
+            for key, val in waarneming["AquoMetadata"].items():
+                if isinstance(val, dict) and "Code" in val and "Omschrijving" in val:
+                    new_row[key + ".Code"] = val["Code"]
+                    new_row[key + ".Omschrijving"] = val["Omschrijving"]
+                else:
+                    new_row[key] = val
+            rows.append(new_row)
+    df = pd.json_normalize(rows)
+    df["Code"] = location.get("Code", location.name)
+    for name in ["Coordinatenstelsel", "Naam", "Lon", "Lat"]:
+        df[name] = location[name]
+    bool_nan = df["WaarnemingMetadata.Kwaliteitswaardecode"] == "99"
+    df.loc[bool_nan, "Meetwaarde.Waarde_Numeriek"] = np.nan
+    df.loc[bool_nan, "Meetwaarde.Waarde_Alfanumeriek"] = "NaN"
+    df["time"] = pd.to_datetime(df["Tijdstip"], format="ISO8601")
+    df = df.set_index("time")
+    return df
+
+
+def get_result(nrows):
+    times = pd.date_range("2020-01-01", periods=nrows, freq="10min", tz="UTC+01:00")
+    values = np.round(100 * np.sin(np.arange(nrows) / 74.5), 0)
+    metingen = [
+        {
+            "Tijdstip": tijdstip,
+            "Meetwaarde": {
+                "Waarde_Numeriek": value,
+                "Waarde_Alfanumeriek": str(value),
+            },
+            "WaarnemingMetadata": {
+                "Statuswaarde": "Gecontroleerd",
+                "Kwaliteitswaardecode": "00",
+            },
+        }
+        for tijdstip, value in zip(
+            times.strftime("%Y-%m-%dT%H:%M:%S.000+01:00"), values
+        )
+    ]
+    waarneming = {"MetingenLijst": metingen, "AquoMetadata": AQUOMETADATA}
+    return {"Succesvol": True, "WaarnemingenLijst": [waarneming]}
+
+
+def rows_per_second(func, result):
+    tstart = time.perf_counter()
+    df = func(result, LOCATION)
+    rate = len(df) / (time.perf_counter() - tstart)
+
+    # measure the memory separately, since tracing slows down the conversion
+    tracemalloc.start()
+    func(result, LOCATION)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return rate, peak / 1e6, df
+
+
+if __name__ == "__main__":
+    result = get_result(NROWS)
+    rate_rows, mb_rows, df_rows = rows_per_second(
+        combine_waarnemingenlijst_json_normalize, result
+    )
+    rate_columns, mb_columns, df_columns = rows_per_second(
+        _combine_waarnemingenlijst, result
+    )
+    pd.testing.assert_frame_equal(df_rows, df_columns)
+    print(f"json_normalize: {rate_rows:,.0f} rows per second, peak {mb_rows:.0f} MB")
+    print(
+        f"columnar:       {rate_columns:,.0f} rows per second, peak {mb_columns:.0f} MB"
+    )
+    print(f"speedup:        {rate_columns / rate_rows:.1f}x")
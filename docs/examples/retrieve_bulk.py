@@ -0,0 +1,41 @@
+"""
+This script retrieves the data of multiple locations in parallel with
+ddlpy.bulk_measurements() and writes it to a Zarr store per location. Failed periods
+are listed in the status report instead of being lost.
+
+"""
+
+import ddlpy
+import datetime as dt
+
+# enabling info logging so we can see the summary of the retrieval
+import logging
+logging.basicConfig()
+logging.getLogger("ddlpy").setLevel(logging.INFO)
+
+
+if __name__ == "__main__":
+    # get locations
+    locations = ddlpy.locations()
+    bool_stations = locations.index.isin(["ijmuiden.buitenhaven", "dantziggat.zuid", "hoekvanholland", "ameland.nes"])
+    bool_procestype = locations["ProcesType"].isin(["meting"])  # meting/astronomisch/verwachting
+    bool_grootheid = locations["Grootheid.Code"].isin(["WATHTE"])  # waterlevel (WATHTE)
+    bool_groepering = locations["Groepering.Code"].isin([""])  # timeseries ("") versus extremes (GETETM2/GETETMSL2/GETETBRKD2/GETETBRKDMSL2)
+    bool_hoedanigheid = locations["Hoedanigheid.Code"].isin(["NAP"])  # vertical reference (NAP/MSL)
+    selected = locations.loc[
+        bool_stations
+        & bool_procestype
+        & bool_grootheid
+        & bool_groepering
+        & bool_hoedanigheid
+    ]
+
+    start_date = dt.datetime(2022, 1, 1)
+    end_date = dt.datetime(2022, 3, 1)
+
+    # one Zarr store per location, use ddlpy.ParquetSink(root) for a parquet dataset
+    sink = ddlpy.ZarrSink("./ddl_retrieved_data")
+    report = ddlpy.bulk_measurements(
+        selected, start_date, end_date, sink=sink, max_workers=4
+    )
+    print(report.loc[report["status"] == "failed"])
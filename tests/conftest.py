@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+
+"""Shared fixtures for tests that do not need the Waterwebservices."""
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import platformdirs
+import pandas as pd
+import pytest
+import ddlpy
+
+
+class StandinHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        request = json.loads(body) if body else None
+        with self.server.lock:
+            self.server.requests.append((self.path, request))
+            self.server.request_headers.append(dict(self.headers))
+            self.server.active += 1
+            self.server.max_active = max(self.server.max_active, self.server.active)
+        try:
+            status, response, headers = self.server.respond(self.path, request)
+        finally:
+            with self.server.lock:
+                self.server.active -= 1
+        if not isinstance(response, bytes):
+            response = json.dumps(response).encode()
+        accept_encoding = self.headers.get("Accept-Encoding", "")
+        compress = self.server.compress and "gzip" in accept_encoding
+        if compress and response:
+            response = gzip.compress(response)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if compress and response:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(response)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandinServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the Waterwebservices. Set `respond` to a function that takes the
+    path and the json request and returns a (status, response, headers) tuple.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandinHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = []
+        self.request_headers = []
+        # whether to gzip the responses if the client accepts it, like the
+        # Waterwebservices
+        self.compress = False
+        # the number of requests that are handled concurrently
+        self.active = 0
+        self.max_active = 0
+        self.respond = lambda path, request: (200, {"Succesvol": True}, {})
+
+    @property
+    def url(self):
+        host, port = self.server_address
+        return f"http://{host}:{port}"
+
+
+@pytest.fixture
+def standin_server():
+    server = StandinServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+AQUOMETADATA = {
+    "ProcesType": "meting",
+    "Parameter_Wat_Omschrijving": "Waterhoogte Oppervlaktewater t.o.v. Normaal Amsterdams Peil in cm",
+    "Compartiment": {"Code": "OW", "Omschrijving": "Oppervlaktewater"},
+    "Eenheid": {"Code": "cm", "Omschrijving": "centimeter"},
+    "Grootheid": {"Code": "WATHTE", "Omschrijving": "Waterhoogte"},
+    "Groepering": {"Code": "", "Omschrijving": ""},
+    "Hoedanigheid": {"Code": "NAP", "Omschrijving": "t.o.v. Normaal Amsterdams Peil"},
+    "MeetApparaat": {"Code": "10272", "Omschrijving": "other:Vlotterniveaumeter"},
+}
+
+LOCATIE = {
+    "Locatie_MessageID": 84020,
+    "Coordinatenstelsel": "25831",
+    "Code": "denhelder.marsdiep",
+    "Naam": "Den Helder Marsdiep",
+    "Lat": 52.96,
+    "Lon": 4.74,
+}
+
+# the Waterwebservices group amounts by Dutch winter time
+TZ_GROUPING = "UTC+01:00"
+
+
+class FakeDDL:
+    """
+    Responds to OphalenWaarnemingen and related requests like the Waterwebservices,
+    with 10-minute measurements between `data_start` and `data_end`.
+    """
+
+    def __init__(self, data_start="2000-01-01", data_end="2001-01-01", freq="10min"):
+        self.times = pd.date_range(data_start, data_end, freq=freq, tz="UTC")
+        self.limit = 160000
+        # location codes for which there is no data
+        self.codes_without_data = set()
+
+    def locaties_with_data(self, request):
+        return [
+            dict(LOCATIE, Code=locatie["Code"])
+            for locatie in request["LocatieLijst"]
+            if locatie["Code"] not in self.codes_without_data
+        ]
+
+    def times_in_period(self, request):
+        start = pd.Timestamp(request["Periode"]["Begindatumtijd"])
+        end = pd.Timestamp(request["Periode"]["Einddatumtijd"])
+        return self.times[(self.times >= start) & (self.times <= end)]
+
+    def metingen(self, times):
+        # M2-like tide, so the values only depend on the time
+        hours = (times - pd.Timestamp("2000-01-01", tz="UTC")) / pd.Timedelta(hours=1)
+        values = np.round(100 * np.sin(2 * np.pi * hours / 12.42), 0)
+        times_str = times.tz_convert(TZ_GROUPING).strftime(
+            "%Y-%m-%dT%H:%M:%S.000+01:00"
+        )
+        return [
+            {
+                "Tijdstip": tijdstip,
+                "Meetwaarde": {
+                    "Waarde_Numeriek": value,
+                    "Waarde_Alfanumeriek": str(value),
+                },
+                "WaarnemingMetadata": {
+                    "Statuswaarde": "Gecontroleerd",
+                    "Kwaliteitswaardecode": "00",
+                },
+            }
+            for tijdstip, value in zip(times_str, values)
+        ]
+
+    def ophalen_waarnemingen(self, request):
+        times = self.times_in_period(request)
+        if len(times) == 0 or request["Locatie"]["Code"] in self.codes_without_data:
+            return 204, b"", {}
+        if len(times) > self.limit:
+            response = {
+                "Succesvol": False,
+                "Foutmelding": "Het maximaal aantal waarnemingen (160000) is overschreden. Beperk uw request.",
+                "WaarnemingenLijst": [],
+            }
+            return 400, response, {}
+        waarneming = {
+            "Locatie": LOCATIE,
+            "MetingenLijst": self.metingen(times),
+            "AquoMetadata": AQUOMETADATA,
+        }
+        return 200, {"Succesvol": True, "WaarnemingenLijst": [waarneming]}, {}
+
+    def ophalen_aantal_waarnemingen(self, request):
+        times = self.times_in_period(request).tz_convert(TZ_GROUPING)
+        period = request["Groeperingsperiode"]
+        keys = {
+            "Jaar": ["year"],
+            "Maand": ["year", "month"],
+            "Dag": ["year", "month", "day"],
+        }
+        names = {"year": "Jaarnummer", "month": "Maandnummer", "day": "Dag"}
+        groups = pd.DataFrame({key: getattr(times, key) for key in keys[period]})
+        amounts = groups.groupby(keys[period]).size()
+        aantal_lijst = []
+        for index, amount in amounts.items():
+            index = index if isinstance(index, tuple) else (index,)
+            groeperingsperiode = {
+                names[key]: int(value) for key, value in zip(keys[period], index)
+            }
+            aantal_lijst.append(
+                {
+                    "Groeperingsperiode": groeperingsperiode,
+                    "AantalMetingen": int(amount),
+                }
+            )
+        per_periode = []
+        for locatie in self.locaties_with_data(request):
+            if aantal_lijst:
+                per_periode.append(
+                    {
+                        "Locatie": locatie,
+                        "AquoMetadata": AQUOMETADATA,
+                        "AantalMetingenPerPeriodeLijst": aantal_lijst,
+                    }
+                )
+        return (
+            200,
+            {"Succesvol": True, "AantalWaarnemingenPerPeriodeLijst": per_periode},
+            {},
+        )
+
+    def check_waarnemingen_aanwezig(self, request):
+        aanwezig = len(self.times_in_period(request)) > 0
+        aanwezig &= len(self.locaties_with_data(request)) > 0
+        return (
+            200,
+            {"Succesvol": True, "WaarnemingenAanwezig": str(aanwezig).lower()},
+            {},
+        )
+
+    def ophalen_laatste_waarnemingen(self, request):
+        # every combination of the requested locations and metadata
+        waarnemingen = []
+        for locatie in request["LocatieLijst"]:
+            for aquo in request["AquoPlusWaarnemingMetadataLijst"]:
+                aquometadata = dict(AQUOMETADATA)
+                for key, value in aquo["AquoMetadata"].items():
+                    if isinstance(value, dict):
+                        aquometadata[key] = dict(AQUOMETADATA[key], **value)
+                waarneming = {
+                    "Locatie": dict(LOCATIE, Code=locatie["Code"]),
+                    "MetingenLijst": self.metingen(self.times[-1:]),
+                    "AquoMetadata": aquometadata,
+                }
+                waarnemingen.append(waarneming)
+        return 200, {"Succesvol": True, "WaarnemingenLijst": waarnemingen}, {}
+
+    def ophalen_catalogus(self, request):
+        response = {
+            "Succesvol": True,
+            "AquoMetadataLijst": [{"AquoMetadata_MessageID": 1, **AQUOMETADATA}],
+            "LocatieLijst": [LOCATIE],
+            "AquoMetadataLocatieLijst": [
+                {
+                    "Locatie_MessageID": LOCATIE["Locatie_MessageID"],
+                    "AquoMetaData_MessageID": 1,
+                }
+            ],
+        }
+        return 200, response, {}
+
+    def __call__(self, path, request):
+        name = path.rsplit("/", 1)[-1]
+        if name == "OphalenCatalogus":
+            return self.ophalen_catalogus(request)
+        elif name == "OphalenWaarnemingen":
+            return self.ophalen_waarnemingen(request)
+        elif name == "OphalenAantalWaarnemingen":
+            return self.ophalen_aantal_waarnemingen(request)
+        elif name == "CheckWaarnemingenAanwezig":
+            return self.check_waarnemingen_aanwezig(request)
+        elif name == "OphalenLaatsteWaarnemingen":
+            return self.ophalen_laatste_waarnemingen(request)
+        return 404, b"", {}
+
+
+@pytest.fixture
+def fake_ddl(standin_server, monkeypatch, tmp_path):
+    """
+    Redirect the ddlpy endpoints to a stand-in server that responds like the
+    Waterwebservices, with 10-minute data in the year 2000. The fake catalog is cached
+    in a temporary directory instead of the user cache directory.
+    """
+    cachedir = str(tmp_path / "cache")
+    monkeypatch.setattr(platformdirs, "user_cache_dir", lambda: cachedir)
+    for key, endpoint in ddlpy.ddlpy.ENDPOINTS.items():
+        path = endpoint["url"].split("rijkswaterstaat.nl", 1)[1]
+        monkeypatch.setitem(endpoint, "url", standin_server.url + path)
+    ddlpy.locations.cache_clear()
+    fake = FakeDDL()
+    standin_server.respond = fake
+    yield fake
+    ddlpy.locations.cache_clear()
+    ddlpy.client.get_default_client().close()
+
+
+@pytest.fixture
+def fake_location():
+    """return sample location like a row of the ddlpy.locations() DataFrame"""
+    location = {
+        key: LOCATIE[key]
+        for key in ["Locatie_MessageID", "Coordinatenstelsel", "Naam", "Lat", "Lon"]
+    }
+    for key, value in AQUOMETADATA.items():
+        if isinstance(value, dict):
+            location[f"{key}.Code"] = value["Code"]
+            location[f"{key}.Omschrijving"] = value["Omschrijving"]
+        else:
+            location[key] = value
+    return pd.Series(location, name=LOCATIE["Code"])
+
+
+@pytest.fixture
+def fake_locations(fake_location):
+    """return sample locations like the ddlpy.locations() DataFrame"""
+    locations = pd.DataFrame([fake_location] * 4)
+    locations.index = ["denhelder.marsdiep", "hoekvanholland", "vlissingen", "delfzijl"]
+    locations.index.name = "Code"
+    locations.loc["vlissingen", "Grootheid.Code"] = "WINDSHD"
+    return locations
@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+"""
+The row based conversion of the OphalenWaarnemingen response up to ddlpy 0.10.0, which
+the columnar conversion of ddlpy.ddlpy._combine_waarnemingenlijst is compared against.
+The benchmark in docs/examples has its own copy, since docs is not shipped with the
+sdist.
+"""
+import numpy as np
+import pandas as pd
+
+
+def combine_waarnemingenlijst_json_normalize(result, location):
+    """the row based conversion up to ddlpy 0.10.0"""
+    rows = []
+    for waarneming in result["WaarnemingenLijst"]:
+        for row in waarneming["MetingenLijst"]:
+            new_row = {}
+            for key, value in row["WaarnemingMetadata"].items():
+                new_row["WaarnemingMetadata." + key] = value
+            for key, val in row.items():
+                if key == "WaarnemingMetadata":
+                    continue
+                new_row[key] = val
+            for key, val in waarneming["AquoMetadata"].items():
+                if isinstance(val, dict) and "Code" in val and "Omschrijving" in val:
+                    new_row[key + ".Code"] = val["Code"]
+                    new_row[key + ".Omschrijving"] = val["Omschrijving"]
+                else:
+                    new_row[key] = val
+            rows.append(new_row)
+    df = pd.json_normalize(rows)
+    df["Code"] = location.get("Code", location.name)
+    for name in ["Coordinatenstelsel", "Naam", "Lon", "Lat"]:
+        df[name] = location[name]
+    bool_nan = df["WaarnemingMetadata.Kwaliteitswaardecode"] == "99"
+    df.loc[bool_nan, "Meetwaarde.Waarde_Numeriek"] = np.nan
+    df.loc[bool_nan, "Meetwaarde.Waarde_Alfanumeriek"] = "NaN"
+    df["time"] = pd.to_datetime(df["Tijdstip"], format="ISO8601")
+    df = df.set_index("time")
+    return df
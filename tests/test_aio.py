@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `ddlpy.aio` module."""
+import asyncio
+import datetime as dt
+import pandas as pd
+import pytest
+import ddlpy
+import ddlpy.aio
+
+
+def test_aio_locations(fake_ddl):
+    # passing a catalog_filter avoids the cache
+    locations = asyncio.run(ddlpy.aio.locations(catalog_filter=["Grootheden"]))
+    assert locations.index.name == "Code"
+    assert locations.index[0] == "denhelder.marsdiep"
+    assert locations["Grootheid.Code"].iloc[0] == "WATHTE"
+
+
+def test_aio_measurements(fake_ddl, fake_location, standin_server):
+    start_date = dt.datetime(1999, 11, 1)
+    end_date = dt.datetime(2000, 4, 1)
+    measurements = asyncio.run(
+        ddlpy.aio.measurements(fake_location, start_date=start_date, end_date=end_date)
+    )
+    assert len(standin_server.requests) == 5
+    expected = ddlpy.measurements(
+        fake_location, start_date=start_date, end_date=end_date
+    )
+    pd.testing.assert_frame_equal(measurements, expected)
+
+
+def test_aio_measurements_shared_semaphore(fake_ddl, fake_location):
+    async def main():
+        semaphore = asyncio.Semaphore(2)
+        async with ddlpy.aio.aiohttp.ClientSession() as session:
+            tasks = [
+                ddlpy.aio.measurements(
+                    fake_location,
+                    start_date=f"2000-{month:02d}-01",
+                    end_date=f"2000-{month:02d}-03",
+                    freq=dateutil_daily,
+                    semaphore=semaphore,
+                    session=session,
+                )
+                for month in range(1, 5)
+            ]
+            return await asyncio.gather(*tasks)
+
+    dateutil_daily = ddlpy.aio.dateutil.rrule.DAILY
+    results = asyncio.run(main())
+    assert [len(x) for x in results] == [289] * 4
+
+
+def test_aio_measurements_error(fake_ddl, fake_location, standin_server):
+    standin_server.respond = lambda path, request: (500, b"Onverwachte fout", {})
+    with pytest.raises(IOError) as e:
+        asyncio.run(
+            ddlpy.aio.measurements(
+                fake_location, start_date="2000-01-01", end_date="2000-03-01"
+            )
+        )
+    assert "500 Internal Server Error" in str(e.value)
+
+
+def test_aio_measurements_split(fake_ddl, fake_location, caplog):
+    start_date = "2000-01-01"
+    end_date = "2000-03-01"
+    expected = ddlpy.measurements(
+        fake_location, start_date=start_date, end_date=end_date
+    )
+    fake_ddl.limit = 1000
+    caplog.set_level("INFO")
+    measurements = asyncio.run(
+        ddlpy.aio.measurements(fake_location, start_date=start_date, end_date=end_date)
+    )
+    pd.testing.assert_frame_equal(measurements, expected)
+    assert "14 periods were split in two" in caplog.text
+
+
+def test_aio_measurements_nodata(fake_ddl, fake_location):
+    measurements = asyncio.run(
+        ddlpy.aio.measurements(
+            fake_location, start_date="2050-01-01", end_date="2050-03-01"
+        )
+    )
+    assert measurements.empty
+
+
+def test_aio_measurements_latest(fake_ddl, fake_location):
+    latest = asyncio.run(ddlpy.aio.measurements_latest(fake_location))
+    assert len(latest) == 1
+    assert latest.index[0] == pd.Timestamp("2001-01-01", tz="UTC")
+
+
+def test_aio_measurements_available(fake_ddl, fake_location):
+    available = asyncio.run(
+        ddlpy.aio.measurements_available(
+            fake_location, start_date="2000-01-01", end_date="2000-02-01"
+        )
+    )
+    assert available is True
+    available = asyncio.run(
+        ddlpy.aio.measurements_available(
+            fake_location, start_date="2050-01-01", end_date="2050-02-01"
+        )
+    )
+    assert available is False
+
+
+def test_aio_measurements_amount(fake_ddl, fake_location):
+    amount = asyncio.run(
+        ddlpy.aio.measurements_amount(
+            fake_location,
+            start_date="2000-01-01",
+            end_date="2000-03-01",
+            period="Maand",
+        )
+    )
+    expected = ddlpy.measurements_amount(
+        fake_location, start_date="2000-01-01", end_date="2000-03-01", period="Maand"
+    )
+    pd.testing.assert_frame_equal(amount, expected)
+    assert amount.index.tolist() == ["2000-01", "2000-02", "2000-03"]
+
+
+def test_aio_measurements_freq_auto(fake_ddl, fake_location, standin_server):
+    fake_ddl.times = pd.date_range("1990-01-01", "2010-01-01", freq="7D", tz="UTC")
+    measurements = asyncio.run(
+        ddlpy.aio.measurements(
+            fake_location, start_date="1989-11-01", end_date="2012-04-01", freq="auto"
+        )
+    )
+    assert len(standin_server.requests) == 2
+    assert len(measurements) == len(fake_ddl.times)
+
+
+def test_aio_measurements_freq_auto_days(
+    fake_ddl, fake_location, standin_server, monkeypatch
+):
+    # the same periods as the synchronous version, see test_measurements_freq_auto_days
+    monkeypatch.setattr(ddlpy.ddlpy, "MAX_OBSERVATIONS", 3000)
+    fake_ddl.limit = 3001
+    measurements = asyncio.run(
+        ddlpy.aio.measurements(
+            fake_location, start_date="2000-01-01", end_date="2000-02-01", freq="auto"
+        )
+    )
+    groeperingsperiodes = [
+        request.get("Groeperingsperiode") for path, request in standin_server.requests
+    ]
+    assert groeperingsperiodes == ["Maand", "Dag", None, None]
+    assert len(measurements) == 31 * 144 + 1
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `ddlpy.bulk` module."""
+import time
+import threading
+import pandas as pd
+import pytest
+import ddlpy
+
+
+class ListSink:
+    def __init__(self):
+        self.chunks = []
+
+    def __call__(self, location, measurements):
+        self.chunks.append((location.name, measurements))
+
+
+def test_bulk_measurements(fake_ddl, fake_locations, standin_server):
+    fake_ddl.codes_without_data = {"delfzijl"}
+    respond = standin_server.respond
+
+    def respond_slow(path, request):
+        time.sleep(0.01)
+        return respond(path, request)
+
+    standin_server.respond = respond_slow
+    sink = ListSink()
+    start_date, end_date = "2000-01-01", "2000-04-01"
+    report = ddlpy.bulk_measurements(
+        fake_locations, start_date, end_date, sink=sink, max_workers=3
+    )
+    assert standin_server.max_active <= 3
+    assert report.index.name == "Code"
+    assert list(report.index.unique()) == list(fake_locations.index)
+    assert report.loc["delfzijl", "status"].tolist() == ["nodata"] * 3
+    assert (report.drop("delfzijl")["status"] == "done").all()
+    assert report["error"].isna().all()
+
+    # the chunks of every location are passed in chronological order
+    for code in ["denhelder.marsdiep", "vlissingen"]:
+        chunks = [chunk for label, chunk in sink.chunks if label == code]
+        assert len(chunks) == 3
+        measurements = pd.concat(chunks)
+        expected = ddlpy.measurements(fake_locations.loc[code], start_date, end_date)
+        pd.testing.assert_frame_equal(measurements, expected)
+        assert report.loc[code, "nmeasurements"].sum() == len(expected)
+
+
+def test_bulk_measurements_errors(fake_ddl, fake_locations, standin_server):
+    locations = fake_locations.iloc[:2]
+    respond = standin_server.respond
+
+    def respond_error(path, request):
+        # february of hoekvanholland fails
+        if request["Locatie"]["Code"] == "hoekvanholland" and request["Periode"][
+            "Begindatumtijd"
+        ].startswith("2000-02"):
+            return 500, b"Onverwachte fout", {}
+        return respond(path, request)
+
+    standin_server.respond = respond_error
+    sink = ListSink()
+    report = ddlpy.bulk_measurements(
+        locations, "2000-01-01", "2000-04-01", sink=sink, max_workers=2
+    )
+    statuses = report.loc["hoekvanholland", "status"].tolist()
+    assert statuses == ["done", "failed", "skipped"]
+    error = report.loc["hoekvanholland", "error"].iloc[1]
+    assert "500 Internal Server Error: Onverwachte fout" in error
+    assert (report.loc["denhelder.marsdiep", "status"] == "done").all()
+    assert [label for label, _ in sink.chunks].count("hoekvanholland") == 1
+
+    # errors of the sink are also reported
+    def sink_error(location, measurements):
+        raise OSError("disk full")
+
+    standin_server.respond = respond
+    report = ddlpy.bulk_measurements(
+        locations, "2000-01-01", "2000-03-01", sink=sink_error
+    )
+    assert report["status"].tolist() == ["failed", "skipped"] * 2
+    assert report["error"].iloc[0] == "OSError: disk full"
+
+
+def test_bulk_measurements_errors_skip(fake_ddl, fake_locations, standin_server):
+    locations = fake_locations.iloc[:2]
+    respond = standin_server.respond
+
+    def respond_error(path, request):
+        # every period of hoekvanholland fails
+        if request["Locatie"]["Code"] == "hoekvanholland":
+            return 500, b"Onverwachte fout", {}
+        return respond(path, request)
+
+    standin_server.respond = respond_error
+    client = ddlpy.Client(retry=ddlpy.RetryPolicy(max_attempts=1))
+    report = ddlpy.bulk_measurements(
+        locations,
+        "2000-01-01",
+        "2001-01-01",
+        sink=ListSink(),
+        max_workers=1,
+        client=client,
+    )
+    client.close()
+    statuses = report.loc["hoekvanholland", "status"].tolist()
+    assert statuses == ["failed"] + ["skipped"] * 11
+    assert (report.loc["denhelder.marsdiep", "status"] == "done").all()
+
+    # the periods after the failed period are not retrieved, except for the ones
+    # that were submitted ahead and started before the failure
+    codes = [request["Locatie"]["Code"] for _, request in standin_server.requests]
+    assert codes.count("hoekvanholland") <= 2
+
+
+def test_bulk_measurements_planning(
+    fake_ddl, fake_locations, standin_server, monkeypatch
+):
+    events = []
+    get_date_series = ddlpy.bulk._get_date_series
+
+    def get_date_series_slow(location, *args, **kwargs):
+        # like freq="auto", which retrieves the amount of measurements
+        time.sleep(0.05)
+        events.append(("plan", threading.current_thread() is threading.main_thread()))
+        return get_date_series(location, *args, **kwargs)
+
+    respond = standin_server.respond
+
+    def respond_recorded(path, request):
+        events.append(("request", None))
+        return respond(path, request)
+
+    monkeypatch.setattr(ddlpy.bulk, "_get_date_series", get_date_series_slow)
+    standin_server.respond = respond_recorded
+    report = ddlpy.bulk_measurements(
+        fake_locations, "2000-01-01", "2000-04-01", sink=ListSink(), max_workers=2
+    )
+    assert (report.drop("delfzijl")["status"] == "done").all()
+    # the locations are planned in the workers, and the first periods are retrieved
+    # before the last location is planned
+    plans = [i for i, (kind, _) in enumerate(events) if kind == "plan"]
+    assert len(plans) == len(fake_locations)
+    assert not any(events[i][1] for i in plans)
+    assert events.index(("request", None)) < plans[-1]
+
+
+def test_bulk_measurements_max_workers(fake_ddl, fake_locations):
+    # no worker would retrieve the tasks
+    with pytest.raises(ValueError, match="max_workers should be at least 1"):
+        ddlpy.bulk_measurements(
+            fake_locations.iloc[:1],
+            "2000-01-01",
+            "2000-02-01",
+            ListSink(),
+            max_workers=0,
+        )
+
+
+def test_bulk_measurements_parquet(fake_ddl, fake_locations, tmp_path):
+    root = str(tmp_path / "dataset")
+    sink = ddlpy.ParquetSink(root)
+    report = ddlpy.bulk_measurements(
+        fake_locations.iloc[:2], "2000-01-01", "2000-03-01", sink=sink
+    )
+    # a file per month per location, the last timestep is in March
+    assert len(sink.paths) == 6
+    dataset = pd.read_parquet(root)
+    assert len(dataset) == report["nmeasurements"].sum()
+
+
+def test_bulk_measurements_zarr(fake_ddl, fake_locations, tmp_path):
+    sink = ddlpy.ZarrSink(str(tmp_path / "stores"))
+    ddlpy.bulk_measurements(
+        fake_locations.iloc[:2], "2000-01-01", "2000-03-01", sink=sink
+    )
+    store = sink.get_store(fake_locations.iloc[0])
+    assert store.endswith(".zarr")
+    assert "denhelder.marsdiep" in store
+    assert len(sink._stores) == 2
+
+
+def test_bulk_measurements_resume(fake_ddl, fake_locations, standin_server, tmp_path):
+    locations = fake_locations.iloc[:2]
+    respond = standin_server.respond
+
+    def respond_error(path, request):
+        if request["Locatie"]["Code"] == "hoekvanholland" and request["Periode"][
+            "Begindatumtijd"
+        ].startswith("2000-02"):
+            return 500, b"Onverwachte fout", {}
+        return respond(path, request)
+
+    standin_server.respond = respond_error
+    with ddlpy.Manifest(str(tmp_path / "manifest.sqlite")) as manifest:
+        ddlpy.bulk_measurements(
+            locations, "2000-01-01", "2000-04-01", sink=ListSink(), manifest=manifest
+        )
+        records = manifest.to_dataframe().set_index(["code", "start_date"])
+        statuses = records.loc["hoekvanholland", "status"].tolist()
+        assert statuses == ["done", "failed", "pending"]
+        assert (records.loc["hoekvanholland", "nbytes"].iloc[0]) > 0
+
+        # only the failed and pending periods are retrieved again
+        standin_server.respond = respond
+        nrequests = len(standin_server.requests)
+        sink = ListSink()
+        report = ddlpy.bulk_measurements(
+            locations, "2000-01-01", "2000-04-01", sink=sink, manifest=manifest
+        )
+        assert len(standin_server.requests) - nrequests == 2
+        assert (report["status"] == "done").all()
+        assert report["resumed"].tolist() == [True] * 3 + [True, False, False]
+        assert [label for label, _ in sink.chunks] == ["hoekvanholland"] * 2
+        assert (manifest.to_dataframe()["status"] == "done").all()
+
+
+def test_manifest_unfinished_period(tmp_path):
+    request = {
+        "Locatie": {"Code": "hoekvanholland"},
+        "Periode": {
+            "Begindatumtijd": "2000-01-01T00:00:00.000+01:00",
+            "Einddatumtijd": "2100-01-01T00:00:00.000+01:00",
+        },
+    }
+    with ddlpy.Manifest(str(tmp_path / "manifest.sqlite")) as manifest:
+        assert manifest.get(request) is None
+        manifest.update(request, status="nodata")
+        assert manifest.get(request)["status"] == "nodata"
+        # the period was retrieved before its end, so it can contain new data
+        assert not manifest.is_finished(request)
+        request["Periode"]["Einddatumtijd"] = "2000-02-01T00:00:00.000+01:00"
+        manifest.update(request, status="nodata")
+        assert manifest.is_finished(request)
+        with pytest.raises(ValueError):
+            manifest.update(request, status="unknown")
+        manifest.clear()
+        assert manifest.to_dataframe().empty
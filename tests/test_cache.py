@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `ddlpy.cache` module."""
+import os
+import time
+import pandas as pd
+import pytest
+import ddlpy
+from ddlpy.ddlpy import _get_request_slice
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ddlpy.ChunkCache(cachedir=str(tmp_path))
+
+
+def _count_waarnemingen_requests(standin_server):
+    return sum(
+        path.endswith("/OphalenWaarnemingen") for path, _ in standin_server.requests
+    )
+
+
+def test_measurements_cache(fake_ddl, fake_location, standin_server, cache):
+    start_date, end_date = "2000-01-01", "2000-03-01"
+    measurements = ddlpy.measurements(fake_location, start_date, end_date, cache=cache)
+    assert _count_waarnemingen_requests(standin_server) == 2
+    assert cache.stats["misses"] == 2
+
+    measurements_cached = ddlpy.measurements(
+        fake_location, start_date, end_date, cache=cache, max_workers=2
+    )
+    assert _count_waarnemingen_requests(standin_server) == 2
+    assert cache.stats["hits"] == 2
+    pd.testing.assert_frame_equal(measurements_cached, measurements)
+
+    measurements_raw = ddlpy.measurements(
+        fake_location, start_date, end_date, cache=cache, clean_df=False
+    )
+    assert "Tijdstip" in measurements_raw.columns
+    assert measurements_raw.index.name == "time"
+
+
+def test_measurements_cache_dtypes(fake_ddl, fake_location, monkeypatch, cache):
+    metingen = fake_ddl.metingen
+
+    def metingen_missing(times):
+        # alphanumeric values, metadata that is missing or null in some metingen
+        metingen_list = metingen(times)
+        for imeting, meting in enumerate(metingen_list):
+            meting["Meetwaarde"]["Waarde_Alfanumeriek"] = ["NVT", "a", None][imeting % 3]
+            meting["WaarnemingMetadata"]["Opmerking"] = None
+            if imeting % 2 == 0:
+                del meting["WaarnemingMetadata"]["Kwaliteitswaardecode"]
+            if imeting % 5 == 0:
+                meting["WaarnemingMetadata"]["Bemonsteringshoogte"] = None
+        return metingen_list
+
+    monkeypatch.setattr(fake_ddl, "metingen", metingen_missing)
+    start_date, end_date = "2000-01-01", "2000-01-03"
+    for clean_df in [True, False]:
+        measurements = ddlpy.measurements(
+            fake_location, start_date, end_date, clean_df=clean_df
+        )
+        for _ in range(2):
+            measurements_cached = ddlpy.measurements(
+                fake_location, start_date, end_date, cache=cache, clean_df=clean_df
+            )
+            pd.testing.assert_frame_equal(measurements_cached, measurements)
+    assert cache.stats["hits"] > 0
+
+
+def test_measurements_cache_nodata(fake_ddl, fake_location, standin_server, cache):
+    start_date, end_date = "2010-01-01", "2010-02-01"
+    for _ in range(2):
+        measurements = ddlpy.measurements(
+            fake_location, start_date, end_date, cache=cache
+        )
+        assert measurements.empty
+    assert _count_waarnemingen_requests(standin_server) == 1
+
+
+def test_cache_ttl(fake_location, cache):
+    df = pd.DataFrame({"Tijdstip": ["2000-01-01T00:00:00.000+01:00"], "x": [1.0]})
+    request_old = _get_request_slice(fake_location, "2000-01-01", "2000-01-02")
+    now = pd.Timestamp.now(tz="UTC")
+    request_now = _get_request_slice(fake_location, now - pd.Timedelta("1D"), now)
+    cache.ttl = 60
+    for request in [request_old, request_now]:
+        cache.put(request, df)
+        assert cache.get(request) is not None
+
+    # pretend the chunks were retrieved two minutes ago
+    for request in [request_old, request_now]:
+        path = cache._get_path(request)
+        mtime = time.time() - 120
+        os.utime(path, (mtime, mtime))
+
+    # historical chunks do not expire, but the one overlapping with now does
+    assert cache.get(request_old) is not None
+    assert cache.get(request_now) is None
+    assert not os.path.exists(cache._get_path(request_now))
+
+
+def test_cache_eviction(fake_location, cache):
+    df = pd.DataFrame({"Tijdstip": ["2000-01-01T00:00:00.000+01:00"], "x": [1.0]})
+    requests = [
+        _get_request_slice(fake_location, f"2000-01-0{i}", f"2000-01-0{i + 1}")
+        for i in range(1, 4)
+    ]
+    cache.put(requests[0], df)
+    chunk_size = cache.size
+    cache.max_size = int(2.5 * chunk_size)
+    cache.put(requests[1], df)
+    # the first chunk is used again, so the second is the least recently used
+    time.sleep(0.01)
+    assert cache.get(requests[0]) is not None
+
+    cache.put(requests[2], df)
+    assert cache.size <= cache.max_size
+    assert cache.stats["evictions"] == 1
+    assert cache.get(requests[0]) is not None
+    assert cache.get(requests[1]) is None
+    assert cache.get(requests[2]) is not None
+
+    cache.clear()
+    assert cache.size == 0
+
+
+def test_cache_eviction_scan(fake_location, cache, monkeypatch):
+    df = pd.DataFrame({"Tijdstip": ["2000-01-01T00:00:00.000+01:00"], "x": [1.0]})
+    requests = [
+        _get_request_slice(fake_location, f"2000-01-{i:02d}", f"2000-01-{i + 1:02d}")
+        for i in range(1, 8)
+    ]
+    cache.put(requests[0], df)
+    cache.max_size = int(5.5 * cache.size)
+    scan = cache._scan
+    nscans = []
+
+    def scan_counted():
+        nscans.append(1)
+        return scan()
+
+    monkeypatch.setattr(cache, "_scan", scan_counted)
+    # the cache directory is only scanned when the estimated size exceeds max_size
+    for request in requests[1:5]:
+        cache.put(request, df)
+    assert len(nscans) == 0
+    # the sixth chunk does not fit, so the cache is reduced to 90% of max_size
+    cache.put(requests[5], df)
+    assert len(nscans) == 1
+    assert cache.stats["evictions"] == 2
+    assert len(scan()) == 4
+    # which leaves room for the next chunk without scanning again
+    cache.put(requests[6], df)
+    assert len(nscans) == 1
+
+
+def test_cache_write_error(fake_location, cache, monkeypatch, caplog):
+    df = pd.DataFrame({"Tijdstip": ["2000-01-01T00:00:00.000+01:00"], "x": [1.0]})
+    request = _get_request_slice(fake_location, "2000-01-01", "2000-01-02")
+
+    def to_parquet_error(self, path, **kwargs):
+        # a partially written file is left behind
+        with open(path, "wb") as f:
+            f.write(b"PAR1")
+        raise OSError("disk full")
+
+    monkeypatch.setattr(pd.DataFrame, "to_parquet", to_parquet_error)
+    cache.put(request, df)
+    assert "disk full" in caplog.text
+    assert cache.stats["write_errors"] == 1
+    assert os.listdir(cache.cachedir) == []
+    assert cache.get(request) is None
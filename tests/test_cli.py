@@ -4,8 +4,9 @@ Created on Wed Mar 13 07:44:47 2024
 
 @author: veenstra
 """
-
 import os
+import pandas as pd
+import ddlpy
 from click.testing import CliRunner
 from ddlpy import cli
 import importlib
@@ -76,3 +77,115 @@ def test_command_line_interface(tmp_path):
     measurements_result = runner.invoke(cli.cli, measurements_command.split())
     assert measurements_result.exit_code == 0
     assert os.path.exists(file_meas)
+
+
+def test_command_line_interface_resume(fake_ddl, fake_locations, tmp_path):
+    os.chdir(tmp_path)
+    fake_ddl.codes_without_data = {"delfzijl"}
+    locations = fake_locations.iloc[[0, 3]].reset_index()
+    locations["Parameter.Code"] = "NVT"
+    locations["Typering.Code"] = "NVT"
+    locations.to_json("locations.json", orient="records")
+    file_meas = "denhelder.marsdiep_meting_OW_cm_WATHTE__NAP_NVT_NVT.csv"
+
+    runner = CliRunner()
+    command = "measurements 2000-01-01 2000-03-01 --resume --max-workers 2"
+    result = runner.invoke(cli.cli, command.split())
+    assert result.exit_code == 0
+    assert "Data for station denhelder.marsdiep were retrieved" in result.output
+    assert "No data available for station delfzijl" in result.output
+    measurements = pd.read_csv(file_meas, index_col=0)
+    assert len(measurements) == (31 + 29) * 144 + 1
+    assert os.path.exists(cli.MANIFEST_FILENAME)
+
+    # a longer period only retrieves the new periods and appends them
+    command = "measurements 2000-01-01 2000-04-01 --resume"
+    result = runner.invoke(cli.cli, command.split())
+    assert result.exit_code == 0
+    measurements = pd.read_csv(file_meas, index_col=0)
+    assert len(measurements) == (31 + 29 + 31) * 144 + 1
+    assert measurements.index.is_unique
+
+
+def test_command_line_interface_resume_unfinished(
+    fake_ddl, fake_locations, tmp_path, monkeypatch
+):
+    # periods that ended after they were retrieved are retrieved again
+    monkeypatch.setattr(ddlpy.Manifest, "is_finished", lambda self, request: False)
+    os.chdir(tmp_path)
+    locations = fake_locations.iloc[[0]].reset_index()
+    locations["Parameter.Code"] = "NVT"
+    locations["Typering.Code"] = "NVT"
+    locations.to_json("locations.json", orient="records")
+    file_meas = "denhelder.marsdiep_meting_OW_cm_WATHTE__NAP_NVT_NVT.csv"
+
+    runner = CliRunner()
+    command = "measurements 2000-01-01 2000-03-01 --resume"
+    for _ in range(2):
+        result = runner.invoke(cli.cli, command.split())
+        assert result.exit_code == 0
+    measurements = pd.read_csv(file_meas, index_col=0)
+    assert len(measurements) == (31 + 29) * 144 + 1
+    assert measurements.index.is_unique
+
+
+def test_csv_sink_columns(fake_ddl, fake_location, tmp_path):
+    os.chdir(tmp_path)
+    measurements = ddlpy.measurements(fake_location, "2000-01-01", "2000-01-03")
+    first, second = measurements.iloc[:144], measurements.iloc[144:]
+    location = fake_location.copy()
+    location["Code"] = location.name
+    location["Parameter.Code"] = "NVT"
+    location["Typering.Code"] = "NVT"
+    cli._CsvSink()(location, first)
+
+    # missing columns are left empty
+    sink = cli._CsvSink(resume=True)
+    sink(location, second.drop(columns="Meetwaarde.Waarde_Alfanumeriek"))
+    filename = cli._get_csv_filename(location)
+    written = pd.read_csv(filename, index_col=0)
+    assert list(written.columns) == list(measurements.columns)
+    assert len(written) == len(measurements)
+    assert written["Meetwaarde.Waarde_Alfanumeriek"].iloc[144:].isna().all()
+
+    # new columns are added to the file and empty in the previous rows
+    extra = measurements.iloc[-1:].assign(extra=1)
+    extra.index = extra.index + pd.Timedelta("10min")
+    sink(location, extra)
+    written = pd.read_csv(filename, index_col=0)
+    assert list(written.columns) == list(measurements.columns) + ["extra"]
+    assert len(written) == len(measurements) + 1
+    assert written["extra"].iloc[:-1].isna().all()
+    assert written["extra"].iloc[-1] == 1
+
+
+def test_command_line_interface_columns(
+    fake_ddl, fake_locations, tmp_path, monkeypatch
+):
+    # the measurements of february have a metadata column that january lacks
+    metingen = fake_ddl.metingen
+
+    def metingen_columns(times):
+        metingen_list = metingen(times)
+        for meting, time in zip(metingen_list, times):
+            if time.month == 2:
+                meting["WaarnemingMetadata"]["Bemonsteringshoogte"] = "-999999999"
+        return metingen_list
+
+    monkeypatch.setattr(fake_ddl, "metingen", metingen_columns)
+    os.chdir(tmp_path)
+    locations = fake_locations.iloc[[0]].reset_index()
+    locations["Parameter.Code"] = "NVT"
+    locations["Typering.Code"] = "NVT"
+    locations.to_json("locations.json", orient="records")
+    file_meas = "denhelder.marsdiep_meting_OW_cm_WATHTE__NAP_NVT_NVT.csv"
+
+    runner = CliRunner()
+    command = "measurements 2000-01-01 2000-03-01"
+    result = runner.invoke(cli.cli, command.split())
+    assert result.exit_code == 0
+    measurements = pd.read_csv(file_meas, index_col=0)
+    assert len(measurements) == (31 + 29) * 144 + 1
+    column = "WaarnemingMetadata.Bemonsteringshoogte"
+    assert measurements[column].iloc[: 31 * 144].isna().all()
+    assert measurements[column].iloc[31 * 144:-1].notna().all()
@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `ddlpy.client` module."""
+import os
+import json
+import time
+import threading
+import pytest
+import requests
+import ddlpy
+from ddlpy.client import get_default_client, _reserve_token, HAS_BROTLI
+from ddlpy.locking import FileLock, _atomic_write
+from ddlpy.ddlpy import _send_post_request, NoDataError
+
+
+def test_client_reuses_connection(standin_server):
+    with ddlpy.Client() as client:
+        for _ in range(5):
+            result = _send_post_request(
+                f"{standin_server.url}/test", request={}, client=client
+            )
+            assert result["Succesvol"]
+    assert len(standin_server.requests) == 5
+    assert standin_server.connections == 1
+
+
+def test_client_no_keep_alive(standin_server):
+    with ddlpy.Client(keep_alive=False) as client:
+        for _ in range(5):
+            _send_post_request(f"{standin_server.url}/test", request={}, client=client)
+    assert standin_server.connections == 5
+
+
+def test_client_session_per_thread():
+    client = ddlpy.Client()
+    sessions = []
+
+    def get_session():
+        # the same session for every request of a thread
+        session = client.session
+        assert client.session is session
+        sessions.append(session)
+
+    threads = [threading.Thread(target=get_session) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    get_session()
+    assert len(set(id(x) for x in sessions)) == 4
+
+    # the session is recreated if the process id changes, e.g. after a fork
+    session = client.session
+    client._local.pid = os.getpid() + 1
+    assert client.session is not session
+    assert client.session is client.session
+    client.close()
+    assert len(client._sessions) == 0
+    assert client.session is not sessions[-1]
+    client.close()
+
+
+def test_client_threads(standin_server):
+    # every thread reuses the connection of its own session
+    with ddlpy.Client() as client:
+
+        def send():
+            for _ in range(5):
+                _send_post_request(
+                    f"{standin_server.url}/test", request={}, client=client
+                )
+
+        threads = [threading.Thread(target=send) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert len(standin_server.requests) == 15
+    assert standin_server.connections == 3
+
+
+def test_client_headers_and_pool():
+    client = ddlpy.Client(pool_maxsize=20, headers={"User-Agent": "test"})
+    session = client.session
+    assert session.headers["User-Agent"] == "test"
+    assert session.get_adapter("https://example.com")._pool_maxsize == 20
+    client.close()
+
+
+def test_send_post_request_default_client(standin_server):
+    _send_post_request(f"{standin_server.url}/test", request={})
+    _send_post_request(f"{standin_server.url}/test", request={})
+    assert standin_server.connections == 1
+    assert get_default_client() is get_default_client()
+    get_default_client().close()
+
+
+def test_send_post_request_errors(standin_server):
+    standin_server.respond = lambda path, request: (204, b"", {})
+    with ddlpy.Client() as client:
+        with pytest.raises(NoDataError):
+            _send_post_request(f"{standin_server.url}/test", request={}, client=client)
+        standin_server.respond = lambda path, request: (500, {"Foutmelding": "x"}, {})
+        with pytest.raises(IOError) as e:
+            _send_post_request(f"{standin_server.url}/test", request={}, client=client)
+    assert "500 Internal Server Error" in str(e.value)
+
+
+def test_client_retry_status(standin_server, caplog):
+    statuses = [503, 502]
+
+    def respond(path, request):
+        if statuses:
+            return statuses.pop(0), b"Service Unavailable", {}
+        return 200, {"Succesvol": True}, {}
+
+    standin_server.respond = respond
+    retry = ddlpy.RetryPolicy(backoff_base=0.01)
+    with ddlpy.Client(retry=retry) as client:
+        result = _send_post_request(f"{standin_server.url}/test", {}, client=client)
+    assert result["Succesvol"]
+    assert client.stats["requests"] == 3
+    assert client.stats["retries"] == 2
+    assert "Attempt 1 of 4 failed with 503 Service Unavailable" in caplog.text
+
+
+def test_client_retry_exhausted(standin_server):
+    standin_server.respond = lambda path, request: (503, b"Service Unavailable", {})
+    retry = ddlpy.RetryPolicy(max_attempts=3, backoff_base=0.01)
+    with ddlpy.Client(retry=retry) as client:
+        with pytest.raises(IOError) as e:
+            _send_post_request(f"{standin_server.url}/test", {}, client=client)
+    assert "503 Service Unavailable" in str(e.value)
+    assert client.stats["requests"] == 3
+    assert client.stats["retries"] == 2
+
+
+def test_client_retry_not_retryable(standin_server):
+    standin_server.respond = lambda path, request: (500, b"Onverwachte fout", {})
+    with ddlpy.Client(retry=ddlpy.RetryPolicy(backoff_base=0.01)) as client:
+        with pytest.raises(IOError):
+            _send_post_request(f"{standin_server.url}/test", {}, client=client)
+    assert client.stats["retries"] == 0
+
+    retry = ddlpy.RetryPolicy(backoff_base=0.01, retry_status=[500])
+    with ddlpy.Client(retry=retry) as client:
+        with pytest.raises(IOError):
+            _send_post_request(f"{standin_server.url}/test", {}, client=client)
+    assert client.stats["retries"] == 3
+
+
+def test_client_retry_connection_error():
+    # nothing is listening on port 1
+    retry = ddlpy.RetryPolicy(max_attempts=2, backoff_base=0.01)
+    with ddlpy.Client(retry=retry) as client:
+        with pytest.raises(requests.exceptions.ConnectionError):
+            client.post("http://127.0.0.1:1/test", json={})
+    assert client.stats["requests"] == 2
+    assert client.stats["retries"] == 1
+
+
+def test_retry_policy_backoff():
+    retry = ddlpy.RetryPolicy(backoff_base=1, backoff_cap=5, jitter=False)
+    delays = [retry.backoff(attempt) for attempt in range(1, 6)]
+    assert delays == [1, 2, 4, 5, 5]
+    assert retry.backoff(1, retry_after=3) == 3
+    assert retry.backoff(1, retry_after=60) == 5
+
+    retry = ddlpy.RetryPolicy(backoff_base=1, backoff_cap=5, jitter=True)
+    for attempt in range(1, 6):
+        assert 0 <= retry.backoff(attempt) <= min(5, 2 ** (attempt - 1))
+
+
+def test_reserve_token():
+    # a burst of two tokens, after which a token is added every second
+    tat, waits = 0.0, []
+    for now in [10, 10, 10, 10.5, 20]:
+        wait, tat = _reserve_token(tat, now, interval=1, burst=2)
+        waits.append(wait)
+    assert waits == [0, 0, 1, 1.5, 0]
+
+
+def _send_requests_in_threads(url, client, nrequests):
+    def send():
+        _send_post_request(f"{url}/test", request={}, client=client)
+
+    threads = [threading.Thread(target=send) for _ in range(nrequests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_client_rate_limiter(standin_server):
+    rate_limiter = ddlpy.RateLimiter(rate=20)
+    with ddlpy.Client(rate_limiter=rate_limiter) as client:
+        tstart = time.monotonic()
+        _send_requests_in_threads(standin_server.url, client, nrequests=6)
+        duration = time.monotonic() - tstart
+    assert len(standin_server.requests) == 6
+    # the first request is sent immediately
+    assert duration >= 5 / 20
+    assert rate_limiter.stats["throttled"] == 5
+
+
+def test_client_rate_limiter_in_flight(standin_server):
+    def respond(path, request):
+        time.sleep(0.05)
+        return 200, {"Succesvol": True}, {}
+
+    standin_server.respond = respond
+    rate_limiter = ddlpy.RateLimiter(max_in_flight=2)
+    with ddlpy.Client(rate_limiter=rate_limiter) as client:
+        _send_requests_in_threads(standin_server.url, client, nrequests=6)
+    assert len(standin_server.requests) == 6
+    assert standin_server.max_active == 2
+
+
+def test_rate_limiter_shared_path(tmp_path):
+    # the limiters of different processes share their state through the lock files
+    path = str(tmp_path / "ratelimit")
+    rate_limiters = [
+        ddlpy.RateLimiter(rate=20, max_in_flight=1, path=path) for _ in range(2)
+    ]
+    tstart = time.monotonic()
+    for rate_limiter in rate_limiters * 2:
+        with rate_limiter.limit():
+            pass
+    assert time.monotonic() - tstart >= 3 / 20
+
+    with rate_limiters[0].limit():
+        lock = FileLock(os.path.join(path, "slot0.lock"))
+        assert not lock.acquire(blocking=False)
+    assert lock.acquire(blocking=False)
+    lock.release()
+
+
+def test_rate_limiter_invalid():
+    with pytest.raises(ValueError):
+        ddlpy.RateLimiter(rate=0)
+    with pytest.raises(ValueError):
+        ddlpy.RateLimiter(max_in_flight=0)
+
+
+def test_file_lock(tmp_path):
+    path = str(tmp_path / "test.lock")
+    with FileLock(path):
+        assert not FileLock(path).acquire(blocking=False)
+        with pytest.raises(TimeoutError):
+            FileLock(path, timeout=0.05).acquire()
+    with FileLock(path, timeout=0.05):
+        pass
+
+
+def test_atomic_write(tmp_path):
+    path = str(tmp_path / "test.txt")
+
+    def write(text):
+        def write_func(path_tmp):
+            with open(path_tmp, "w") as f:
+                f.write(text)
+            if text == "error":
+                raise OSError("disk full")
+
+        return write_func
+
+    _atomic_write(path, write("first"))
+    # the previous version is kept and the temporary file is removed on errors
+    with pytest.raises(OSError):
+        _atomic_write(path, write("error"))
+    assert os.listdir(tmp_path) == ["test.txt"]
+    with open(path) as f:
+        assert f.read() == "first"
+
+
+def test_coalescer():
+    coalescer = ddlpy.Coalescer(ttl=0.1, maxsize=2)
+    calls = []
+    started = threading.Event()
+
+    def func():
+        calls.append(1)
+        started.set()
+        time.sleep(0.05)
+        return len(calls)
+
+    results = []
+    thread = threading.Thread(target=lambda: results.append(coalescer.call("a", func)))
+    thread.start()
+    started.wait()
+    # waits for the call in flight
+    results.append(coalescer.call("a", func))
+    thread.join()
+    # reuses the finished result
+    results.append(coalescer.call("a", func))
+    assert results == [1, 1, 1]
+    assert coalescer.stats == {"calls": 1, "coalesced": 1, "memo": 1}
+
+    # the result expires
+    time.sleep(0.1)
+    assert coalescer.call("a", func) == 2
+    for key in ["b", "c"]:
+        coalescer.call(key, func)
+    assert list(coalescer._memo) == ["b", "c"]
+
+
+def test_coalescer_error():
+    coalescer = ddlpy.Coalescer()
+
+    def func():
+        raise NoDataError("no data")
+
+    for _ in range(2):
+        with pytest.raises(NoDataError):
+            coalescer.call("a", func)
+    # errors are not reused
+    assert coalescer.stats["calls"] == 2
+
+
+def test_client_accept_encoding(standin_server):
+    with ddlpy.Client() as client:
+        _send_post_request(f"{standin_server.url}/test", request={}, client=client)
+    accept_encoding = standin_server.request_headers[-1]["Accept-Encoding"]
+    assert accept_encoding.startswith("gzip, deflate")
+    assert ("br" in accept_encoding) == HAS_BROTLI
+
+
+def test_client_compressed_response(standin_server):
+    response = {"Succesvol": True, "WaarnemingenLijst": [{"Waarde": 1.0}] * 1000}
+    standin_server.respond = lambda path, request: (200, response, {})
+    standin_server.compress = True
+    with ddlpy.Client() as client:
+        result = _send_post_request(f"{standin_server.url}/test", {}, client=client)
+    assert result == response
+    assert client.stats["bytes_decompressed"] == len(json.dumps(response))
+    assert client.stats["bytes_compressed"] < client.stats["bytes_decompressed"] / 10
+
+
+def test_client_compress_requests(standin_server):
+    request = {"Locatie": {"Code": "denhelder.marsdiep"}}
+    with ddlpy.Client(compress_requests=True) as client:
+        _send_post_request(f"{standin_server.url}/test", request, client=client)
+    assert standin_server.requests[-1] == ("/test", request)
+    assert standin_server.request_headers[-1]["Content-Encoding"] == "gzip"
@@ -2,13 +2,27 @@
 # -*- coding: utf-8 -*-
 
 """Tests for `ddlpy` package."""
+import io
+import os
+import json
+import time
+import threading
 import datetime as dt
+from unittest.mock import patch
 import pandas as pd
 import pytest
 import ddlpy
 import dateutil
 import numpy as np
-from ddlpy.ddlpy import _send_post_request, NoDataError, get_catalogfile_cache
+import xarray as xr
+from ddlpy.ddlpy import (
+    _send_post_request,
+    NoDataError,
+    get_catalogfile_cache,
+    get_locationsfile_cache,
+)
+from ddlpy.locking import FileLock
+from legacy import combine_waarnemingenlijst_json_normalize
 
 DTYPES_NONSTRING = {
     "Locatie_MessageID": np.int64,
@@ -780,3 +794,572 @@ def test_code_description_attrs_from_dataframe_prevent_empty(measurements):
     attr_dict = ddlpy.utils.code_description_attrs_from_dataframe(measurements)
     for attr_key_value_pairs in attr_dict.values():
         assert "" not in attr_key_value_pairs.keys()
+
+
+def test_measurements_max_workers(fake_ddl, fake_location, standin_server):
+    # the period starts before the available data, these chunks are skipped
+    start_date = dt.datetime(1999, 10, 1)
+    end_date = dt.datetime(2000, 6, 1)
+    measurements_serial = ddlpy.measurements(
+        fake_location, start_date=start_date, end_date=end_date
+    )
+    measurements_parallel = ddlpy.measurements(
+        fake_location, start_date=start_date, end_date=end_date, max_workers=4
+    )
+    assert len(standin_server.requests) == 16
+    assert measurements_parallel.index.is_monotonic_increasing
+    assert measurements_parallel.index[0] == pd.Timestamp("2000-01-01", tz="UTC")
+    pd.testing.assert_frame_equal(measurements_serial, measurements_parallel)
+
+
+def test_measurements_max_workers_capped(fake_ddl, fake_location, caplog):
+    start_date = dt.datetime(2000, 1, 1)
+    end_date = dt.datetime(2000, 3, 1)
+    max_workers = ddlpy.ddlpy.MAX_WORKERS + 1
+    measurements = ddlpy.measurements(
+        fake_location, start_date=start_date, end_date=end_date, max_workers=max_workers
+    )
+    assert not measurements.empty
+    assert f"using max_workers={ddlpy.ddlpy.MAX_WORKERS} instead" in caplog.text
+
+
+def test_measurements_max_workers_invalid(fake_ddl, fake_location):
+    with pytest.raises(ValueError, match="max_workers should be at least 1"):
+        ddlpy.measurements(
+            fake_location, start_date="2000-01-01", end_date="2000-03-01", max_workers=0
+        )
+
+
+def test_measurements_max_workers_error(fake_ddl, fake_location, standin_server):
+    standin_server.respond = lambda path, request: (500, b"Onverwachte fout", {})
+    start_date = dt.datetime(2000, 1, 1)
+    end_date = dt.datetime(2000, 3, 1)
+    with pytest.raises(IOError) as e:
+        _ = ddlpy.measurements(
+            fake_location, start_date=start_date, end_date=end_date, max_workers=2
+        )
+    assert "500 Internal Server Error: Onverwachte fout" in str(e.value)
+
+
+@pytest.mark.parametrize("max_workers", [None, 2])
+def test_iter_measurements(fake_ddl, fake_location, max_workers):
+    start_date = dt.datetime(1999, 11, 1)
+    end_date = dt.datetime(2000, 4, 1)
+    chunks = list(
+        ddlpy.iter_measurements(
+            fake_location, start_date, end_date, max_workers=max_workers
+        )
+    )
+    # the period without data is skipped, december only contains the first timestep
+    assert len(chunks) == 4
+    for chunk in chunks:
+        assert chunk.index.is_monotonic_increasing
+        assert "Tijdstip" not in chunk.columns
+
+    # the measurements at the period boundaries are only yielded once
+    measurements = pd.concat(chunks)
+    assert measurements.index.is_unique
+    expected = ddlpy.measurements(fake_location, start_date, end_date)
+    pd.testing.assert_frame_equal(measurements, expected)
+
+    chunks_raw = list(
+        ddlpy.iter_measurements(fake_location, start_date, end_date, clean_df=False)
+    )
+    assert len(pd.concat(chunks_raw)) > len(measurements)
+    assert "Tijdstip" in chunks_raw[0].columns
+
+
+def test_measurements_freq_auto(fake_ddl, fake_location, standin_server):
+    # sparse timeseries in 20 years of which the measurements fit in one request
+    fake_ddl.times = pd.date_range("1990-01-01", "2010-01-01", freq="7D", tz="UTC")
+    start_date = dt.datetime(1989, 11, 1)
+    end_date = dt.datetime(2012, 4, 1)
+    measurements_auto = ddlpy.measurements(
+        fake_location, start_date=start_date, end_date=end_date, freq="auto"
+    )
+    paths = [path for path, request in standin_server.requests]
+    assert len(paths) == 2
+    assert paths[0].endswith("OphalenAantalWaarnemingen")
+    assert paths[1].endswith("OphalenWaarnemingen")
+    measurements_yearly = ddlpy.measurements(
+        fake_location,
+        start_date=start_date,
+        end_date=end_date,
+        freq=dateutil.rrule.YEARLY,
+    )
+    pd.testing.assert_frame_equal(measurements_auto, measurements_yearly)
+
+
+def test_measurements_freq_auto_dense(
+    fake_ddl, fake_location, standin_server, monkeypatch
+):
+    # the 10-minute measurements of two months fit in one request
+    monkeypatch.setattr(ddlpy.ddlpy, "MAX_OBSERVATIONS", 10000)
+    fake_ddl.limit = 10001
+    start_date = dt.datetime(2000, 1, 1)
+    end_date = dt.datetime(2000, 7, 1)
+    measurements_auto = ddlpy.measurements(
+        fake_location, start_date=start_date, end_date=end_date, freq="auto"
+    )
+    assert len(standin_server.requests) == 1 + 3
+    measurements_monthly = ddlpy.measurements(
+        fake_location, start_date=start_date, end_date=end_date
+    )
+    pd.testing.assert_frame_equal(measurements_auto, measurements_monthly)
+
+
+def test_measurements_freq_auto_days(
+    fake_ddl, fake_location, standin_server, monkeypatch
+):
+    # the 10-minute measurements of a month do not fit in one request, so the
+    # amounts per day are retrieved and 20 days are combined per request
+    monkeypatch.setattr(ddlpy.ddlpy, "MAX_OBSERVATIONS", 3000)
+    fake_ddl.limit = 3001
+    start_date = dt.datetime(2000, 1, 1)
+    end_date = dt.datetime(2000, 2, 1)
+    measurements_auto = ddlpy.measurements(
+        fake_location, start_date=start_date, end_date=end_date, freq="auto"
+    )
+    periods = [request["Periode"] for path, request in standin_server.requests]
+    groeperingsperiodes = [
+        request.get("Groeperingsperiode") for path, request in standin_server.requests
+    ]
+    assert groeperingsperiodes == ["Maand", "Dag", None, None]
+    assert periods[2] == {
+        "Begindatumtijd": "2000-01-01T00:00:00.000+00:00",
+        "Einddatumtijd": "2000-01-20T23:00:00.000+00:00",
+    }
+    assert len(measurements_auto) == 31 * 144 + 1
+
+
+def test_measurements_freq_auto_nodata(fake_ddl, fake_location, standin_server):
+    measurements = ddlpy.measurements(
+        fake_location, start_date="2050-01-01", end_date="2050-02-01", freq="auto"
+    )
+    assert measurements.empty
+    assert len(standin_server.requests) == 1
+
+
+@pytest.mark.parametrize("max_workers", [None, 4])
+def test_measurements_split(fake_ddl, fake_location, caplog, max_workers):
+    start_date = dt.datetime(2000, 1, 1)
+    end_date = dt.datetime(2000, 3, 1)
+    expected = ddlpy.measurements(
+        fake_location, start_date=start_date, end_date=end_date
+    )
+    # a month of 10-minute data contains ~4400 values, so each month is split 7 times:
+    # in 2 periods of ~2200 values, 4 periods of ~1100 values and 8 periods of ~550 values
+    fake_ddl.limit = 1000
+    caplog.set_level("INFO")
+    measurements = ddlpy.measurements(
+        fake_location,
+        start_date=start_date,
+        end_date=end_date,
+        max_workers=max_workers,
+    )
+    pd.testing.assert_frame_equal(measurements, expected)
+    assert "14 periods were split in two" in caplog.text
+
+
+def test_send_post_request_observation_limit(fake_ddl, fake_location):
+    fake_ddl.limit = 1000
+    request = ddlpy.ddlpy._get_request_slice(fake_location, "2000-01-01", "2000-02-01")
+    url = ddlpy.ddlpy.ENDPOINTS["collect_observations"]["url"]
+    with pytest.raises(ddlpy.ddlpy.ObservationLimitError) as e:
+        _send_post_request(url, request)
+    # backwards compatible with the IOError that was raised before
+    assert isinstance(e.value, IOError)
+    assert "Het maximaal aantal waarnemingen (160000) is overschreden" in str(e.value)
+
+
+def test_split_period():
+    start_date, middle_date, end_date = ddlpy.ddlpy._split_period(
+        "2000-01-01", "2000-01-02 00:00:01"
+    )
+    assert middle_date == pd.Timestamp("2000-01-01 12:00:00", tz="UTC")
+    with pytest.raises(ValueError):
+        ddlpy.ddlpy._split_period("2000-01-01", "2000-01-01 00:00:01")
+
+
+def test_combine_waarnemingenlijst(fake_ddl, fake_location):
+    request = ddlpy.ddlpy._get_request_slice(fake_location, "2000-01-01", "2000-01-03")
+    _, result, _ = fake_ddl.ophalen_waarnemingen(request)
+    metingen = result["WaarnemingenLijst"][0]["MetingenLijst"]
+    metingen[1]["WaarnemingMetadata"]["Kwaliteitswaardecode"] = "99"
+
+    df = ddlpy.ddlpy._combine_waarnemingenlijst(result, fake_location)
+    expected = combine_waarnemingenlijst_json_normalize(result, fake_location)
+    pd.testing.assert_frame_equal(df, expected)
+    assert np.isnan(df["Meetwaarde.Waarde_Numeriek"].iloc[1])
+
+
+def _get_result_irregular(fake_ddl, location):
+    request = ddlpy.ddlpy._get_request_slice(location, "2000-01-01", "2000-01-02")
+    _, result, _ = fake_ddl.ophalen_waarnemingen(request)
+    waarneming = result["WaarnemingenLijst"][0]
+    # a second waarneming with other metadata and metingen with different keys
+    metingen = [dict(meting) for meting in waarneming["MetingenLijst"][:3]]
+    metingen[0]["WaarnemingMetadata"] = {"Statuswaarde": "Ongecontroleerd"}
+    metingen[1]["Bemonsteringshoogte"] = -999
+    aquometadata = dict(waarneming["AquoMetadata"])
+    aquometadata["Parameter"] = {"Code": "NVT"}
+    aquometadata["BioTaxon_Compartiment"] = None
+    aquometadata["Opmerkingen"] = ["a", "b"]
+    result["WaarnemingenLijst"] += [
+        {"MetingenLijst": metingen, "AquoMetadata": aquometadata},
+        {"MetingenLijst": [], "AquoMetadata": aquometadata},
+    ]
+    return result
+
+
+def test_combine_waarnemingenlijst_irregular(fake_ddl, fake_location):
+    result = _get_result_irregular(fake_ddl, fake_location)
+
+    df = ddlpy.ddlpy._combine_waarnemingenlijst(result, fake_location)
+    expected = combine_waarnemingenlijst_json_normalize(result, fake_location)
+    pd.testing.assert_frame_equal(df, expected)
+    assert "Parameter.Code" in df.columns
+
+
+@pytest.mark.parametrize("batch_size", [1, 10000])
+def test_iter_waarnemingen_stream(fake_ddl, fake_location, batch_size):
+    result = _get_result_irregular(fake_ddl, fake_location)
+    stream = io.BytesIO(json.dumps(result).encode())
+
+    dfs = ddlpy.ddlpy._iter_waarnemingen_stream(stream, batch_size=batch_size)
+    df = ddlpy.ddlpy._combine_dataframes(list(dfs), fake_location)
+    expected = ddlpy.ddlpy._combine_waarnemingenlijst(result, fake_location)
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_measurements_stream(fake_ddl, fake_location):
+    start_date, end_date = "2000-01-01", "2000-03-01"
+    measurements = ddlpy.measurements(fake_location, start_date, end_date)
+    measurements_stream = ddlpy.measurements(
+        fake_location, start_date, end_date, stream=True
+    )
+    pd.testing.assert_frame_equal(measurements_stream, measurements)
+
+    # errors are raised like without streaming
+    fake_ddl.limit = 1000
+    with pytest.raises(ddlpy.ddlpy.ObservationLimitError):
+        ddlpy.ddlpy._measurements_slice(
+            fake_location, start_date, end_date, stream=True
+        )
+
+
+def test_measurements_categorical(fake_ddl, fake_location):
+    start_date, end_date = "2000-01-01", "2000-04-01"
+    measurements = ddlpy.measurements(fake_location, start_date, end_date)
+    measurements_cat = ddlpy.measurements(
+        fake_location, start_date, end_date, categorical=True
+    )
+    assert measurements_cat["Grootheid.Code"].dtype == "category"
+    assert measurements_cat["Meetwaarde.Waarde_Numeriek"].dtype == np.float64
+    pd.testing.assert_frame_equal(
+        measurements_cat, measurements, check_dtype=False, check_categorical=False
+    )
+
+    memory = measurements.memory_usage(deep=True).sum()
+    memory_cat = measurements_cat.memory_usage(deep=True).sum()
+    assert memory_cat < 0.2 * memory
+
+    simple = ddlpy.simplify_dataframe(measurements)
+    simple_cat = ddlpy.simplify_dataframe(measurements_cat)
+    assert simple_cat.attrs == simple.attrs
+    assert simple_cat.columns.equals(simple.columns)
+
+    ds = ddlpy.dataframe_to_xarray(measurements, always_preserve=["Grootheid.Code"])
+    ds_cat = ddlpy.dataframe_to_xarray(
+        measurements_cat, always_preserve=["Grootheid.Code"]
+    )
+    xr.testing.assert_identical(ds_cat, ds)
+    assert ds_cat["Grootheid.Code"].dtype == ds["Grootheid.Code"].dtype
+
+
+def test_measurements_latest_batched(fake_ddl, fake_locations, standin_server):
+    latest = ddlpy.measurements_latest(fake_locations, batch_size=2)
+    # one request for vlissingen and two for the other locations with WATHTE
+    assert len(standin_server.requests) == 3
+    assert len(latest) == 4
+    assert set(latest["Code"]) == set(fake_locations.index)
+    grootheid = latest.set_index("Code")["Grootheid.Code"].sort_index()
+    expected = fake_locations["Grootheid.Code"].sort_index()
+    assert grootheid.to_dict() == expected.to_dict()
+
+    latest_single = ddlpy.measurements_latest(fake_locations.iloc[0])
+    pd.testing.assert_frame_equal(latest.iloc[:1], latest_single)
+
+
+def test_measurements_available_batched(fake_ddl, fake_locations, standin_server):
+    fake_ddl.codes_without_data = {"hoekvanholland", "delfzijl"}
+    available = ddlpy.measurements_available(
+        fake_locations, start_date="2000-01-01", end_date="2000-02-01"
+    )
+    expected = pd.Series(
+        [True, False, True, False], index=fake_locations.index, dtype=bool
+    )
+    pd.testing.assert_series_equal(available, expected)
+    # one request for the WATHTE batch and one for the WINDSHD batch
+    paths = [path for path, _ in standin_server.requests]
+    assert len(paths) == 2
+    assert all(path.endswith("/OphalenAantalWaarnemingen") for path in paths)
+
+    available = ddlpy.measurements_available(
+        fake_locations, start_date="2010-01-01", end_date="2010-02-01"
+    )
+    assert not available.any()
+
+
+def test_measurements_amount_batched(fake_ddl, fake_locations, standin_server):
+    fake_ddl.codes_without_data = {"hoekvanholland"}
+    df_amount = ddlpy.measurements_amount(
+        fake_locations,
+        start_date="2000-01-01",
+        end_date="2000-03-01",
+        period="Maand",
+        batch_size=2,
+    )
+    assert len(standin_server.requests) == 3
+    assert df_amount.index.equals(fake_locations.index)
+    assert df_amount.columns.tolist() == ["2000-01", "2000-02", "2000-03"]
+    assert (df_amount.loc["hoekvanholland"] == 0).all()
+
+    df_amount_single = ddlpy.measurements_amount(
+        fake_locations.iloc[0],
+        start_date="2000-01-01",
+        end_date="2000-03-01",
+        period="Maand",
+    )
+    assert (
+        df_amount.loc["denhelder.marsdiep"] == df_amount_single["AantalMetingen"]
+    ).all()
+
+
+def test_measurements_amount_batched_multipleblocks(
+    fake_ddl, fake_locations, monkeypatch
+):
+    ophalen_aantal_waarnemingen = fake_ddl.ophalen_aantal_waarnemingen
+
+    def ophalen_aantal_waarnemingen_blocks(request):
+        # a second block for denhelder, like a change of WaardeBepalingsmethode
+        status, response, headers = ophalen_aantal_waarnemingen(request)
+        per_periode = response["AantalWaarnemingenPerPeriodeLijst"]
+        for one in list(per_periode):
+            if one["Locatie"]["Code"] == "denhelder.marsdiep":
+                aantal_lijst = one["AantalMetingenPerPeriodeLijst"][1:]
+                block = dict(one, AantalMetingenPerPeriodeLijst=aantal_lijst)
+                per_periode.append(block)
+        return status, response, headers
+
+    monkeypatch.setattr(
+        fake_ddl, "ophalen_aantal_waarnemingen", ophalen_aantal_waarnemingen_blocks
+    )
+    kwargs = dict(start_date="2000-01-01", end_date="2000-03-01", period="Maand")
+    df_amount = ddlpy.measurements_amount(fake_locations, **kwargs)
+    df_amount_single = ddlpy.measurements_amount(fake_locations.iloc[0], **kwargs)
+    df_amount_other = ddlpy.measurements_amount(fake_locations.iloc[1], **kwargs)
+
+    amount = df_amount.loc["denhelder.marsdiep"]
+    assert (amount == df_amount_single["AantalMetingen"]).all()
+    amount_other = df_amount_other["AantalMetingen"]
+    assert amount["2000-01"] == amount_other["2000-01"]
+    assert (amount[["2000-02", "2000-03"]] == 2 * amount_other.iloc[1:]).all()
+
+
+def test_measurements_coalescer(fake_ddl, fake_location, standin_server, monkeypatch):
+    ophalen_waarnemingen = fake_ddl.ophalen_waarnemingen
+
+    def ophalen_waarnemingen_slow(request):
+        time.sleep(0.1)
+        return ophalen_waarnemingen(request)
+
+    monkeypatch.setattr(fake_ddl, "ophalen_waarnemingen", ophalen_waarnemingen_slow)
+    client = ddlpy.Client(coalescer=ddlpy.Coalescer())
+    results = []
+
+    def retrieve():
+        measurements = ddlpy.measurements(
+            fake_location, "2000-01-01", "2000-01-02", client=client
+        )
+        results.append(measurements)
+
+    threads = [threading.Thread(target=retrieve) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    retrieve()
+    assert len(results) == 5
+    paths = [path for path, _ in standin_server.requests]
+    assert len([x for x in paths if x.endswith("OphalenWaarnemingen")]) == 1
+    assert client.coalescer.stats["calls"] == 1
+    # every caller gets its own DataFrame
+    assert results[0] is not results[1]
+    pd.testing.assert_frame_equal(results[0], results[4])
+    client.close()
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_measurements_compressed(fake_ddl, fake_location, standin_server, stream):
+    expected = ddlpy.measurements(fake_location, "2000-01-01", "2000-01-08")
+    standin_server.compress = True
+    with ddlpy.Client() as client:
+        measurements = ddlpy.measurements(
+            fake_location, "2000-01-01", "2000-01-08", stream=stream, client=client
+        )
+    pd.testing.assert_frame_equal(measurements, expected)
+    assert client.stats["bytes_compressed"] < client.stats["bytes_decompressed"] / 5
+
+
+def _count_catalog_requests(standin_server):
+    paths = [path for path, _ in standin_server.requests]
+    return len([x for x in paths if x.endswith("OphalenCatalogus")])
+
+
+def test_locations_cache(fake_ddl, standin_server, monkeypatch):
+    locationsfile, _ = get_locationsfile_cache(catalog_filter=None)
+
+    locations = ddlpy.locations()
+    assert _count_catalog_requests(standin_server) == 1
+    assert os.path.exists(locationsfile)
+
+    # the processed DataFrame is loaded from the cache file
+    ddlpy.locations.cache_clear()
+    with patch("ddlpy.ddlpy._locations_from_catalog") as locations_from_catalog:
+        locations_cached = ddlpy.locations()
+    locations_from_catalog.assert_not_called()
+    pd.testing.assert_frame_equal(locations_cached, locations)
+    assert _count_catalog_requests(standin_server) == 1
+
+    # a cache of another version is recreated from the cached catalog
+    monkeypatch.setattr(ddlpy.ddlpy, "LOCATIONS_CACHE_VERSION", -1)
+    ddlpy.locations.cache_clear()
+    pd.testing.assert_frame_equal(ddlpy.locations(), locations)
+    assert _count_catalog_requests(standin_server) == 1
+
+    # the cache expires after 4 hours like the catalog
+    for cachefile in [locationsfile, get_catalogfile_cache(catalog_filter=None)[0]]:
+        mtime = os.path.getmtime(cachefile) - 5 * 3600
+        os.utime(cachefile, (mtime, mtime))
+    ddlpy.locations.cache_clear()
+    ddlpy.locations()
+    assert _count_catalog_requests(standin_server) == 2
+
+
+def test_locations_cache_catalog_filter(fake_ddl, standin_server, monkeypatch):
+    monkeypatch.setattr(ddlpy.ddlpy, "CATALOG_FILTER_CACHE_MAXSIZE", 2)
+    ddlpy.locations(catalog_filter=["Eenheden", "Grootheden"])
+    # the order of the catalog_filter does not matter
+    ddlpy.locations(catalog_filter=["Grootheden", "Eenheden"])
+    assert _count_catalog_requests(standin_server) == 1
+    catalogfile, use_cache = get_catalogfile_cache(["Eenheden", "Grootheden"])
+    assert use_cache
+    assert catalogfile != get_catalogfile_cache(catalog_filter=None)[0]
+
+    # the oldest catalog is removed
+    mtime = os.path.getmtime(catalogfile) - 60
+    os.utime(catalogfile, (mtime, mtime))
+    ddlpy.locations(catalog_filter=["Grootheden"])
+    ddlpy.locations(catalog_filter=["Eenheden"])
+    assert _count_catalog_requests(standin_server) == 3
+    assert not os.path.exists(catalogfile)
+    assert not os.path.exists(get_locationsfile_cache(["Eenheden", "Grootheden"])[0])
+    assert not os.path.exists(f"{catalogfile}.lock")
+    assert get_catalogfile_cache(["Grootheden"])[1]
+
+    # the default catalog is not removed
+    ddlpy.locations()
+    ddlpy.locations(catalog_filter=["Hoedanigheden"])
+    assert get_catalogfile_cache(catalog_filter=None)[1]
+
+    # a separate maximum age for other catalog filters
+    monkeypatch.setattr(ddlpy.ddlpy, "CATALOG_FILTER_CACHE_HOURS", 0)
+    assert not get_catalogfile_cache(["Hoedanigheden"])[1]
+    assert get_catalogfile_cache(catalog_filter=None)[1]
+
+
+def test_evict_catalogfiles_removed(fake_ddl, monkeypatch):
+    monkeypatch.setattr(ddlpy.ddlpy, "CATALOG_FILTER_CACHE_MAXSIZE", 0)
+    ddlpy.locations(catalog_filter=["Grootheden"])
+    catalogfile, _ = get_catalogfile_cache(["Eenheden"])
+    glob_ = ddlpy.ddlpy.glob.glob
+
+    def glob_removed(pattern):
+        # another process removes the catalog after globbing
+        return glob_(pattern) + [catalogfile]
+
+    monkeypatch.setattr(ddlpy.ddlpy.glob, "glob", glob_removed)
+    ddlpy.ddlpy._evict_catalogfiles()
+    assert not get_catalogfile_cache(["Grootheden"])[1]
+
+
+def test_locations_cache_stampede(fake_ddl, standin_server, monkeypatch):
+    ophalen_catalogus = fake_ddl.ophalen_catalogus
+
+    def ophalen_catalogus_slow(request):
+        time.sleep(0.2)
+        return ophalen_catalogus(request)
+
+    monkeypatch.setattr(fake_ddl, "ophalen_catalogus", ophalen_catalogus_slow)
+    # the threads use separate file locks, like separate processes
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(ddlpy.locations()))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 4
+    assert _count_catalog_requests(standin_server) == 1
+    catalogfile, _ = get_catalogfile_cache(catalog_filter=None)
+    cachedir = os.path.dirname(catalogfile)
+    assert not [x for x in os.listdir(cachedir) if x.endswith(".tmp")]
+
+
+def test_locations_cache_stale_while_revalidate(fake_ddl, standin_server):
+    locations = ddlpy.locations()
+    catalogfile, _ = get_catalogfile_cache(catalog_filter=None)
+    locationsfile, _ = get_locationsfile_cache(catalog_filter=None)
+    for cachefile in [catalogfile, locationsfile]:
+        mtime = os.path.getmtime(cachefile) - 5 * 3600
+        os.utime(cachefile, (mtime, mtime))
+    ddlpy.locations.cache_clear()
+
+    # another process is retrieving the catalog
+    with FileLock(f"{catalogfile}.lock"):
+        locations_stale = ddlpy.locations(stale_while_revalidate=True)
+    pd.testing.assert_frame_equal(locations_stale, locations)
+    assert _count_catalog_requests(standin_server) == 1
+    # the stale catalog does not become fresh by using it
+    assert not get_locationsfile_cache(catalog_filter=None)[1]
+
+    ddlpy.locations(stale_while_revalidate=True)
+    assert _count_catalog_requests(standin_server) == 2
+    assert get_catalogfile_cache(catalog_filter=None)[1]
+
+
+def test_locations_memo(fake_ddl, standin_server, monkeypatch):
+    locations = ddlpy.locations()
+    with patch("ddlpy.ddlpy._load_locationsfile") as load_locationsfile:
+        locations_memo = ddlpy.locations()
+    load_locationsfile.assert_not_called()
+    pd.testing.assert_frame_equal(locations_memo, locations)
+    assert ddlpy.locations.cache_info() == (1, 1, 1)
+
+    # modifying the returned DataFrame does not modify the cached one
+    locations_memo.loc[:, "Naam"] = "modified"
+    assert (ddlpy.locations()["Naam"] != "modified").all()
+
+    # the catalog filters are cached separately
+    ddlpy.locations(catalog_filter=["Grootheden"])
+    assert ddlpy.locations.cache_info().currsize == 2
+
+    # the DataFrames expire with the catalog
+    monkeypatch.setattr(ddlpy.ddlpy, "CATALOG_CACHE_HOURS", 0)
+    ddlpy.locations()
+    assert _count_catalog_requests(standin_server) == 3
+    ddlpy.locations.cache_clear()
+    assert ddlpy.locations.cache_info() == (0, 0, 0)
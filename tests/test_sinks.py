@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `ddlpy.sinks` module."""
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+import pytest
+import ddlpy
+from ddlpy.sinks import _get_partition_dir
+
+
+def test_to_parquet(fake_ddl, fake_locations, tmp_path):
+    root = str(tmp_path / "dataset")
+    locations = fake_locations.iloc[1:3]
+    start_date, end_date = "2000-11-01", "2001-02-01"
+    paths = ddlpy.to_parquet(locations, start_date, end_date, root=root)
+    # two months in 2000 and the last timestep in 2001 for both locations
+    assert len(paths) == 6
+    partitions = sorted(set(os.path.relpath(os.path.dirname(x), root) for x in paths))
+    assert partitions == [
+        os.path.join("station=hoekvanholland", "grootheid=WATHTE", "year=2000"),
+        os.path.join("station=hoekvanholland", "grootheid=WATHTE", "year=2001"),
+        os.path.join("station=vlissingen", "grootheid=WINDSHD", "year=2000"),
+        os.path.join("station=vlissingen", "grootheid=WINDSHD", "year=2001"),
+    ]
+
+    # constant metadata is stored in the file metadata
+    df_file = pd.read_parquet(paths[0])
+    assert df_file.attrs["Grootheid.Code"] == "WATHTE"
+    assert df_file.attrs["Code"] == "hoekvanholland"
+    assert "Grootheid.Code" not in df_file.columns
+    assert "Meetwaarde.Waarde_Numeriek" in df_file.columns
+
+    # the partitions are added as columns when reading the dataset
+    dataset = pd.read_parquet(root)
+    expected = ddlpy.measurements(locations.iloc[0], start_date, end_date)
+    dataset_station = dataset.loc[dataset["station"] == "hoekvanholland"]
+    assert len(dataset_station) == len(expected)
+    assert set(dataset["grootheid"]) == {"WATHTE", "WINDSHD"}
+    pd.testing.assert_series_equal(
+        dataset_station["Meetwaarde.Waarde_Numeriek"].sort_index(),
+        expected["Meetwaarde.Waarde_Numeriek"],
+    )
+
+    # writing again replaces the same files
+    paths_again = ddlpy.to_parquet(locations, start_date, end_date, root=root)
+    assert paths_again == paths
+    nfiles = sum(len(files) for _, _, files in os.walk(root))
+    assert nfiles == len(paths)
+
+
+def test_get_partition_dir(fake_location):
+    location = fake_location.copy()
+    location.name = "a/b c"
+    partition_dir = _get_partition_dir("root", location, 2000)
+    assert partition_dir == os.path.join(
+        "root", "station=a%2Fb%20c", "grootheid=WATHTE", "year=2000"
+    )
+
+
+def _patch_aquometadata(fake_ddl, monkeypatch, since=None, half=False, **kwargs):
+    """
+    respond with other AquoMetadata, for the metingen from `since`, for the second half
+    of the metingen or for all metingen
+    """
+    ophalen_waarnemingen = fake_ddl.ophalen_waarnemingen
+
+    def ophalen_waarnemingen_patched(request):
+        status, response, headers = ophalen_waarnemingen(request)
+        if status == 200:
+            waarneming = response["WaarnemingenLijst"][0]
+            aquometadata = dict(waarneming["AquoMetadata"], **kwargs)
+            metingen = waarneming["MetingenLijst"]
+            if since is not None:
+                times = pd.to_datetime([x["Tijdstip"] for x in metingen])
+                ifirst = int((times < pd.Timestamp(since, tz="UTC")).sum())
+            else:
+                ifirst = len(metingen) // 2 if half else 0
+            waarnemingen = [
+                dict(waarneming, MetingenLijst=metingen[:ifirst]),
+                dict(
+                    waarneming,
+                    MetingenLijst=metingen[ifirst:],
+                    AquoMetadata=aquometadata,
+                ),
+            ]
+            response["WaarnemingenLijst"] = [
+                x for x in waarnemingen if x["MetingenLijst"]
+            ]
+        return status, response, headers
+
+    monkeypatch.setattr(fake_ddl, "ophalen_waarnemingen", ophalen_waarnemingen_patched)
+
+
+WINDSHD = {"Code": "WINDSHD", "Omschrijving": "Windsnelheid"}
+
+
+def test_to_zarr(fake_ddl, fake_location, tmp_path, monkeypatch):
+    store = str(tmp_path / "denhelder.zarr")
+    nappended = ddlpy.to_zarr(
+        fake_location,
+        "2000-01-01",
+        "2000-03-01",
+        store=store,
+        always_preserve=["Grootheid.Code"],
+        time_chunksize=1000,
+    )
+    expected = ddlpy.measurements(fake_location, "2000-01-01", "2000-03-01")
+    assert nappended == len(expected)
+
+    # the overlap with the stored period is skipped
+    _patch_aquometadata(fake_ddl, monkeypatch, Grootheid=WINDSHD)
+    nappended = ddlpy.to_zarr(fake_location, "2000-02-01", "2000-04-01", store=store)
+    assert nappended == 31 * 144
+
+    with xr.open_zarr(store, consolidated=False) as ds:
+        assert ds.sizes["time"] == len(expected) + 31 * 144
+        assert ds["time"].to_index().is_unique
+        assert ds["Meetwaarde.Waarde_Numeriek"].encoding["chunks"] == (1000,)
+        # the codes of both periods are merged
+        assert ds["Grootheid.Code"].attrs == {
+            "WATHTE": "Waterhoogte",
+            "WINDSHD": "Windsnelheid",
+        }
+        assert ds.attrs["Code"] == "denhelder.marsdiep"
+        values = ds["Meetwaarde.Waarde_Numeriek"].isel(time=slice(None, len(expected)))
+        np.testing.assert_array_equal(
+            values.values, expected["Meetwaarde.Waarde_Numeriek"].values
+        )
+
+
+def test_to_zarr_new_variable(fake_ddl, fake_location, tmp_path, monkeypatch):
+    store = str(tmp_path / "denhelder.zarr")
+    ddlpy.to_zarr(fake_location, "2000-01-01", "2000-02-01", store=store)
+    _patch_aquometadata(
+        fake_ddl, monkeypatch, half=True, Parameter_Wat_Omschrijving="other"
+    )
+    with pytest.raises(ValueError) as e:
+        ddlpy.to_zarr(fake_location, "2000-01-01", "2000-03-01", store=store)
+    assert "add them to always_preserve" in str(e.value)
+
+
+def _patch_metadata(fake_ddl, monkeypatch, start, end, **kwargs):
+    """add WaarnemingMetadata to the metingen from start until end"""
+    metingen = fake_ddl.metingen
+    start, end = pd.Timestamp(start, tz="UTC"), pd.Timestamp(end, tz="UTC")
+
+    def metingen_patched(times):
+        metingen_list = metingen(times)
+        for meting, time in zip(metingen_list, times):
+            if start <= time < end:
+                meting["WaarnemingMetadata"].update(kwargs)
+        return metingen_list
+
+    monkeypatch.setattr(fake_ddl, "metingen", metingen_patched)
+
+
+def test_to_zarr_missing_variable(fake_ddl, fake_location, tmp_path, monkeypatch):
+    # the stored variable is missing in the February chunk
+    store = str(tmp_path / "denhelder.zarr")
+    _patch_metadata(
+        fake_ddl, monkeypatch, "2000-01-01", "2000-01-15", Bemonsteringshoogte="-999"
+    )
+    nappended = ddlpy.to_zarr(fake_location, "2000-01-01", "2000-03-01", store=store)
+    with xr.open_zarr(store, consolidated=False) as ds:
+        assert ds.sizes["time"] == nappended
+        values = ds["WaarnemingMetadata.Bemonsteringshoogte"].to_series()
+    assert (values.loc[:"2000-01-14 23:50"] == "-999").all()
+    # missing in the January chunk and in the February chunk
+    assert (values.loc["2000-01-15 00:00":] == "").all()
+
+
+def test_to_zarr_added_variable(fake_ddl, fake_location, tmp_path, monkeypatch):
+    # the variable is new in the February chunk
+    store = str(tmp_path / "denhelder.zarr")
+    _patch_metadata(
+        fake_ddl, monkeypatch, "2000-02-15", "2000-03-01", Bemonsteringshoogte="-999"
+    )
+    nappended = ddlpy.to_zarr(fake_location, "2000-01-01", "2000-03-01", store=store)
+    with xr.open_zarr(store, consolidated=False) as ds:
+        assert ds.sizes["time"] == nappended
+        values = ds["WaarnemingMetadata.Bemonsteringshoogte"].to_series()
+        numeric = ds["Meetwaarde.Waarde_Numeriek"].to_series()
+    assert (values.loc[:"2000-02-14 23:50"] == "").all()
+    assert (values.loc["2000-02-15 00:00":"2000-02-29 23:50"] == "-999").all()
+    expected = ddlpy.measurements(fake_location, "2000-01-01", "2000-03-01")
+    np.testing.assert_array_equal(
+        numeric.values, expected["Meetwaarde.Waarde_Numeriek"].values
+    )
+
+
+def test_to_zarr_changed_attribute(fake_ddl, fake_location, tmp_path, monkeypatch):
+    store = str(tmp_path / "denhelder.zarr")
+    # the first timestep of February is also in the January chunk
+    _patch_aquometadata(
+        fake_ddl,
+        monkeypatch,
+        since="2000-02-01 00:10",
+        Parameter_Wat_Omschrijving="other",
+    )
+    with pytest.raises(ValueError) as e:
+        ddlpy.to_zarr(fake_location, "2000-01-01", "2000-03-01", store=store)
+    assert "['Parameter_Wat_Omschrijving'] in the period from" in str(e.value)
+
+
+def test_to_zarr_changed_code(fake_ddl, fake_location, tmp_path, monkeypatch):
+    # the instrument is replaced in February
+    store = str(tmp_path / "denhelder.zarr")
+    meetapparaat = {"Code": "999", "Omschrijving": "other"}
+    _patch_aquometadata(
+        fake_ddl, monkeypatch, since="2000-02-01", MeetApparaat=meetapparaat
+    )
+    nappended = ddlpy.to_zarr(fake_location, "2000-01-01", "2000-03-01", store=store)
+    with xr.open_zarr(store, consolidated=False) as ds:
+        codes = ds["MeetApparaat.Code"].to_series()
+        assert "MeetApparaat.Code" not in ds.attrs
+        assert ds["MeetApparaat.Code"].attrs == {
+            "10272": "other:Vlotterniveaumeter",
+            "999": "other",
+        }
+    assert len(codes) == nappended
+    assert (codes.loc[:"2000-01-31 23:50"] == "10272").all()
+    assert (codes.loc["2000-02-01 00:00":] == "999").all()
+
+
+def test_to_parquet_overlap(fake_ddl, fake_location, tmp_path):
+    root = str(tmp_path / "dataset")
+    paths = ddlpy.to_parquet(fake_location, "2000-01-01", "2000-03-01", root=root)
+    # one file per month in UTC, the last timestep is in March
+    assert [os.path.basename(x)[-15:] for x in paths] == [
+        "-200001.parquet",
+        "-200002.parquet",
+        "-200003.parquet",
+    ]
+    ddlpy.to_parquet(fake_location, "2000-02-01", "2000-04-01", root=root)
+    dataset = pd.read_parquet(root).sort_index()
+    expected = ddlpy.measurements(fake_location, "2000-01-01", "2000-04-01")
+    assert len(dataset) == len(expected)
+    assert dataset.index.is_unique
+    pd.testing.assert_series_equal(
+        dataset["Meetwaarde.Waarde_Numeriek"], expected["Meetwaarde.Waarde_Numeriek"]
+    )
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `ddlpy.store` module."""
+import os
+import numpy as np
+import pandas as pd
+import xarray as xr
+import pytest
+import ddlpy
+
+
+def _count_waarnemingen_requests(standin_server):
+    return sum(
+        path.endswith("/OphalenWaarnemingen") for path, _ in standin_server.requests
+    )
+
+
+def test_sync_parquet(fake_ddl, fake_location, standin_server, tmp_path):
+    store = str(tmp_path / "denhelder.parquet")
+    with pytest.raises(ValueError) as e:
+        ddlpy.sync(fake_location, store)
+    assert "supply start_date" in str(e.value)
+
+    new = ddlpy.sync(
+        fake_location, store, start_date="2000-01-01", end_date="2000-02-01"
+    )
+    assert new.index[-1] == pd.Timestamp("2000-02-01", tz="UTC")
+    # the last day is retrieved again
+    new = ddlpy.sync(fake_location, store, end_date="2000-03-01")
+    assert new.index[0] == pd.Timestamp("2000-02-01 00:10", tz="UTC")
+
+    stored = ddlpy.store._read_store(store)
+    expected = ddlpy.measurements(fake_location, "2000-01-01", "2000-03-01")
+    pd.testing.assert_frame_equal(stored, expected, check_like=True)
+
+    # only the files of the retrieved months are rewritten
+    paths = ddlpy.store._get_parquet_paths(store, fake_location)
+    assert len(paths) == 3
+    # a rewritten file is replaced by a new file
+    inodes = [os.stat(path).st_ino for path in paths]
+    ddlpy.sync(fake_location, store, end_date="2000-03-15")
+    assert os.stat(paths[0]).st_ino == inodes[0]
+    assert os.stat(paths[-1]).st_ino != inodes[-1]
+    stored = ddlpy.store._read_store(store)
+    expected = ddlpy.measurements(fake_location, "2000-01-01", "2000-03-15")
+    pd.testing.assert_frame_equal(stored, expected, check_like=True)
+
+    # nothing new, so only measurements_latest is requested
+    fake_ddl.times = fake_ddl.times[fake_ddl.times <= "2000-03-15"]
+    nrequests = _count_waarnemingen_requests(standin_server)
+    new = ddlpy.sync(fake_location, store, end_date="2000-04-01")
+    assert new.empty
+    assert _count_waarnemingen_requests(standin_server) == nrequests
+
+
+def test_sync_netcdf(fake_ddl, fake_location, tmp_path):
+    store = str(tmp_path / "denhelder.nc")
+    ddlpy.sync(fake_location, store, start_date="2000-01-01", end_date="2000-01-15")
+    ddlpy.sync(fake_location, store, end_date="2000-02-01")
+
+    expected = ddlpy.measurements(fake_location, "2000-01-01", "2000-02-01")
+    ds_expected = ddlpy.dataframe_to_xarray(expected)
+    stored = ddlpy.store._read_store(store)
+    np.testing.assert_allclose(
+        stored["Meetwaarde.Waarde_Numeriek"], expected["Meetwaarde.Waarde_Numeriek"]
+    )
+    assert (stored.index == expected.index).all()
+    assert set(stored.columns) == set(expected.columns)
+
+    with xr.open_dataset(store) as ds:
+        xr.testing.assert_identical(ds, ds_expected)
+
+
+def test_sync_zarr(fake_ddl, fake_location, tmp_path):
+    store = str(tmp_path / "denhelder.zarr")
+    ddlpy.sync(fake_location, store, start_date="2000-01-01", end_date="2000-01-15")
+    new = ddlpy.sync(fake_location, store, end_date="2000-02-01")
+    # the stored measurements are not retrieved again
+    assert new.index[0] == pd.Timestamp("2000-01-15 00:10", tz="UTC")
+
+    expected = ddlpy.measurements(fake_location, "2000-01-01", "2000-02-01")
+    stored = ddlpy.store._read_store(store)
+    np.testing.assert_allclose(
+        stored["Meetwaarde.Waarde_Numeriek"], expected["Meetwaarde.Waarde_Numeriek"]
+    )
+    assert (stored.index == expected.index).all()
+    assert set(stored.columns) == set(expected.columns)
+
+
+def test_sync_unsupported_store(fake_location):
+    with pytest.raises(ValueError) as e:
+        ddlpy.sync(fake_location, "denhelder.csv", start_date="2000-01-01")
+    assert "unsupported store" in str(e.value)
@@ -3,7 +3,7 @@
 
 """Tests for `utils` package."""
 
-from ddlpy.utils import date_series
+from ddlpy.utils import date_series, date_series_packed
 import datetime
 
 
@@ -30,3 +30,22 @@ def test_date_series():
         (datetime.datetime(2018, 2, 15, 0, 0), datetime.datetime(2018, 3, 5, 0, 0)),
     ]
     assert result == expected
+
+
+def test_date_series_packed():
+    dates = [datetime.datetime(2018, month, 1) for month in range(1, 8)]
+    amounts = [10, 0, 50, 30, 200, 5]
+    periods = list(zip(dates[:-1], dates[1:], amounts))
+    result = date_series_packed(periods, limit=100)
+    # the period with an amount above the limit is returned on its own
+    expected = [
+        (dates[0], dates[4]),
+        (dates[4], dates[5]),
+        (dates[5], dates[6]),
+    ]
+    assert result == expected
+
+    result = date_series_packed(periods, limit=1000)
+    assert result == [(dates[0], dates[-1])]
+
+    assert date_series_packed([], limit=100) == []